@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Runs the benchmark suite.
+
+    python -m benchmarks                                # print results
+    python -m benchmarks --save baseline.json           # save results as the baseline
+    python -m benchmarks --compare baseline.json        # fail on regressions against the baseline
+"""
+
+import argparse
+import json
+import platform
+import sys
+
+from . import suite
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if base[metric] and result[metric] / base[metric] > threshold:
+                ratio = result[metric] / base[metric]
+                regressions.append(f"{name}: {metric} x{ratio:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "-k", dest="select", default="", help="run cases containing the string"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="PATH", help="save results as JSON baseline")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare results to JSON baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.3,
+        help="max allowed ratio to the baseline, %(default)s by default",
+    )
+    args = parser.parse_args(argv)
+
+    results = suite.run(repeat=args.repeat, select=args.select)
+
+    print(f"{'case':45} {'ms':>10} {'peak MiB':>10}")
+    for name, result in results.items():
+        peak = result["peak_bytes"] / 2**20
+        print(f"{name:45} {result['seconds'] * 1000:10.2f} {peak:10.2f}")
+
+    if args.save:
+        document = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
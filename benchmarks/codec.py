@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Compares JSON codecs on hook payloads.
+
+    python -m benchmarks.codec
+"""
+
+import json
+import timeit
+
+from deckhouse import codec
+
+from . import payloads
+
+
+def _previous_dumps(obj):
+    # what FileStorage used before the codec
+    return json.dumps(obj)
+
+
+ENCODERS = {
+    "json (default separators)": _previous_dumps,
+    "json (compact)": codec.stdlib_dumps,
+}
+DECODERS = {"json": codec.stdlib_loads}
+if codec.orjson is not None:
+    ENCODERS["orjson"] = codec.dumps
+    DECODERS["orjson"] = codec.loads
+
+
+def bench(number=5):
+    results = []
+
+    cases = {
+        "kube operations x5000": payloads.kube_operations(5000),
+        "metrics x20000": payloads.metrics(20000),
+    }
+    for case, data in cases.items():
+        for name, dumps in ENCODERS.items():
+            seconds = min(
+                timeit.repeat(lambda: [dumps(p) for p in data], number=1, repeat=number)
+            )
+            size = sum(len(dumps(p).encode("utf-8")) + 1 for p in data)
+            results.append(("dumps", case, name, seconds, size))
+
+    document = json.dumps(payloads.values(width=12, depth=4)).encode("utf-8")
+    for name, loads in DECODERS.items():
+        seconds = min(timeit.repeat(lambda: loads(document), number=1, repeat=number))
+        results.append(("loads", "values 12x4", name, seconds, len(document)))
+
+    return results
+
+
+def main():
+    print(f"{'':6} {'case':24} {'codec':28} {'ms':>9} {'bytes':>11}")
+    for op, case, name, seconds, size in bench():
+        print(f"{op:6} {case:24} {name:28} {seconds * 1000:9.1f} {size:11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Reports the import cost of library modules, like `python -X importtime` but sorted and summed up.
+
+    python -m benchmarks.importtime                     # deckhouse.hook
+    python -m benchmarks.importtime deckhouse.hook deckhouse.tests --top 10
+
+Every module set is imported in a fresh interpreter, so the numbers include everything the import
+pulls in except the interpreter startup itself.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# the last module imported by the interpreter before any user code
+_STARTUP_MODULE = "site"
+
+
+def measure(modules: list) -> list:
+    """
+    Imports the modules in a subprocess and collects the timings.
+
+    :param modules: module names to import
+    :return: list of (module, self_us, cumulative_us, depth) in import order
+    """
+    code = "".join(f"import {m}\n" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse(proc.stderr)
+
+
+def parse(output: str) -> list:
+    """Parses the `-X importtime` output, see `measure`."""
+    entries = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        depth = len(indent) // 2
+        if depth == 0 and module == _STARTUP_MODULE:
+            # everything before is the interpreter startup
+            entries.clear()
+            continue
+        entries.append((module, int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def report(entries: list, top: int = 15) -> str:
+    total = sum(e[2] for e in entries if e[3] == 0)
+    lines = [f"{'module':<40} {'self ms':>9} {'cumul ms':>9}"]
+    for module, self_us, cumulative_us, _ in sorted(
+        entries, key=lambda e: e[2], reverse=True
+    )[:top]:
+        lines.append(
+            f"{module:<40} {self_us / 1000:>9.2f} {cumulative_us / 1000:>9.2f}"
+        )
+    lines.append(f"{'total':<40} {'':>9} {total / 1000:>9.2f}")
+    lines.append(f"{len(entries)} modules imported")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.importtime")
+    parser.add_argument("modules", nargs="*", default=["deckhouse.hook"])
+    parser.add_argument("--top", type=int, default=15, help="modules to show")
+    args = parser.parse_args()
+
+    print(report(measure(args.modules), args.top))
+
+
+if __name__ == "__main__":
+    main()
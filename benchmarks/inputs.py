@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Compares the peak memory of reading hook inputs from memory-mapped files with reading them into
+memory, as the library did before.
+
+    python -m benchmarks.inputs
+    python -m benchmarks.inputs --contexts 10 --objects 3000
+
+Mapped pages are not Python allocations, tracemalloc does not see them, so every case runs in a
+fresh interpreter and its peak resident set size (ru_maxrss) is measured. Cases run with orjson,
+if it is installed, and with the standard library json.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_mmap(path):
+    from deckhouse import module
+
+    return module.load_json_file(path)
+
+
+def _load_read(path):
+    # what module.read_json_file did before mapping files
+    from deckhouse import codec
+
+    with open(path, "rb") as f:
+        return codec.load(f)
+
+
+def _iterate_mmap(path):
+    from deckhouse import module
+
+    for _ in module.iter_json_file(path):
+        pass
+
+
+def _iterate_read(path):
+    # what module.get_binding_context did before mapping files
+    from deckhouse import module
+
+    with open(path, "r", encoding="utf-8") as f:
+        for _ in module.iter_json_array(f):
+            pass
+
+
+LOADERS = {
+    "load/mmap": _load_mmap,
+    "load/read": _load_read,
+    "iterate/mmap": _iterate_mmap,
+    "iterate/read": _iterate_read,
+}
+
+
+def backends() -> list:
+    try:
+        import orjson  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        return ["json"]
+    return ["orjson", "json"]
+
+
+def measure(path: str, loader: str, backend: str) -> dict:
+    """
+    Runs the loader on the file in a subprocess.
+
+    :param path: the input file
+    :param loader: the name in LOADERS
+    :param backend: "orjson" or "json"
+    :return: {"seconds": ..., "baseline_bytes": peak RSS before loading, "peak_bytes": ...}
+    """
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.inputs", "--child", loader, backend, path],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=_ROOT,
+        env={**os.environ, "PYTHONPATH": _ROOT},
+    )
+    return json.loads(proc.stdout)
+
+
+def _max_rss() -> int:
+    import resource  # pylint: disable=import-outside-toplevel
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _child(loader: str, backend: str, path: str):
+    if backend == "json":
+        # the codec falls back to json
+        sys.modules["orjson"] = None
+    from deckhouse import codec, module  # noqa: F401 pylint: disable=unused-import
+
+    load = LOADERS[loader]
+    baseline = _max_rss()
+    start = time.perf_counter()
+    result = load(path)
+    seconds = time.perf_counter() - start
+    peak = _max_rss()
+    del result
+    print(
+        json.dumps(
+            {
+                "backend": codec.BACKEND,
+                "seconds": seconds,
+                "baseline_bytes": baseline,
+                "peak_bytes": peak,
+            }
+        )
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.inputs")
+    parser.add_argument("--contexts", type=int, default=10)
+    parser.add_argument("--objects", type=int, default=1000, help="per snapshot")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(*args.child)
+        return
+
+    from . import payloads
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "binding_context.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payloads.binding_contexts(args.contexts, args.objects), f)
+        size = os.path.getsize(path)
+
+        print(f"input file {size / 2**20:.2f} MiB")
+        print(
+            f"{'case':16} {'codec':8} {'ms':>9} {'peak RSS MiB':>13} {'+load MiB':>10}"
+        )
+        for backend in backends():
+            for loader in LOADERS:
+                result = measure(path, loader, backend)
+                peak = result["peak_bytes"] / 2**20
+                added = (result["peak_bytes"] - result["baseline_bytes"]) / 2**20
+                print(
+                    f"{loader:16} {backend:8} {result['seconds'] * 1000:9.1f} "
+                    f"{peak:13.2f} {added:10.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
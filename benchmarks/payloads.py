@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Synthetic payloads resembling what hooks read and write.
+"""
+
+
+def pod(i: int) -> dict:
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "name": f"app-{i}-7d9f8c6b5-x2x{i % 97}",
+            "namespace": f"ns-{i % 20}",
+            "labels": {"app": f"app-{i % 50}", "tier": "backend", "release": "stable"},
+            "annotations": {"checksum/config": "a" * 64, "описание": "сервис"},
+            "ownerReferences": [
+                {
+                    "apiVersion": "apps/v1",
+                    "kind": "ReplicaSet",
+                    "name": f"app-{i}-7d9f8c6b5",
+                }
+            ],
+        },
+        "spec": {
+            "nodeName": f"node-{i % 30}",
+            "containers": [
+                {
+                    "name": "app",
+                    "image": "registry.example.com/app:1.2.3",
+                    "resources": {"requests": {"cpu": "100m", "memory": "128Mi"}},
+                    "env": [{"name": f"VAR_{k}", "value": str(k)} for k in range(5)],
+                }
+            ],
+        },
+        "status": {"phase": "Running", "podIP": f"10.0.{i // 250}.{i % 250}"},
+    }
+
+
+def kube_operations(n: int) -> list:
+    return [{"operation": "CreateOrUpdate", "object": pod(i)} for i in range(n)]
+
+
+def metrics(n: int) -> list:
+    return [
+        {
+            "name": "d8_pod_restarts",
+            "group": "pods",
+            "action": "set",
+            "value": i % 7,
+            "labels": {
+                "namespace": f"ns-{i % 20}",
+                "pod": f"app-{i}",
+                "node": f"node-{i % 30}",
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def values(width: int, depth: int) -> dict:
+    """Values tree with `width` keys on every level and `depth` levels of nesting."""
+    if depth == 0:
+        return {f"key{i}": f"value-{i}" for i in range(width)}
+    tree = {f"node{i}": values(width, depth - 1) for i in range(width)}
+    tree["list"] = [f"10.0.0.{i}" for i in range(width)]
+    return tree
+
+
+def binding_contexts(n: int, m: int) -> list:
+    """`n` Event binding contexts with the snapshot of `m` pods each."""
+    snapshot = [
+        {"object": pod(i), "filterResult": {"node": f"node-{i % 30}"}} for i in range(m)
+    ]
+    return [
+        {
+            "binding": "pods",
+            "type": "Event",
+            "watchEvent": "Modified",
+            "object": pod(i),
+            "snapshots": {"pods": snapshot},
+        }
+        for i in range(n)
+    ]
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Benchmarks of the hook runtime stages: the hook run as whole, values patches generation and the
+output flush. Every case is measured for the best wall time of several repeats and for the peak
+memory allocated by Python during a single run.
+"""
+
+import copy
+import os
+import tempfile
+import time
+import tracemalloc
+
+from dictdiffer import diff
+
+from deckhouse import hook
+from deckhouse.cow import cow_values
+from deckhouse.values import PatchGenerator, values_json_patches
+
+from . import payloads
+
+# (contexts, snapshot objects) for the hook run
+RUN_SIZES = [(1, 1000), (100, 100), (500, 1000)]
+# (width, depth) of the values tree
+VALUES_SIZES = [(10, 3), (12, 4)]
+# number of kube operations and metrics
+FLUSH_SIZES = [1000, 20000]
+
+
+def synthetic_hook(ctx):
+    """Does what a typical hook does: walks the snapshot and writes values and outputs."""
+    internal = ctx.values["module"]["internal"]
+    internal["pods"] = len(ctx.snapshots["pods"])
+    for item in ctx.snapshots["pods"]:
+        ctx.metrics.collect({"name": "pod", "set": 1, "labels": item["filterResult"]})
+    ctx.kubernetes.merge_patch("ConfigMap", "default", "pods", {"data": {"n": "1"}})
+
+
+def mutate(values: dict):
+    """Changes a scalar, an array and adds a key in a deep branch, depth must be 3 or more."""
+    branch = values["node0"]["node1"]
+    branch["node2"]["key0"] = "changed"
+    branch["list"].append("10.0.0.255")
+    branch["new"] = {"a": 1}
+
+
+def run_cases():
+    for contexts, objects in RUN_SIZES:
+        binding_context = payloads.binding_contexts(contexts, objects)
+        initial_values = {"module": {"internal": {}}, "global": payloads.values(10, 3)}
+
+        def case():
+            hook.testrun(synthetic_hook, binding_context, initial_values=initial_values)
+
+        yield f"run/{contexts}x{objects}", case
+
+
+def patches_cases():
+    for width, depth in VALUES_SIZES:
+        initial = payloads.values(width, depth)
+        updated = copy.deepcopy(initial)
+        mutate(updated)
+
+        def full():
+            list(values_json_patches(initial, updated))
+
+        def tracked():
+            view = cow_values(initial)
+            mutate(view)
+            list(values_json_patches(initial, view))
+
+        changes = list(diff(initial, updated, dot_notation=False, expand=True))
+
+        def generator():
+            pg = PatchGenerator(updated)
+            for change in changes:
+                list(pg.generate(change))
+
+        yield f"values_json_patches/full/{width}x{depth}", full
+        yield f"values_json_patches/tracked/{width}x{depth}", tracked
+        yield f"PatchGenerator/{width}x{depth}", generator
+
+
+def flush_cases():
+    for n in FLUSH_SIZES:
+        kube_operations = payloads.kube_operations(n)
+        metrics = payloads.metrics(n)
+
+        def case():
+            output = hook.testrun(lambda ctx: None)
+            output.kube_operations.data = kube_operations
+            output.metrics.data = metrics
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {
+                    "KUBERNETES_PATCH_PATH": os.path.join(tmp, "kube.json"),
+                    "METRICS_PATH": os.path.join(tmp, "metrics.json"),
+                }
+                saved = {k: os.environ.get(k) for k in env}
+                os.environ.update(env)
+                try:
+                    output.flush()
+                finally:
+                    for k, v in saved.items():
+                        if v is None:
+                            del os.environ[k]
+                        else:
+                            os.environ[k] = v
+
+        yield f"Output.flush/{n}", case
+
+
+def cases():
+    for group in (run_cases, patches_cases, flush_cases):
+        for name, case in group():
+            yield name, case
+
+
+def measure(case, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        case()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "peak_bytes": peak}
+
+
+def run(repeat: int = 3, select: str = "") -> dict:
+    return {name: measure(case, repeat) for name, case in cases() if select in name}
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Disk-backed memoization of pure computations across hook runs.
+
+    def render_certificate(ca: dict, names: list) -> dict:
+        ...
+
+    def main(ctx: hook.Context):
+        cert = ctx.memo(render_certificate, ca, names)
+
+Results are keyed by the function (its module, name, bytecode with constants and referenced names,
+default arguments and the values it closes over) and the content of the arguments, so the function
+must depend on nothing else, e.g. not on globals. Arguments, defaults, closed over values and
+results must be JSON serializable, functions among them are keyed the same way; otherwise the
+result is computed and not cached. Results are returned as JSON decodes them, e.g. tuples become
+lists, whether they are computed or read from the cache.
+
+Entries are stored as files in DECKHOUSE_HOOK_CACHE_DIR (a directory in the system temporary
+directory by default). When the cache grows over DECKHOUSE_HOOK_CACHE_MAX_BYTES (64 MiB by default),
+the least recently used entries are removed down to 3/4 of it. The directory is scanned for that
+on the first stored entry, later ones are counted until the limit is reached again. Entries are written atomically, so hooks running at
+the same time can share the directory. Cache failures never fail the hook, the result is computed
+instead.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from types import CodeType
+
+from . import codec
+
+CACHE_DIR_ENV = "DECKHOUSE_HOOK_CACHE_DIR"
+CACHE_MAX_BYTES_ENV = "DECKHOUSE_HOOK_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_SUFFIX = ".json"
+
+
+class Memo:
+    """
+    Memoizes function results in the directory.
+
+    :param directory: the cache directory, created if missing
+    :param max_bytes: the cache size limit
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # the size of the directory, None until it is scanned
+        self._size = None
+
+    def __call__(self, func, *args, **kwargs):
+        """Returns func(*args, **kwargs), from the cache if it was computed before."""
+        try:
+            key = self.key(func, args, kwargs)
+        except (TypeError, ValueError):
+            # arguments or values the function depends on are not JSON serializable
+            return func(*args, **kwargs)
+        path = os.path.join(self.directory, key[:2], key + _SUFFIX)
+
+        try:
+            with open(path, "rb") as f:
+                result = codec.load(f)["result"]
+            # reading is the use, the modification time orders entries for eviction
+            os.utime(path)
+            return result
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        result = func(*args, **kwargs)
+        try:
+            content = codec.dumps({"result": result}).encode("utf-8")
+        except (TypeError, ValueError):
+            # the result is not JSON serializable
+            return result
+        try:
+            self._store(path, content)
+            self._count(len(content))
+        except OSError:
+            # e.g. read-only file system
+            pass
+        # the same as the cached result will be
+        return codec.loads(content)["result"]
+
+    @staticmethod
+    def key(func, args: tuple, kwargs: dict) -> str:
+        """
+        Returns the stable hash of the function and the arguments content.
+
+        :raise TypeError: if arguments or values the function depends on are not JSON serializable
+        """
+        content = json.dumps(
+            [_function_key(func, set()), args, kwargs],
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def evict(self, max_bytes: int = None) -> int:
+        """
+        Removes the least recently used entries until the cache fits into max_bytes.
+
+        :param max_bytes: the size to fit into, self.max_bytes by default
+        :return: the size of the cache after eviction
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith(_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # removed by another hook
+                pass
+            total -= size
+        return total
+
+    def _count(self, size: int):
+        # Entries are evicted below the limit, so the directory is scanned again only after a
+        # quarter of the limit is stored. Entries stored by other hooks are found by the scan.
+        if self._size is None:
+            self._size = self.evict()
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self._size = self.evict(self.max_bytes * 3 // 4)
+
+    def _store(self, path: str, content: bytes):
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=dirname)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _function_key(func, seen: set) -> list:
+    # the result of the function depends on its code, default arguments and closed over values
+    key = [
+        getattr(func, "__module__", None),
+        getattr(func, "__qualname__", repr(func)),
+    ]
+    code = getattr(func, "__code__", None)
+    if code is None or id(func) in seen:
+        # builtins and classes, or the recursive reference to itself
+        return key
+    seen.add(id(func))
+    cells = []
+    for cell in getattr(func, "__closure__", None) or ():
+        try:
+            cells.append(_value_key(cell.cell_contents, seen))
+        except ValueError:
+            # the cell is not assigned yet
+            cells.append(None)
+    return key + [
+        _code_key(code),
+        _value_key(getattr(func, "__defaults__", None), seen),
+        _value_key(getattr(func, "__kwdefaults__", None), seen),
+        cells,
+    ]
+
+
+def _value_key(value, seen: set):
+    if callable(value) and hasattr(value, "__qualname__"):
+        return _function_key(value, seen)
+    if isinstance(value, (list, tuple)):
+        return [_value_key(v, seen) for v in value]
+    if isinstance(value, dict):
+        return {k: _value_key(v, seen) for k, v in value.items()}
+    return value
+
+
+def _code_key(code: CodeType) -> list:
+    # co_code refers to constants and names by index, their values are in co_consts and co_names
+    consts = []
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            consts.append(_code_key(const))
+        elif isinstance(const, frozenset):
+            # the order of string items depends on the hash seed
+            consts.append(sorted(repr(c) for c in const))
+        else:
+            consts.append(repr(const))
+    return [code.co_code.hex(), consts, list(code.co_names)]
+
+
+_default = None
+
+
+def default_memo() -> Memo:
+    """Returns the memo configured by the environment, see the module documentation."""
+    global _default  # pylint: disable=global-statement
+    directory = os.getenv(CACHE_DIR_ENV) or os.path.join(
+        tempfile.gettempdir(), "deckhouse-hook-cache"
+    )
+    max_bytes = int(os.getenv(CACHE_MAX_BYTES_ENV) or DEFAULT_MAX_BYTES)
+    if (
+        _default is None
+        or _default.directory != directory
+        or _default.max_bytes != max_bytes
+    ):
+        _default = Memo(directory, max_bytes)
+    return _default
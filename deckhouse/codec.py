@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+JSON encoding and decoding for hook inputs and outputs.
+
+orjson is used when it is installed (`pip install orjson`), the standard library json
+module otherwise. Both produce compact JSON without ASCII escaping.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def stdlib_dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def stdlib_loads(data):
+    if isinstance(data, memoryview):
+        # json accepts only str, bytes and bytearray, the whole buffer is copied
+        data = bytes(data)
+    return json.loads(data)
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj) -> str:
+        """Serializes the object to the compact JSON string."""
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            # e.g. non-string keys or integers wider than 64 bits
+            return stdlib_dumps(obj)
+
+    def loads(data):
+        """Deserializes JSON from str, bytes or a buffer."""
+        return orjson.loads(data)
+
+else:  # pragma: no cover
+    BACKEND = "json"
+    dumps = stdlib_dumps
+    loads = stdlib_loads
+
+
+def load(f):
+    """Deserializes JSON from the file object opened in binary mode."""
+    return loads(f.read())
@@ -30,6 +30,16 @@ class ConversionsCollector:
             return [{"failedMessage": self._err_message}]
         return [{"convertedObjects": self._converted_objects}]
 
+    def merge(self, other: "ConversionsCollector"):
+        """Appends objects converted by another collector, its error message overwrites ours.
+
+        Args:
+            other (ConversionsCollector): the collector to merge
+        """
+        self._converted_objects.extend(other._converted_objects)
+        if other._err_message is not None:
+            self._err_message = other._err_message
+
     def error(self, message: str):
         """Overwrites all previous data with a single error message.
 
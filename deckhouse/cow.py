@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Copy-on-write and read-only views over JSON-like values.
+
+Hooks get values and config values that are shared between all binding contexts. Instead of deep
+copying them for every context, a view copies a container shallowly only when it is reached, and
+the original tree is never modified. Mutations are recorded as paths of the changed containers, so
+the values patches can be calculated only for the changed subtrees.
+
+Only plain dicts and lists are wrapped. Other mappings (e.g. DotMap) cannot be tracked, so they
+are deep copied as before. Read-only config subtrees stored into values are copied, so the hook can
+modify them there.
+"""
+
+from copy import deepcopy
+
+
+def cow_values(values):
+    """Returns a copy-on-write view of values, or a deep copy if the values cannot be tracked.
+
+    Args:
+        values (dict): values shared between binding contexts, they are never modified
+
+    Returns:
+        dict: values to be modified by the hook
+    """
+    if type(values) is dict:
+        return _view(values, _Tracker(), ())
+    return deepcopy(values)
+
+
+def frozen_values(values):
+    """Returns a read-only view of values, or a deep copy if the values cannot be frozen.
+
+    Args:
+        values (dict): values shared between binding contexts, they are never modified
+
+    Returns:
+        dict: values that raise TypeError on modification
+    """
+    if isinstance(values, FrozenDict):
+        return values
+    if type(values) is dict:
+        return FrozenDict(values)
+    return deepcopy(values)
+
+
+def dirty_paths(values):
+    """Returns paths of the containers modified via the copy-on-write view.
+
+    Args:
+        values: the object returned by `cow_values`, probably modified by the hook
+
+    Returns:
+        set | None: set of path tuples, or None if the changes are not tracked for the object
+    """
+    if isinstance(values, CopyOnWriteDict) and values._path == ():
+        return set(values._tracker.paths)
+    return None
+
+
+class _Tracker:
+    """
+    Shared registry of the modified containers paths of a single values tree.
+    """
+
+    def __init__(self):
+        self.paths = set()
+
+    def touch(self, path):
+        self.paths.add(path)
+
+
+_CONTAINERS = (dict, list)
+
+
+def _is_container(value):
+    return type(value) in _CONTAINERS
+
+
+class CopyOnWriteDict(dict):
+    """
+    Dict view that holds a shallow copy of the original dict and wraps nested containers into views
+    when they are accessed. The original dict is never modified. Views are created by `_view`.
+    """
+
+    __slots__ = ("_base", "_tracker", "_path")
+
+    def _wrap(self, key, value):
+        # Only containers still shared with the original tree need a view. Everything else was put
+        # by the hook itself and is tracked via the path of this dict.
+        if type(value) in _CONTAINERS and self._base.get(key) is value:
+            value = _view(value, self._tracker, self._path + (key,))
+            dict.__setitem__(self, key, value)
+        return value
+
+    def _touch(self):
+        self._tracker.touch(self._path)
+
+    # reading
+
+    def __getitem__(self, key):
+        return self._wrap(key, dict.__getitem__(self, key))
+
+    def __iter__(self):
+        # Overridden to make dict(view) and {**view} use keys() and __getitem__ instead of reading
+        # the unwrapped storage directly.
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in dict.keys(self)]
+
+    def items(self):
+        return [(key, self[key]) for key in dict.keys(self)]
+
+    def copy(self):
+        return {key: self[key] for key in dict.keys(self)}
+
+    def __or__(self, other):
+        ret = self.copy()
+        ret.update(other)
+        return ret
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return {deepcopy(k, memo): deepcopy(v, memo) for k, v in self.items()}
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+    # writing
+
+    def __setitem__(self, key, value):
+        self._touch()
+        dict.__setitem__(self, key, _thawed(value))
+
+    def __delitem__(self, key):
+        self._touch()
+        dict.__delitem__(self, key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        self._touch()
+        dict.__delitem__(self, key)
+        return value
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(dict.keys(self)))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        self._touch()
+        dict.update(self, _thawed(dict(*args, **kwargs)))
+
+    def clear(self):
+        self._touch()
+        dict.clear(self)
+
+
+class CopyOnWriteList(list):
+    """
+    List view that holds a shallow copy of the original list and wraps nested containers into views
+    when they are accessed. The original list is never modified. Views are created by `_view`.
+    """
+
+    __slots__ = ("_base", "_tracker", "_path", "_shifted")
+
+    def _wrap(self, index, value):
+        # Until the list is modified indexes match the original list.
+        if (
+            type(value) in _CONTAINERS
+            and not self._shifted
+            and self._base[index] is value
+        ):
+            value = _view(value, self._tracker, self._path + (index,))
+            list.__setitem__(self, index, value)
+        return value
+
+    def _touch(self):
+        # Before the order of items changes, wrap the shared items to keep the original intact.
+        if not self._shifted:
+            for i in range(list.__len__(self)):
+                self._wrap(i, list.__getitem__(self, i))
+            self._shifted = True
+        self._tracker.touch(self._path)
+
+    # reading
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self._wrap(index, list.__getitem__(self, index))
+
+    def __iter__(self):
+        i = 0
+        while i < list.__len__(self):
+            yield self._wrap(i, list.__getitem__(self, i))
+            i += 1
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self[i]
+
+    def copy(self):
+        return list(self)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __mul__(self, n):
+        return list(self) * n
+
+    __rmul__ = __mul__
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(v, memo) for v in self]
+
+    def __reduce__(self):
+        return (list, (self.copy(),))
+
+    # writing
+
+    def __setitem__(self, index, value):
+        self._touch()
+        if isinstance(index, slice):
+            value = [_thawed(v) for v in value]
+        else:
+            value = _thawed(value)
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._touch()
+        list.__delitem__(self, index)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        self._touch()
+        return list.__imul__(self, n)
+
+    def append(self, value):
+        self._touch()
+        list.append(self, _thawed(value))
+
+    def extend(self, values):
+        self._touch()
+        list.extend(self, [_thawed(v) for v in values])
+
+    def insert(self, index, value):
+        self._touch()
+        list.insert(self, index, _thawed(value))
+
+    def pop(self, index=-1):
+        self._touch()
+        return list.pop(self, index)
+
+    def remove(self, value):
+        self._touch()
+        list.remove(self, value)
+
+    def clear(self):
+        self._touch()
+        list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self._touch()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._touch()
+        list.reverse(self)
+
+
+def _thawed(value):
+    # Returns the value with read-only views replaced by plain copies, the value itself if there
+    # are none.
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return deepcopy(value)
+    if type(value) is dict:
+        items = value.items()
+    elif type(value) is list:
+        items = enumerate(value)
+    else:
+        return value
+    copied = None
+    for key, item in items:
+        thawed = _thawed(item)
+        if thawed is not item:
+            if copied is None:
+                copied = value.copy()
+            copied[key] = thawed
+    return value if copied is None else copied
+
+
+def _view(value, tracker: _Tracker, path: tuple):
+    # Views hold their items, because orjson and C code like list comparison read the storage of
+    # dict and list subclasses directly. The items are copied by C code, and most of the cost of a
+    # view is its creation, so views are created without calling __init__ in Python.
+    if type(value) is dict:
+        view = CopyOnWriteDict(value)
+    else:
+        view = CopyOnWriteList(value)
+        view._shifted = False
+    view._base = value
+    view._tracker = tracker
+    view._path = path
+    return view
+
+
+def _readonly(*_args, **_kwargs):
+    raise TypeError("config values are read-only")
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict view. Nested containers are wrapped into read-only views when accessed.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if _is_container(value):
+            value = _frozen(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in dict.keys(self)]
+
+    def items(self):
+        return [(key, self[key]) for key in dict.keys(self)]
+
+    def copy(self):
+        return deepcopy(self)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return {deepcopy(k, memo): deepcopy(v, memo) for k, v in self.items()}
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    pop = popitem = setdefault = update = clear = _readonly
+
+
+class FrozenList(list):
+    """
+    Read-only list view. Nested containers are wrapped into read-only views when accessed.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        value = list.__getitem__(self, index)
+        if _is_container(value):
+            value = _frozen(value)
+            list.__setitem__(self, index, value)
+        return value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self[i]
+
+    def copy(self):
+        return deepcopy(self)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(v, memo) for v in self]
+
+    def __reduce__(self):
+        return (list, (self.copy(),))
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+
+def _frozen(value):
+    if type(value) is dict:
+        return FrozenDict(value)
+    return FrozenList(value)
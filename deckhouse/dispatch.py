@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+from typing import Iterable, Iterator
+
+
+def coalesce_events(binding_context: Iterable) -> Iterator[dict]:
+    """
+    Collapses consecutive "Event" contexts of the same binding into a single context.
+
+    The resulting context is the latest one, so it carries the latest snapshots, with the "events"
+    field added. The "events" field is the list of all collapsed contexts in the original order
+    without their snapshots. Other contexts are yielded as is.
+
+    Contexts are consumed lazily, only the current run of events is kept in memory.
+
+    :param binding_context: the list of hook binding contexts
+    :yield ctx: hook binding context
+    """
+    events = []
+    for ctx in binding_context:
+        if events and not _same_events(events[-1], ctx):
+            yield _merge(events)
+            events = []
+        if ctx.get("type") == "Event":
+            events.append(ctx)
+        else:
+            yield ctx
+    if events:
+        yield _merge(events)
+
+
+def _same_events(prev: dict, ctx: dict) -> bool:
+    return ctx.get("type") == "Event" and ctx.get("binding") == prev.get("binding")
+
+
+def _merge(events: list) -> dict:
+    merged = dict(events[-1])
+    merged["events"] = [
+        {k: v for k, v in ctx.items() if k != "snapshots"} for ctx in events
+    ]
+    return merged
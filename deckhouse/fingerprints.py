@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Fingerprints of binding contexts for skipping unchanged runs, see `hook.run(skip_unchanged=True)`.
+
+A fingerprint is the hash of the binding context (with its snapshots), values and config values.
+Fingerprints of the last successful run are stored by binding in DECKHOUSE_HOOK_STATE_DIR (a
+directory in the system temporary directory by default), along with the hash of the hook source
+file and the metrics and Kubernetes operations the context produced. A changed hook file discards
+all stored fingerprints.
+
+A skipped context re-emits the stored metrics and operations in its place, so the output of the
+run is the same as if the context was run, and outputs the operator failed to apply are not lost.
+A context that patched values is always run again: its patches depend on the other contexts of
+the run, and once applied they change the values anyway.
+
+The stored outputs are the ones of the last run, so skipping is only correct for hooks whose
+outputs depend on nothing but the binding context and values, e.g. not on the time or on the
+cluster state read directly.
+
+Only "Schedule", "Synchronization" and "Group" contexts are skipped. Events always carry a change,
+and webhooks must always respond.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from . import codec
+
+STATE_DIR_ENV = "DECKHOUSE_HOOK_STATE_DIR"
+SKIPPABLE_TYPES = ("Schedule", "Synchronization", "Group")
+
+
+class Fingerprints:
+    """
+    Fingerprints of the last successful run of the hook, and of the current run.
+
+    :param path: the state file path
+    :param code: the hash of the hook code
+    """
+
+    def __init__(self, path: str, code: str):
+        self.path = path
+        self.code = code
+        self.stored = self.__load()
+        # bindings of the current run, None for the ones that must not be skipped next time
+        self.current = {}
+        self._fingerprints = {}
+        self._values_digest = None
+
+    @classmethod
+    def for_hook(cls, func) -> "Fingerprints":
+        """Returns fingerprints stored for the hook function."""
+        module = sys.modules.get(getattr(func, "__module__", None))
+        filename = getattr(module, "__file__", None)
+        try:
+            with open(filename, "rb") as f:
+                code = hashlib.sha256(f.read()).hexdigest()
+        except (OSError, TypeError):
+            code = hashlib.sha256(func.__code__.co_code).hexdigest()
+            filename = f"{func.__module__}.{func.__qualname__}"
+
+        directory = os.getenv(STATE_DIR_ENV) or os.path.join(
+            tempfile.gettempdir(), "deckhouse-hook-state"
+        )
+        name = hashlib.sha256(os.path.abspath(filename).encode("utf-8")).hexdigest()
+        return cls(os.path.join(directory, name + ".json"), code)
+
+    def unchanged(
+        self, binding_context: dict, values: dict, config_values: dict
+    ) -> bool:
+        """
+        Records the fingerprint of the binding context, and returns whether it is the same as in
+        the last successful run. The outputs of a changed context are recorded with `record`, the
+        ones of an unchanged context are re-emitted with `replay`.
+        """
+        if binding_context.get("type") not in SKIPPABLE_TYPES:
+            return False
+        if self._values_digest is None:
+            self._values_digest = _digest([values, config_values])
+        fingerprint = _digest([binding_context, self._values_digest])
+        binding = binding_context.get("binding", "")
+        stored = self.stored.get(binding)
+        if isinstance(stored, dict) and stored.get("fingerprint") == fingerprint:
+            self.current[binding] = stored
+            return True
+        self.current[binding] = None
+        self._fingerprints[binding] = fingerprint
+        return False
+
+    def record(self, binding_context: dict, output, values_patched: bool):
+        """
+        Stores the outputs of the changed binding context, see `unchanged`.
+
+        :param binding_context: the binding context
+        :param output: hook.Output with payloads of this context only
+        :param values_patched: whether the context patched values
+        """
+        binding = binding_context.get("binding", "")
+        if binding not in self._fingerprints:
+            # not skippable
+            return
+        if values_patched:
+            self.current[binding] = None
+            return
+        self.current[binding] = {
+            "fingerprint": self._fingerprints.pop(binding),
+            "metrics": list(output.metrics.data),
+            "kubernetes": list(output.kube_operations.data),
+        }
+
+    def replay(self, binding_context: dict, output):
+        """
+        Re-emits the stored outputs of the unchanged binding context, see `unchanged`.
+
+        :param binding_context: the binding context
+        :param output: hook.Output of the run
+        """
+        stored = self.current[binding_context.get("binding", "")]
+        for payload in stored["metrics"]:
+            output.metrics.collect(payload)
+        for payload in stored["kubernetes"]:
+            output.kube_operations.collect(payload)
+
+    def save(self):
+        """
+        Stores fingerprints after the successful run. Failures never fail the hook, contexts are
+        run again the next time.
+        """
+        if not self.current:
+            return
+        bindings = {**self.stored, **self.current}
+        bindings = {k: v for k, v in bindings.items() if v is not None}
+        dirname = os.path.dirname(self.path)
+        try:
+            content = codec.dumps({"code": self.code, "bindings": bindings}).encode()
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=dirname)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError):
+            # e.g. read-only file system, or outputs are not JSON serializable
+            return
+
+    def __load(self) -> dict:
+        try:
+            with open(self.path, "rb") as f:
+                state = codec.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(state, dict) or state.get("code") != self.code:
+            return {}
+        return state.get("bindings") or {}
+
+
+def _digest(obj) -> str:
+    content = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
@@ -6,18 +6,9 @@
 
 import os
 import sys
-from dataclasses import dataclass
-from typing import Iterable
 
-from dictdiffer import deepcopy
-
-from .conversions import ConversionsCollector
-from .kubernetes import KubeOperationCollector
-from .metrics import MetricsCollector
-from .module import get_binding_context, get_config, get_values
-from .storage import FileStorage
-from .validations import ValidationsCollector
-from .values import ValuesPatchesCollector
+# The rest of the library and its dependencies are imported where they are used, so that the hook
+# prints its config without loading them. Shell Operator runs every hook with --config on start.
 
 
 class Output:
@@ -34,11 +25,11 @@ class Output:
 
     def __init__(
         self,
-        metrics: MetricsCollector,
-        kube_operations: KubeOperationCollector,
-        values_patches: ValuesPatchesCollector,
-        conversions: ConversionsCollector,
-        validations: ValidationsCollector,
+        metrics: "MetricsCollector",
+        kube_operations: "KubeOperationCollector",
+        values_patches: "ValuesPatchesCollector",
+        conversions: "ConversionsCollector",
+        validations: "ValidationsCollector",
     ):
         self.metrics = metrics
         self.kube_operations = kube_operations
@@ -46,13 +37,35 @@ class Output:
         self.conversions = conversions
         self.validations = validations
 
+    def merge(self, other: "Output"):
+        """
+        Appends payloads collected in another output, as if they were collected in this one.
+
+        :param other: the output to merge
+        """
+        self.metrics.merge(other.metrics)
+        self.kube_operations.merge(other.kube_operations)
+        self.values_patches.merge(other.values_patches)
+        self.conversions.merge(other.conversions)
+        self.validations.merge(other.validations)
+
     # TODO  logger: --log-proxy-hook-json / LOG_PROXY_HOOK_JSON (default=false)
     #
     # Delegate hook stdout/stderr JSON logging to the hooks and act as a proxy that adds some extra
     # fields before just printing the output. NOTE: It ignores LOG_TYPE for the output of the hooks;
     # expects JSON lines to stdout/stderr from the hooks
 
-    def flush(self):
+    def flush(self, atomic=False, fsync=False, trace=None):
+        """
+        Writes collected payloads to shell-operator (or addon-operator) output files. Every file is
+        written with a single write call.
+
+        :param atomic: whether to replace output files atomically, see storage.FileStorage
+        :param fsync: whether to fsync output files
+        :param trace: trace.Trace to count written payloads and bytes
+        """
+        from .storage import FileStorage, SpillList
+
         file_outputs = (
             ("METRICS_PATH", self.metrics),
             ("KUBERNETES_PATCH_PATH", self.kube_operations),
@@ -66,12 +79,16 @@ class Output:
             if not path:
                 # No values in Shell Operator
                 continue
-            with FileStorage(path) as file:
-                for payload in collector.data:
-                    file.write(payload)
+            with FileStorage(path, atomic=atomic, fsync=fsync) as file:
+                if isinstance(collector.data, SpillList):
+                    collector.data.dump(file)
+                else:
+                    for payload in collector.data:
+                        file.write(payload)
+            if trace is not None:
+                trace.output(path_env, len(collector.data), file.written)
 
 
-@dataclass
 class Context:
     def __init__(
         self,
@@ -80,11 +97,16 @@ class Context:
         initial_values: dict,
         output: Output,
     ):
+        from .cow import cow_values, frozen_values
+        from .snapshots import Snapshots
+
         self.binding_context = binding_context
-        self.snapshots = binding_context.get("snapshots", {})
+        self.snapshots = Snapshots(binding_context.get("snapshots", {}))
         self.output = output
-        self.config_values = deepcopy(config_values)
-        self.values = deepcopy(initial_values)
+        # Values are shared between binding contexts, so they are not copied as whole. Config values
+        # are read-only, and values are copied only where the hook modifies them.
+        self.config_values = frozen_values(config_values)
+        self.values = cow_values(initial_values)
 
     @property
     def metrics(self):
@@ -98,12 +120,30 @@ class Context:
     def values_patches(self):
         return self.output.values_patches
 
+    def memo(self, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs) cached on disk across hook runs, see cache.
+
+        :param func: pure function of JSON serializable arguments returning JSON serializable result
+        """
+        from .cache import default_memo
+
+        return default_memo()(func, *args, **kwargs)
+
 
 def __run(
     func,
     binding_context: list,
     config_values: dict,
     initial_values: dict,
+    array_mode: str = None,
+    array_key=None,
+    coalesce: bool = False,
+    coalesce_operations: bool = False,
+    spill_threshold: int = None,
+    concurrent: bool = False,
+    fingerprints=None,
+    trace=None,
 ):
     """
     Run the hook function with config. Accepts config path or config text.
@@ -112,9 +152,26 @@ def __run(
     :param binding_context: the list of hook binding contexts
     :param config_values: config values
     :param initial_values: initial values
-    :param module_name: module name in camelCase
+    :param array_mode: how changed arrays are patched in values, see values.PatchGenerator
+    :param array_key: function of an array item to align arrays, see values.PatchGenerator
+    :param coalesce: whether to collapse consecutive events of a binding, see
+        dispatch.coalesce_events
+    :param coalesce_operations: whether to coalesce kubernetes operations, see
+        kubernetes.coalesce_operations
+    :param spill_threshold: the number of payloads kept in memory per collector, see
+        storage.SpillList
+    :param concurrent: whether to run the function for all contexts concurrently, see `run`
+    :param fingerprints: fingerprints.Fingerprints to skip contexts unchanged since the last run
+    :param trace: trace.Trace to record phase timings
     :return output: output means with all generated payloads and updated values
     """
+    from .conversions import ConversionsCollector
+    from .cow import frozen_values
+    from .dispatch import coalesce_events
+    from .kubernetes import KubeOperationCollector
+    from .metrics import MetricsCollector
+    from .validations import ValidationsCollector
+    from .values import ARRAY_WHOLE, ValuesPatchesCollector
 
     if not binding_context:
         binding_context = [{}]
@@ -122,64 +179,316 @@ def __run(
         config_values = {}
     if not initial_values:
         initial_values = {}
+    config_values = frozen_values(config_values)
+    if coalesce:
+        binding_context = coalesce_events(binding_context)
 
     output = Output(
         MetricsCollector(),
         KubeOperationCollector(),
-        ValuesPatchesCollector(initial_values),
+        ValuesPatchesCollector(
+            initial_values, array_mode=array_mode or ARRAY_WHOLE, array_key=array_key
+        ),
         ConversionsCollector(),
         ValidationsCollector(),
     )
+    if spill_threshold:
+        for collector in (
+            output.metrics,
+            output.kube_operations,
+            output.values_patches,
+        ):
+            collector.spill_to_disk(spill_threshold)
+    if trace is not None:
+        trace.lap("setup")
+
+    run_contexts = __run_concurrently if concurrent else __run_sequentially
+    run_contexts(
+        func,
+        binding_context,
+        config_values,
+        initial_values,
+        output,
+        fingerprints,
+        trace,
+    )
+
+    output.values_patches.compact()
+    if trace is not None:
+        trace.lap("compact")
+    if coalesce_operations:
+        output.kube_operations.coalesce()
+        if trace is not None:
+            trace.lap("coalesce_operations")
+
+    return output
 
+
+def __run_sequentially(
+    func, binding_context, config_values, initial_values, output, fingerprints, trace
+):
+    # The event loop is created on the first coroutine and is shared by all contexts, so that
+    # loop-bound resources like client sessions survive between them.
+    loop = None
+    try:
+        for bindctx in binding_context:
+            if trace is not None:
+                trace.context_lap("read", bindctx)
+            recorded = fingerprints is not None
+            if recorded and fingerprints.unchanged(
+                bindctx, initial_values, config_values
+            ):
+                fingerprints.replay(bindctx, output)
+                continue
+            hookctx = Context(
+                binding_context=bindctx,
+                config_values=config_values,
+                initial_values=initial_values,
+                # the outputs of the context are stored with its fingerprint
+                output=_context_output() if recorded else output,
+            )
+            if trace is not None:
+                trace.context_lap("context", bindctx)
+            result = func(hookctx)
+            if _is_awaitable(result):
+                if loop is None:
+                    import asyncio
+
+                    loop = asyncio.new_event_loop()
+                loop.run_until_complete(result)
+            if trace is not None:
+                trace.context_lap("hook", bindctx)
+            if recorded:
+                _merge_context(output, hookctx, fingerprints)
+            else:
+                output.values = hookctx.values
+                output.values_patches.update(hookctx.values)
+            if trace is not None:
+                trace.context_lap("values", bindctx)
+    finally:
+        if loop is not None:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+
+
+def __run_concurrently(
+    func, binding_context, config_values, initial_values, output, fingerprints, trace
+):
+    # Every context collects into its own output, outputs are merged in the order of contexts
+    # afterwards. So the result does not depend on the order in which coroutines finish.
+    import asyncio
+
+    contexts = []
     for bindctx in binding_context:
+        if trace is not None:
+            trace.context_lap("read", bindctx)
+        skipped = fingerprints is not None and fingerprints.unchanged(
+            bindctx, initial_values, config_values
+        )
+        contexts.append((bindctx, skipped))
+
+    async def run_context(bindctx):
         hookctx = Context(
             binding_context=bindctx,
             config_values=config_values,
             initial_values=initial_values,
-            output=output,
+            output=_context_output(),
+        )
+        result = func(hookctx)
+        if _is_awaitable(result):
+            await result
+        return hookctx
+
+    pending = [bindctx for bindctx, skipped in contexts if not skipped]
+
+    async def run_all():
+        return await asyncio.gather(*(run_context(c) for c in pending))
+
+    hookctxs = iter(asyncio.run(run_all()) if pending else [])
+    if trace is not None:
+        trace.lap("hook")
+    for bindctx, skipped in contexts:
+        if skipped:
+            fingerprints.replay(bindctx, output)
+        else:
+            _merge_context(output, next(hookctxs), fingerprints)
+    if trace is not None:
+        trace.lap("values")
+
+
+def _context_output() -> Output:
+    # collects payloads of a single context, merged into the output of the run afterwards
+    from .conversions import ConversionsCollector
+    from .kubernetes import KubeOperationCollector
+    from .metrics import MetricsCollector
+    from .validations import ValidationsCollector
+    from .values import ValuesPatchesCollector
+
+    return Output(
+        MetricsCollector(),
+        KubeOperationCollector(),
+        # only for patches collected by the hook, values are compared afterwards
+        ValuesPatchesCollector({}),
+        ConversionsCollector(),
+        ValidationsCollector(),
+    )
+
+
+def _merge_context(output: Output, hookctx: Context, fingerprints=None):
+    patches = len(output.values_patches.data)
+    output.merge(hookctx.output)
+    output.values = hookctx.values
+    output.values_patches.update(hookctx.values)
+    if fingerprints is not None:
+        fingerprints.record(
+            hookctx.binding_context,
+            hookctx.output,
+            len(output.values_patches.data) > patches,
         )
-        func(hookctx)
-        output.values = hookctx.values
-        output.values_patches.update(hookctx.values)
 
-    return output
 
+def _is_awaitable(result) -> bool:
+    # inspect.isawaitable without importing asyncio for synchronous hooks
+    return result is not None and hasattr(result, "__await__")
 
-def run(func, configpath=None, config=None):
+
+def run(
+    func,
+    configpath=None,
+    config=None,
+    array_mode=None,
+    array_key=None,
+    coalesce=False,
+    coalesce_operations=False,
+    atomic_output=False,
+    fsync_output=False,
+    spill_threshold=None,
+    skip_unchanged=False,
+    concurrent=False,
+):
     """
     Run the hook function with config. Accepts config path or config text.
 
+    With `--config` argument, prints the config. With `--serve SOCKET_PATH` arguments, runs as
+    the persistent worker serving invocations forwarded over the Unix socket, see `worker`.
+
     :param configpath: path to the hook config file
     :param config: hook config text itself
+    :param array_mode: values.ARRAY_WHOLE to replace changed arrays in values as whole (default),
+        values.ARRAY_MINIMAL to patch array items when it is shorter
+    :param array_key: function of an array item returning its identity, e.g. the name of an
+        object, to align arrays in values.ARRAY_MINIMAL mode; items are compared as whole by default
+    :param coalesce: call the function once for consecutive "Event" contexts of the same binding;
+        the function gets the latest context with all events in the "events" field
+    :param coalesce_operations: compose merge patches of the same object and drop created and
+        then deleted objects before writing kubernetes operations
+    :param atomic_output: replace output files atomically via temporary files, so a crash during
+        the output never leaves partially written files
+    :param fsync_output: fsync output files after writing
+    :param spill_threshold: keep at most this number of metrics, kubernetes operations and values
+        patches in memory, the rest are moved to temporary files until the output is written;
+        spilled operations and patches are not coalesced or compacted
+    :param skip_unchanged: do not call the function for "Schedule", "Synchronization" and "Group"
+        contexts equal to the ones of the last successful run, including snapshots and values,
+        and re-emit their stored metrics and kubernetes operations instead; the stored state is
+        discarded when the hook file changes, see fingerprints
+    :param concurrent: binding contexts are independent, so the function (an `async def` one)
+        runs for all of them concurrently on a single event loop; every context collects its own
+        output, and outputs are merged in the order of contexts
+
+    The function may be an `async def` one, it is run on an event loop shared by all contexts.
+
+    Set DECKHOUSE_HOOK_TRACE to "metrics" or to a file path to time the run phases, see `trace`.
+    Set DECKHOUSE_HOOK_RECORD to a directory to archive runs for offline replay, see `recording`.
     """
 
     if len(sys.argv) > 1 and sys.argv[1] == "--config":
-        if config is None and configpath is None:
-            raise ValueError("config or configpath must be provided")
+        print(_read_config(configpath, config))
+        sys.exit(0)
 
-        if config is not None:
-            print(config)
-        else:
-            with open(configpath, "r", encoding="utf-8") as cf:
-                print(cf.read())
+    def run_once():
+        from time import perf_counter
+
+        from . import recording
+        from . import trace as tracing
+        from .fingerprints import Fingerprints
+        from .module import get_binding_context, get_config, get_values
+
+        trace = tracing.from_env()
+        recorder = recording.from_env(func)
+        fingerprints = Fingerprints.for_hook(func) if skip_unchanged else None
+        config_values = get_config()
+        initial_values = get_values()
+        binding_context = get_binding_context()
+        if recorder is not None:
+            # recorded as whole, not streamed
+            binding_context = list(binding_context)
+            # the hook may change its inputs in place, e.g. conversion hooks do
+            inputs = recorder.snapshot(binding_context, initial_values, config_values)
+        if trace is not None:
+            trace.lap("input")
+        options = dict(
+            array_mode=array_mode,
+            coalesce=coalesce,
+            coalesce_operations=coalesce_operations,
+            spill_threshold=spill_threshold,
+            concurrent=concurrent,
+        )
+        started = perf_counter()
+        output = __run(
+            func,
+            binding_context=binding_context,
+            config_values=config_values,
+            initial_values=initial_values,
+            array_key=array_key,
+            fingerprints=fingerprints,
+            trace=trace,
+            **options,
+        )
+        # comparable to the replay, which does not write the output
+        seconds = perf_counter() - started
+        output.flush(atomic=atomic_output, fsync=fsync_output, trace=trace)
+        if fingerprints is not None:
+            fingerprints.save()
+        if trace is not None:
+            trace.lap("flush")
+            trace.emit(atomic=atomic_output, fsync=fsync_output)
+        if recorder is not None:
+            recorder.record(*inputs, options, output, seconds)
 
-        sys.exit(0)
+    if len(sys.argv) > 2 and sys.argv[1] == "--serve":
+        from . import worker
 
-    output = __run(
-        func,
-        binding_context=get_binding_context(),
-        config_values=get_config(),
-        initial_values=get_values(),
-    )
+        worker.serve(sys.argv[2], lambda: _read_config(configpath, config), run_once)
+        return
 
-    output.flush()
+    run_once()
+
+
+def _read_config(configpath=None, config=None):
+    if config is None and configpath is None:
+        raise ValueError("config or configpath must be provided")
+
+    if config is not None:
+        return config
+    with open(configpath, "r", encoding="utf-8") as cf:
+        return cf.read()
 
 
 def testrun(
     func,
-    binding_context: Iterable = None,
+    binding_context: list = None,
     config_values: dict = None,
     initial_values: dict = None,
+    array_mode: str = None,
+    array_key=None,
+    coalesce: bool = False,
+    coalesce_operations: bool = False,
+    spill_threshold: int = None,
+    concurrent: bool = False,
+    trace=None,
 ) -> Output:
     """
     Test-run the hook function. Accepts binding context and initial values.
@@ -189,8 +498,28 @@ def testrun(
 
     :param binding_context: the list of hook binding contexts
     :param initial_values: initial values
+    :param array_mode: how changed arrays are patched in values, see `run`
+    :param array_key: function of an array item to align arrays, see `run`
+    :param coalesce: whether to collapse consecutive events of a binding, see `run`
+    :param coalesce_operations: whether to coalesce kubernetes operations, see `run`
+    :param spill_threshold: the number of payloads kept in memory per collector, see `run`;
+        collected data is still readable as a sequence
+    :param concurrent: whether to run the function for all contexts concurrently, see `run`
+    :param trace: trace.Trace to record phase timings
     :return: output means for metrics and kubernetes
     """
 
-    output = __run(func, binding_context, config_values, initial_values)
+    output = __run(
+        func,
+        binding_context,
+        config_values,
+        initial_values,
+        array_mode=array_mode,
+        array_key=array_key,
+        coalesce=coalesce,
+        coalesce_operations=coalesce_operations,
+        spill_threshold=spill_threshold,
+        concurrent=concurrent,
+        trace=trace,
+    )
     return output
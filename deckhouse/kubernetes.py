@@ -3,6 +3,8 @@
 # Copyright 2022 Flant JSC Licensed under Apache License 2.0
 #
 
+from .storage import SpillList
+
 
 class KubeOperationCollector:
     """
@@ -15,6 +17,38 @@ class KubeOperationCollector:
     def collect(self, payload: dict):
         self.data.append(payload)
 
+    def merge(self, other: "KubeOperationCollector"):
+        """
+        Appends operations collected by another collector.
+
+        :param other: the collector to merge
+        """
+        self.data.extend(other.data)
+
+    def spill_to_disk(self, threshold: int):
+        """
+        Keeps at most `threshold` operations in memory, the rest are moved to a temporary file
+        until the output is written, see storage.SpillList.
+
+        :param threshold: the number of operations kept in memory
+        """
+        self.data = SpillList(threshold)
+
+    def coalesce(self) -> int:
+        """
+        Reduces collected operations to the equivalent shorter sequence, see `coalesce_operations`.
+        Operations spilled to disk are not coalesced.
+
+        :return: the number of removed operations
+        """
+        if isinstance(self.data, SpillList):
+            operations = self.data.memory
+            coalesced = self.data.memory = coalesce_operations(operations)
+        else:
+            operations = self.data
+            coalesced = self.data = coalesce_operations(operations)
+        return len(operations) - len(coalesced)
+
     def create(self, obj):
         """
         :param obj: must be serializable to JSON
@@ -233,3 +267,138 @@ class KubeOperationCollector:
             ret["ignoreMissingObject"] = ignoreMissingObject
 
         self.collect(ret)
+
+
+CREATE_OPERATIONS = ("Create", "CreateOrUpdate", "CreateIfNotExists")
+DELETE_OPERATIONS = ("Delete", "DeleteInBackground", "DeleteNonCascading")
+
+
+def coalesce_operations(operations: list) -> list:
+    """
+    Reduces kubernetes operations to the equivalent shorter sequence.
+
+    - Successive "MergePatch" operations of the same object, subresource, apiVersion and
+      ignoreMissingObject flag are composed into the first one.
+    - A creation followed by a deletion of the same object is removed along with operations on
+      the object in between. The deletion is kept unless the creation is the strict "Create",
+      which implies the object did not exist.
+
+    Operations are dependent if they are on the same object, or one of them is on a namespace and
+    the other one is on an object in the namespace. Operations are not coalesced across dependent
+    ones, and the relative order of the remaining operations is kept. Operations with objects
+    passed as strings are not coalesced with anything.
+
+    :param operations: operations in the collection order
+    :return: coalesced operations
+    """
+    result = []  # [payload, alive]
+    barrier = -1  # index of the last operation with unknown object
+    by_object = {}  # object key -> indexes of operations on the object
+    # namespace -> index of the last operation on an object in it
+    last_in_namespace = {}
+    # namespace -> index of the last operation on the namespace itself
+    last_on_namespace = {}
+
+    def has_dependent_since(key, index):
+        kind, namespace, name = key
+        if kind == "Namespace" and last_in_namespace.get(name, -1) > index:
+            return True
+        return last_on_namespace.get(namespace, -1) > index
+
+    for payload in operations:
+        key = _object_key(payload)
+        if key is None:
+            result.append([payload, True])
+            barrier = len(result) - 1
+            by_object.clear()
+            continue
+
+        operation = payload.get("operation")
+        indexes = [i for i in by_object.get(key, []) if i > barrier and result[i][1]]
+        prev = indexes[-1] if indexes else None
+
+        if operation == "MergePatch" and prev is not None:
+            merged = _merge_patches(result[prev][0], payload)
+            if merged is not None and not has_dependent_since(key, prev):
+                result[prev][0] = merged
+                continue
+
+        if operation in DELETE_OPERATIONS and "subresource" not in payload:
+            created = [
+                i for i in indexes if result[i][0]["operation"] in CREATE_OPERATIONS
+            ]
+            if created and not has_dependent_since(key, created[-1]):
+                start = created[-1]
+                strict = result[start][0]["operation"] == "Create"
+                for i in indexes:
+                    if i >= start:
+                        result[i][1] = False
+                if strict:
+                    continue
+
+        result.append([payload, True])
+        index = len(result) - 1
+        by_object.setdefault(key, []).append(index)
+        kind, namespace, name = key
+        if kind == "Namespace":
+            last_on_namespace[name] = index
+        if namespace:
+            last_in_namespace[namespace] = index
+
+    return [payload for payload, alive in result if alive]
+
+
+def _object_key(payload: dict):
+    """Returns (kind, namespace, name) of the operation object, or None if unknown."""
+    if payload.get("operation") in CREATE_OPERATIONS:
+        obj = payload.get("object")
+        if not isinstance(obj, dict):
+            return None
+        metadata = obj.get("metadata") or {}
+        kind, namespace, name = (
+            obj.get("kind"),
+            metadata.get("namespace"),
+            metadata.get("name"),
+        )
+    else:
+        kind, namespace, name = (
+            payload.get("kind"),
+            payload.get("namespace"),
+            payload.get("name"),
+        )
+    if not kind or not name:
+        return None
+    return kind, namespace or "", name
+
+
+def _merge_patches(first: dict, second: dict):
+    """Returns MergePatch operation equal to the two successive ones, or None if impossible."""
+    if first.get("operation") != "MergePatch":
+        return None
+    for field in ("apiVersion", "subresource", "ignoreMissingObject"):
+        if first.get(field) != second.get(field):
+            return None
+    patch = _compose_merge_patches(first["mergePatch"], second["mergePatch"])
+    if patch is None:
+        return None
+    merged = dict(first)
+    merged["mergePatch"] = patch
+    return merged
+
+
+def _compose_merge_patches(first, second):
+    """
+    Composes JSON merge patches (RFC 7386), so that applying the result is equal to applying the
+    first and then the second one. Returns None if the composition is not expressible as a merge
+    patch, e.g. an object merged onto a value the first patch sets.
+    """
+    if not isinstance(first, dict) or not isinstance(second, dict):
+        return None
+    result = dict(first)
+    for key, value in second.items():
+        if isinstance(value, dict) and key in result:
+            value = _compose_merge_patches(result[key], value)
+            if value is None:
+                return None
+        result[key] = value
+    return result
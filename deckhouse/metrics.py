@@ -3,17 +3,43 @@
 # Copyright 2022 Flant JSC Licensed under Apache License 2.0
 #
 
+import sys
+from bisect import bisect_left
+from typing import Union
+
+from .storage import SpillList
+
+# Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
 
 class MetricsCollector:
     """
     Wrapper for metrics exporting. Accepts raw dicts and appends them into the metrics file.
+
+    Counters, gauges and histograms are aggregated in memory: consecutive updates of a series are
+    written once with the final value. Collected "set" actions are deduplicated the same way, the
+    last value of the series wins. Any other action on the series, e.g. a collected "add" after a
+    "set", is written in order, and later updates are written after it.
+
+    Series are identified by group, name and labels. Equal label sets share a single dict with
+    interned strings.
     """
 
     def __init__(self):
         self.data = []
+        # aggregated series by (group, name, labels) as (kind, payload or _Histogram), their
+        # payloads are already in data and are updated in place
+        self._series = {}
+        # shared labels dicts by canonical labels
+        self._label_sets = {}
 
     def collect(self, payload: dict):
-        self.data.append(payload)
+        if payload.get("action") == "set" or "set" in payload:
+            self._set(payload)
+        else:
+            self._detach(payload)
+            self.data.append(payload)
 
     def expire(self, group: str):
         """Expire all metrics in the group.
@@ -21,4 +47,286 @@ class MetricsCollector:
         Args:
             group (str): metric group name
         """
-        self.collect({"action": "expire", "group": group})
+        # Series of the group set before are expired anyway, so they are dropped. Series updated
+        # after the expiration are written after it.
+        expired = set()
+        series = {}
+        for key, (kind, value) in self._series.items():
+            if key[0] == group:
+                expired.update(id(p) for p in _payloads(kind, value))
+            else:
+                series[key] = (kind, value)
+        if expired:
+            self._series = series
+            if isinstance(self.data, SpillList):
+                self.data.memory = [p for p in self.data.memory if id(p) not in expired]
+            else:
+                self.data = [p for p in self.data if id(p) not in expired]
+        self.data.append({"action": "expire", "group": group})
+
+    def spill_to_disk(self, threshold: int):
+        """Keeps at most `threshold` payloads in memory, the rest are moved to a temporary file
+        until the output is written, see storage.SpillList.
+
+        Aggregated series are written again after they are spilled and updated: gauges with the
+        last value, counters with the increments since then and histograms with all observations.
+
+        Args:
+            threshold (int): the number of payloads kept in memory
+        """
+        self.data = SpillList(threshold, on_spill=self._detach_series)
+
+    def _detach_series(self):
+        # Payloads are about to be spilled and can no longer be updated in place. Histograms keep
+        # observations and are collected again on the next one.
+        series = {}
+        for key, (kind, value) in self._series.items():
+            if kind == "histogram":
+                value.detach()
+                series[key] = (kind, value)
+        self._series = series
+
+    def counter(
+        self,
+        name: str,
+        value: Union[int, float] = 1,
+        labels: dict = None,
+        group: str = None,
+    ):
+        """Increments the counter. The sum of increments is written as a single "add" action.
+
+        Args:
+            name (str): metric name
+            value (int | float): increment
+            labels (dict): metric labels
+            group (str): metric group name
+        """
+        self._payload("counter", "add", name, labels, group)["value"] += value
+
+    def gauge(
+        self,
+        name: str,
+        value: Union[int, float],
+        labels: dict = None,
+        group: str = None,
+    ):
+        """Sets the gauge. The last value is written as a single "set" action.
+
+        Args:
+            name (str): metric name
+            value (int | float): metric value
+            labels (dict): metric labels
+            group (str): metric group name
+        """
+        self._set(_new_payload(name, "set", value, labels, group))
+
+    def histogram(
+        self,
+        name: str,
+        value: Union[int, float],
+        labels: dict = None,
+        group: str = None,
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        """Observes the value. The histogram is written as "set" actions of cumulative
+        name_bucket series with the "le" label, name_sum and name_count.
+
+        Args:
+            name (str): metric name
+            value (int | float): observed value
+            labels (dict): metric labels
+            group (str): metric group name
+            buckets (tuple): upper bounds of buckets, used on the first observation of the series
+        """
+        histogram = self._histogram(name, labels, group, buckets)
+        histogram.observe(value)
+        self._collect_histogram(histogram)
+
+    def merge(self, other: "MetricsCollector"):
+        """Appends metrics of another collector as if they were collected by this one: counters
+        are summed up, histogram observations are added and the last set value wins.
+
+        Args:
+            other (MetricsCollector): the collector to merge, it must not spill to disk
+        """
+        series_by_payload = {}
+        for kind, value in other._series.values():
+            for payload in _payloads(kind, value):
+                series_by_payload[id(payload)] = (kind, value)
+
+        merged_histograms = set()
+        for payload in other.data:
+            kind, value = series_by_payload.get(id(payload), (None, None))
+            if kind is None:
+                if payload.get("action") == "expire" and payload.keys() == {
+                    "action",
+                    "group",
+                }:
+                    self.expire(payload["group"])
+                else:
+                    self.collect(payload)
+            elif kind == "counter":
+                self.counter(
+                    payload["name"],
+                    payload["value"],
+                    payload.get("labels"),
+                    payload.get("group"),
+                )
+            elif kind == "gauge":
+                self._set(payload)
+            elif id(value) not in merged_histograms:
+                merged_histograms.add(id(value))
+                histogram = self._histogram(
+                    value.name, value.labels, value.group, value.bounds
+                )
+                histogram.add(value)
+                self._collect_histogram(histogram)
+
+    def _histogram(self, name: str, labels, group, buckets) -> "_Histogram":
+        labels_key, labels = self._labels(labels)
+        key = (group, name, labels_key)
+        series = self._series.get(key)
+        if series is None:
+            histogram = _Histogram(name, labels, group, buckets, self._labels)
+            self._series[key] = ("histogram", histogram)
+            return histogram
+        if series[0] != "histogram":
+            raise ValueError(f"metric {name} is not a histogram")
+        return series[1]
+
+    def _collect_histogram(self, histogram: "_Histogram"):
+        if not histogram.collected:
+            # payloads are written with the observed value, even if they are spilled right away
+            histogram.collected = True
+            self.data.extend(histogram.payloads)
+
+    def _payload(self, kind: str, action: str, name: str, labels, group) -> dict:
+        labels_key, labels = self._labels(labels)
+        key = (group, name, labels_key)
+        series = self._series.get(key)
+        if series is None or series[0] == "gauge":
+            # the first update, or the series was set since the last one
+            payload = _new_payload(name, action, 0, labels, group)
+            self.data.append(payload)
+            self._series[key] = (kind, payload)
+            return payload
+        if series[0] != kind:
+            raise ValueError(f"metric {name} is not a {kind}")
+        return series[1]
+
+    def _set(self, payload: dict):
+        try:
+            labels_key, labels = self._labels(payload.get("labels"))
+        except TypeError:
+            # unhashable label values, the series cannot be identified
+            self.data.append(payload)
+            return
+        payload = dict(payload)
+        if labels is not None:
+            payload["labels"] = labels
+        key = (payload.get("group"), payload.get("name"), labels_key)
+        series = self._series.get(key)
+        if series is None or series[0] == "counter":
+            # the first update, or the series was incremented since the last one
+            self.data.append(payload)
+            self._series[key] = ("gauge", payload)
+        elif series[0] == "gauge":
+            series[1].clear()
+            series[1].update(payload)
+        else:
+            # the series is aggregated as another kind, leave it to Shell Operator
+            self.data.append(payload)
+
+    def _detach(self, payload: dict):
+        # The raw payload is written after the aggregated one of its series, so later updates of
+        # the series cannot be folded into the aggregated payload before it.
+        labels = payload.get("labels")
+        try:
+            labels_key = tuple(sorted(labels.items())) if labels else ()
+            key = (payload.get("group"), payload.get("name"), labels_key)
+            series = self._series.get(key)
+        except (AttributeError, TypeError):
+            # the series cannot be identified
+            return
+        if series is not None and series[0] != "histogram":
+            del self._series[key]
+
+    def _labels(self, labels) -> tuple:
+        """Returns the canonical key of labels and the shared labels dict."""
+        if not labels:
+            return (), None
+        key = tuple(sorted(labels.items()))
+        shared = self._label_sets.get(key)
+        if shared is None:
+            shared = {_intern(k): _intern(v) for k, v in labels.items()}
+            self._label_sets[key] = shared
+        return key, shared
+
+
+class _Histogram:
+    def __init__(self, name: str, labels, group, buckets: tuple, intern_labels):
+        self.name = name
+        self.labels = labels
+        self.group = group
+        self.bounds = sorted(buckets)
+        labels = labels or {}
+        self.buckets = [
+            _new_payload(
+                f"{name}_bucket",
+                "set",
+                0,
+                intern_labels({**labels, "le": _le(b)})[1],
+                group,
+            )
+            for b in self.bounds + [float("inf")]
+        ]
+        self.sum = _new_payload(f"{name}_sum", "set", 0, labels, group)
+        self.count = _new_payload(f"{name}_count", "set", 0, labels, group)
+        self.payloads = self.buckets + [self.sum, self.count]
+        # whether payloads are in the collector data
+        self.collected = False
+
+    def detach(self):
+        self.buckets = [dict(p) for p in self.buckets]
+        self.sum = dict(self.sum)
+        self.count = dict(self.count)
+        self.payloads = self.buckets + [self.sum, self.count]
+        self.collected = False
+
+    def observe(self, value):
+        for payload in self.buckets[bisect_left(self.bounds, value) :]:
+            payload["value"] += 1
+        self.sum["value"] += value
+        self.count["value"] += 1
+
+    def add(self, other: "_Histogram"):
+        if other.bounds != self.bounds:
+            raise ValueError(f"histogram {self.name} has different buckets")
+        for payload, added in zip(self.payloads, other.payloads):
+            payload["value"] += added["value"]
+
+
+def _new_payload(name: str, action: str, value, labels, group) -> dict:
+    payload = {"name": name, "action": action, "value": value}
+    if group is not None:
+        payload["group"] = group
+    if labels:
+        payload["labels"] = labels
+    return payload
+
+
+def _payloads(kind: str, value) -> list:
+    if kind == "histogram":
+        return value.payloads
+    return [value]
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _le(bound) -> str:
+    if bound == float("inf"):
+        return "+Inf"
+    # formatted as the Prometheus client does: 1 -> "1.0"
+    return repr(float(bound))
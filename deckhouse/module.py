@@ -4,19 +4,35 @@
 #
 
 
+import codecs
 import json
+import mmap
 import os
+from contextlib import contextmanager
+
+from . import codec
+
+# Size of the chunk read from the binding context file at once. Binding contexts are parsed one
+# by one, so the chunk only bounds the read granularity, not the size of a context.
+READ_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
 
 
 def get_binding_context():
     """
     Iterates over hook contexts in the binding context file.
 
+    The file is parsed incrementally, a context is decoded only when the previous one has been
+    consumed, so the memory is bounded by the largest single context rather than the whole file.
+
     :yield ctx: hook binding context
     """
-    context = read_json_file("BINDING_CONTEXT_PATH") or []
-    for ctx in context:
-        yield ctx
+    path = os.getenv("BINDING_CONTEXT_PATH")
+    if not path:
+        # No binding context in Shell Operator
+        return
+    yield from iter_json_file(path)
 
 
 def get_values():
@@ -47,6 +63,215 @@ def read_json_file(envvar):
     if not values_path:
         # No values in Shell Operator
         return None
-    with open(values_path, "r", encoding="utf-8") as f:
-        values = json.load(f)
-    return values
+    return load_json_file(values_path)
+
+
+def load_json_file(path):
+    """
+    Parses the JSON file. With orjson, the file is parsed directly from its memory mapping, see
+    `mapped_file`. The standard library json accepts only bytes and str, so the file is read
+    instead: mapping it would keep both the mapped pages and the copy in memory.
+
+    :param path: the file path
+    :return: the decoded value
+    """
+    if codec.BACKEND != "orjson":
+        with open(path, "rb") as f:
+            return codec.load(f)
+    with mapped_file(path) as buffer, memoryview(buffer) as view:
+        return codec.loads(view)
+
+
+def iter_json_file(path, chunk_size=None):
+    """
+    Iterates over items of the top-level JSON array in the mapped file, see `iter_json_array`.
+    Pages of the file are released as soon as they are decoded, so the resident memory is bounded
+    by the largest context, as with reading the file by chunks.
+
+    :param path: the file path
+    :param chunk_size: the number of bytes decoded at once, READ_CHUNK_SIZE by default
+    :yield item: decoded array item
+    """
+    with mapped_file(path) as buffer:
+        yield from iter_json_array(_MappedText(buffer), chunk_size or READ_CHUNK_SIZE)
+
+
+@contextmanager
+def mapped_file(path):
+    """
+    Maps the file into memory read-only. The content is not copied into Python objects, but the
+    mapped pages still count towards the resident memory once they are read, see
+    benchmarks/inputs.py. Files that cannot be mapped, like empty files or pipes, are read as
+    bytes.
+
+    :param path: the file path
+    :yield buffer: mmap or bytes with the file content
+    """
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            buffer = None
+        if buffer is None:
+            yield f.read()
+            return
+        with buffer:
+            yield buffer
+
+
+def iter_json_array(f, chunk_size=READ_CHUNK_SIZE):
+    """
+    Iterates over items of the top-level JSON array in the text file without loading the whole
+    array. The top-level `null` is treated as an empty array.
+
+    :param f: file object opened in text mode
+    :param chunk_size: the number of characters to read at once
+    :yield item: decoded array item
+    """
+    reader = _ChunkReader(f, chunk_size)
+
+    head = reader.peek()
+    if head is None:
+        raise json.JSONDecodeError("Expecting value", "", 0)
+    if head != "[":
+        # Not an array, let the decoder handle null and report anything else
+        value = json.loads(reader.rest())
+        if value is None:
+            return
+        raise ValueError(f"Expected JSON array, got {type(value).__name__}")
+    reader.skip()
+
+    if reader.peek() == "]":
+        reader.skip()
+        reader.expect_end()
+        return
+
+    while True:
+        yield reader.decode()
+
+        sep = reader.peek()
+        if sep == ",":
+            reader.skip()
+            continue
+        if sep == "]":
+            reader.skip()
+            reader.expect_end()
+            return
+        raise reader.error("Expecting ',' delimiter")
+
+
+class _MappedText:
+    """
+    Text file interface over the mapped file for `iter_json_array`, decodes UTF-8 chunk by chunk.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+        # offset of pages not yet released
+        self.released = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.madvise = getattr(buffer, "madvise", None)
+        if self.madvise is not None and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.madvise(mmap.MADV_SEQUENTIAL)
+
+    def read(self, size=-1):
+        text = ""
+        # a chunk may end inside a multibyte character, an empty string would mean EOF
+        while not text and self.pos < len(self.buffer):
+            end = len(self.buffer) if size < 0 else self.pos + max(size, 1)
+            chunk = self.buffer[self.pos : end]
+            self.pos += len(chunk)
+            text = self.decoder.decode(chunk, final=self.pos >= len(self.buffer))
+        self.__release()
+        return text
+
+    def __release(self):
+        # Decoded bytes are never read again. Dropping their pages keeps the resident memory as
+        # low as reading the file by chunks would.
+        if self.madvise is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        end = self.pos - self.pos % mmap.PAGESIZE
+        if end > self.released:
+            self.madvise(mmap.MADV_DONTNEED, self.released, end - self.released)
+            self.released = end
+
+
+class _ChunkReader:
+    """
+    Buffer over a text file that decodes JSON values one at a time.
+    """
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.consumed = 0  # characters dropped from the buffer, for error positions
+        self.eof = False
+
+    def _fill(self, size):
+        """Reads at least `size` more characters unless EOF, returns False on EOF."""
+        if self.eof:
+            return False
+        if self.pos:
+            self.consumed += self.pos
+            self.buf = self.buf[self.pos :]
+            self.pos = 0
+        chunk = self.f.read(max(size, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character or None on EOF."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_size):
+                return None
+
+    def skip(self):
+        self.pos += 1
+
+    def rest(self):
+        while self._fill(self.chunk_size):
+            pass
+        return self.buf[self.pos :]
+
+    def expect_end(self):
+        if self.peek() is not None:
+            raise self.error("Extra data")
+
+    def error(self, msg):
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    def decode(self):
+        """Decodes the next JSON value, reading more data until the value is complete."""
+        decoder = _DECODER
+        need = self.chunk_size
+        while True:
+            self.peek()
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # The value is incomplete, read more. The read size grows geometrically, so a
+                # large value is re-scanned only a logarithmic number of times.
+                self._fill(need)
+                need *= 2
+                continue
+            if end == len(self.buf) and not self.eof:
+                # A number or literal may continue in the next chunk
+                if self._fill(self.chunk_size):
+                    continue
+            self.pos = end
+            return value
+
+
+_DECODER = json.JSONDecoder()
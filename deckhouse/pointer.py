@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+JSON Pointer (RFC 6901) accessors for values.
+
+    from deckhouse import pointer
+
+    def main(ctx: hook.Context):
+        if not pointer.exists(ctx.values, "/myModule/internal/certs"):
+            pointer.set(ctx.values, "/myModule/internal/certs/ca", ca, create=True)
+        replicas = pointer.get(ctx.values, "/myModule/replicas", 1)
+
+Pointers are strings like "/a/b/0", or tuples of keys and indexes. Parsed pointers are cached, so
+repeated access to the same path does not parse it again.
+"""
+
+from functools import lru_cache
+from typing import Iterable, Union
+
+# no value at the pointer
+_MISSING = object()
+# get() raises KeyError instead of returning the default
+_RAISE = object()
+
+
+class Pointer:
+    """
+    Parsed JSON Pointer.
+
+    Args:
+        tokens (tuple): unescaped reference tokens
+    """
+
+    __slots__ = ("tokens", "path", "_steps", "_parent_steps", "_last")
+
+    def __init__(self, tokens: tuple):
+        self.tokens = tokens
+        self.path = json_pointer(tokens)
+        # every step is (key, index), index is None if the token cannot address a list item
+        self._steps = tuple((t, _index(t)) for t in tokens)
+        self._parent_steps = self._steps[:-1]
+        self._last = self._steps[-1] if self._steps else None
+
+    def __repr__(self):
+        return f"Pointer({self.path!r})"
+
+    def get(self, doc, default=_RAISE):
+        """Returns the value at the pointer.
+
+        Args:
+            doc (dict): the document
+            default: returned if there is no value at the pointer, KeyError is raised if omitted
+        """
+        value = doc
+        for key, index in self._steps:
+            value = _child(value, key, index)
+            if value is _MISSING:
+                if default is _RAISE:
+                    raise KeyError(self.path)
+                return default
+        return value
+
+    def exists(self, doc) -> bool:
+        """Whether the document has a value at the pointer."""
+        return self.get(doc, _MISSING) is not _MISSING
+
+    def set(self, doc, value, create: bool = False):
+        """Sets the value at the pointer. A list item is replaced, "-" or the list length appends
+        the item.
+
+        Args:
+            doc (dict): the document
+            value: the value to set
+            create (bool): create missing parent objects instead of raising KeyError
+        """
+        if self._last is None:
+            raise ValueError("cannot set the whole document")
+        parent = self._parent(doc, create)
+        key, index = self._last
+        if isinstance(parent, list):
+            if key == "-" or index == len(parent):
+                parent.append(value)
+            elif index is not None and index < len(parent):
+                parent[index] = value
+            else:
+                raise KeyError(self.path)
+        elif isinstance(parent, dict):
+            parent[key] = value
+        else:
+            raise KeyError(self.path)
+
+    def delete(self, doc, missing_ok: bool = False):
+        """Deletes the value at the pointer.
+
+        Args:
+            doc (dict): the document
+            missing_ok (bool): do not raise KeyError if there is no value at the pointer
+        """
+        if self._last is None:
+            raise ValueError("cannot delete the whole document")
+        try:
+            parent = self._parent(doc, False)
+            key, index = self._last
+            if isinstance(parent, list):
+                if index is None or index >= len(parent):
+                    raise KeyError(self.path)
+                del parent[index]
+            elif isinstance(parent, dict):
+                del parent[key]
+            else:
+                raise KeyError(self.path)
+        except KeyError:
+            if not missing_ok:
+                raise KeyError(self.path) from None
+
+    def _parent(self, doc, create: bool):
+        value = doc
+        for key, index in self._parent_steps:
+            child = _child(value, key, index)
+            if child is _MISSING:
+                if not create or not isinstance(value, dict):
+                    raise KeyError(self.path)
+                value[key] = {}
+                # read back, the container may wrap the stored value
+                child = value[key]
+            value = child
+        return value
+
+
+@lru_cache(maxsize=4096)
+def _compile(pointer: Union[str, tuple]) -> Pointer:
+    if isinstance(pointer, str):
+        return Pointer(tuple(parse_json_pointer(pointer)))
+    return Pointer(tuple(str(t) for t in pointer))
+
+
+def compile_pointer(pointer: Union[str, Iterable]) -> Pointer:
+    """Returns the parsed pointer, cached by the pointer string or tuple.
+
+    Args:
+        pointer (str | tuple): JSON Pointer string, or keys and indexes
+    """
+    if isinstance(pointer, Pointer):
+        return pointer
+    if not isinstance(pointer, (str, tuple)):
+        pointer = tuple(pointer)
+    return _compile(pointer)
+
+
+def get(doc, pointer, default=_RAISE):
+    """Returns the value at the pointer, see Pointer.get."""
+    return compile_pointer(pointer).get(doc, default)
+
+
+def exists(doc, pointer) -> bool:
+    """Whether the document has a value at the pointer."""
+    return compile_pointer(pointer).exists(doc)
+
+
+def set(doc, pointer, value, create: bool = False):  # pylint: disable=redefined-builtin
+    """Sets the value at the pointer, see Pointer.set."""
+    compile_pointer(pointer).set(doc, value, create)
+
+
+def delete(doc, pointer, missing_ok: bool = False):
+    """Deletes the value at the pointer, see Pointer.delete."""
+    compile_pointer(pointer).delete(doc, missing_ok)
+
+
+def escape(token) -> str:
+    """Escapes the reference token, "~" as "~0" and "/" as "~1"."""
+    token = str(token)
+    if "~" in token or "/" in token:
+        return token.replace("~", "~0").replace("/", "~1")
+    return token
+
+
+def unescape(token: str) -> str:
+    if "~" in token:
+        return token.replace("~1", "/").replace("~0", "~")
+    return token
+
+
+def json_pointer(tokens: Iterable) -> str:
+    """Builds the JSON Pointer string from keys and indexes."""
+    return "".join("/" + escape(t) for t in tokens)
+
+
+def parse_json_pointer(pointer: str) -> list:
+    """Returns unescaped reference tokens of the JSON Pointer string."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"JSON Pointer must start with '/': {pointer!r}")
+    return [unescape(t) for t in pointer[1:].split("/")]
+
+
+def _index(token: str):
+    # RFC 6901: no leading zeros
+    if token.isascii() and token.isdigit() and (token == "0" or token[0] != "0"):
+        return int(token)
+    return None
+
+
+def _child(value, key, index):
+    if isinstance(value, dict):
+        try:
+            return value[key]
+        except KeyError:
+            return _MISSING
+    if isinstance(value, list):
+        if index is not None and index < len(value):
+            return value[index]
+    return _MISSING
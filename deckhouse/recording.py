@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Recording of hook runs and their offline replay.
+
+With DECKHOUSE_HOOK_RECORD set to a directory, every run of `hook.run` is archived there as a
+gzip-compressed JSON file: the binding context, values and config values, the run options, the
+produced outputs and the run time.
+
+    DECKHOUSE_HOOK_RECORD=/tmp/hook-records
+    DECKHOUSE_HOOK_RECORD_REDACT=password,token,data    # optional, comma-separated keys
+
+Values of redacted keys are replaced with "<redacted>" at any depth of inputs and outputs, e.g.
+"data" hides the content of Secrets in snapshots. Recording failures never fail the hook.
+
+Archives are replayed through `hook.testrun`. The best run time, the peak memory allocated by
+Python and the differences of outputs against the recording are reported:
+
+    python -m deckhouse.recording /tmp/hook-records/*.json.gz --repeat 10
+    python -m deckhouse.recording record.json.gz --hook hooks/discovery.py:main
+
+The hook function is loaded from the recorded hook file unless --hook is given. Contexts skipped
+by `skip_unchanged` are run in the replay, their outputs are the ones re-emitted by the run. The
+`array_key` function of the run is not recorded, so values patches of runs with it may differ.
+"""
+
+import copy
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+from . import codec
+
+RECORD_ENV = "DECKHOUSE_HOOK_RECORD"
+REDACT_ENV = "DECKHOUSE_HOOK_RECORD_REDACT"
+REDACTED = "<redacted>"
+FORMAT_VERSION = 1
+
+_SUFFIX = ".json.gz"
+
+# numbers runs of the process, the persistent worker runs the hook many times a second
+_sequence = itertools.count()
+
+# archive output names and the attributes of hook.Output
+OUTPUTS = (
+    ("metrics", "metrics"),
+    ("kubernetes", "kube_operations"),
+    ("values_patches", "values_patches"),
+    ("conversions", "conversions"),
+    ("validations", "validations"),
+)
+
+
+class Recorder:
+    """
+    Archives hook runs into the directory.
+
+    :param directory: the archive directory, created if missing
+    :param hook: {"file": hook file path, "function": function name}
+    :param redact: keys whose values are redacted
+    """
+
+    def __init__(self, directory: str, hook: dict, redact: tuple = ()):
+        self.directory = directory
+        self.hook = hook
+        self.redact = tuple(redact)
+
+    def snapshot(self, binding_context: list, values: dict, config_values: dict):
+        """
+        Returns the copy of inputs to record, taken before the run.
+
+        :param binding_context: the list of binding contexts
+        :param values: initial values
+        :param config_values: config values
+        :return: (binding_context, values, config_values)
+        """
+        return copy.deepcopy((binding_context, values, config_values))
+
+    def record(
+        self,
+        binding_context: list,
+        values: dict,
+        config_values: dict,
+        options: dict,
+        output,
+        seconds: float,
+    ):
+        """
+        Writes the archive of the run, returns its path or None if it could not be written.
+
+        :param binding_context: the list of binding contexts, see `snapshot`
+        :param values: initial values
+        :param config_values: config values
+        :param options: keyword arguments of `hook.testrun` the run is equivalent to
+        :param output: hook.Output of the run
+        :param seconds: the run time
+        """
+        import gzip
+
+        archive = {
+            "version": FORMAT_VERSION,
+            "recordedAt": time.time(),
+            "hook": self.hook,
+            "options": options,
+            "seconds": seconds,
+            "redact": list(self.redact),
+            "inputs": redact(
+                {
+                    "bindingContext": binding_context,
+                    "values": values,
+                    "configValues": config_values,
+                },
+                self.redact,
+            ),
+            "outputs": redact(outputs(output), self.redact),
+        }
+        name = "{}-{}-{}-{}{}".format(
+            time.strftime("%Y%m%dT%H%M%S"),
+            os.getpid(),
+            next(_sequence),
+            os.path.splitext(os.path.basename(self.hook.get("file") or "hook"))[0],
+            _SUFFIX,
+        )
+        path = os.path.join(self.directory, name)
+        try:
+            content = gzip.compress(codec.dumps(archive).encode("utf-8"))
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=".", suffix=".tmp", dir=self.directory
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError):
+            # e.g. read-only file system, or values are not JSON serializable
+            return None
+        return path
+
+
+def from_env(func):
+    """Returns the recorder if recording is enabled by DECKHOUSE_HOOK_RECORD, None otherwise."""
+    directory = os.getenv(RECORD_ENV)
+    if not directory:
+        return None
+    module = sys.modules.get(getattr(func, "__module__", None))
+    filename = getattr(module, "__file__", None)
+    hook = {
+        "file": os.path.abspath(filename) if filename else None,
+        "function": getattr(func, "__name__", None),
+    }
+    keys = os.getenv(REDACT_ENV) or ""
+    return Recorder(directory, hook, [k.strip() for k in keys.split(",") if k.strip()])
+
+
+def outputs(output) -> dict:
+    """Returns payloads of hook.Output by archive output names."""
+    return {name: list(getattr(output, attr).data) for name, attr in OUTPUTS}
+
+
+def redact(obj, keys: tuple):
+    """Returns the copy of the object with values of the keys replaced at any depth."""
+    if not keys:
+        return obj
+    if isinstance(obj, dict):
+        return {k: REDACTED if k in keys else redact(v, keys) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [redact(v, keys) for v in obj]
+    return obj
+
+
+def load(path: str) -> dict:
+    """Reads the archive."""
+    import gzip
+
+    with gzip.open(path, "rb") as f:
+        archive = codec.load(f)
+    if archive.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"{path}: unsupported archive version {archive.get('version')}"
+        )
+    return archive
+
+
+def load_hook(spec: str):
+    """
+    Loads the hook function from the file.
+
+    :param spec: "path/to/hook.py:function"
+    """
+    import importlib.util
+
+    path, _, name = spec.rpartition(":")
+    if not path:
+        raise ValueError(f"expected FILE:FUNCTION, got {spec!r}")
+    path = os.path.abspath(path)
+    # hooks import modules next to them
+    if os.path.dirname(path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(path))
+    module_spec = importlib.util.spec_from_file_location(
+        "deckhouse_replayed_hook", path
+    )
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_spec.name] = module
+    module_spec.loader.exec_module(module)
+    return getattr(module, name)
+
+
+def replay(archive: dict, func, repeat: int = 3) -> dict:
+    """
+    Runs the recorded inputs through `hook.testrun` and compares outputs to the recording.
+
+    :param archive: the archive, see `load`
+    :param func: the hook function
+    :param repeat: the number of timed runs
+    :return: {"seconds": best run time, "recordedSeconds": the recorded run time, "peakBytes":
+        peak memory of a run, "differences": list of output differences}
+    """
+    import tracemalloc
+
+    from .hook import testrun
+
+    inputs = archive["inputs"]
+    options = archive.get("options") or {}
+
+    def run():
+        # the hook may change its inputs
+        binding_context, values, config_values = copy.deepcopy(
+            (inputs["bindingContext"], inputs["values"], inputs["configValues"])
+        )
+        start = time.perf_counter()
+        output = testrun(
+            func,
+            binding_context,
+            config_values=config_values,
+            initial_values=values,
+            **options,
+        )
+        return output, time.perf_counter() - start
+
+    times = [run()[1] for _ in range(repeat)]
+
+    tracemalloc.start()
+    try:
+        output, seconds = run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if not times:
+        times = [seconds]
+
+    replayed = redact(outputs(output), tuple(archive.get("redact") or ()))
+    return {
+        "seconds": min(times),
+        "recordedSeconds": archive.get("seconds"),
+        "peakBytes": peak,
+        "differences": differences(archive["outputs"], replayed),
+    }
+
+
+def differences(recorded: dict, replayed: dict) -> list:
+    """Describes the differences of outputs, outputs are compared as JSON."""
+    result = []
+    for name, _ in OUTPUTS:
+        expected = recorded.get(name, [])
+        actual = codec.loads(codec.dumps(replayed.get(name, [])))
+        if expected == actual:
+            continue
+        index = next(
+            (i for i, (e, a) in enumerate(zip(expected, actual)) if e != a),
+            min(len(expected), len(actual)),
+        )
+        result.append(
+            f"{name}: {len(expected)} recorded and {len(actual)} replayed payloads, "
+            f"the first difference at {index}"
+        )
+    return result
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m deckhouse.recording")
+    parser.add_argument("archives", nargs="+", metavar="ARCHIVE")
+    parser.add_argument(
+        "--hook",
+        metavar="FILE:FUNCTION",
+        help="the hook function, the recorded one by default",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per archive")
+    args = parser.parse_args(argv)
+
+    hooks = {}
+    failed = False
+    print(f"{'archive':45} {'ms':>10} {'recorded':>10} {'peak MiB':>10}")
+    for path in args.archives:
+        archive = load(path)
+        spec = args.hook or "{file}:{function}".format(**archive["hook"])
+        if spec not in hooks:
+            hooks[spec] = load_hook(spec)
+        result = replay(archive, hooks[spec], repeat=args.repeat)
+
+        recorded = result["recordedSeconds"]
+        recorded = f"{recorded * 1000:10.2f}" if recorded is not None else f"{'':10}"
+        print(
+            f"{os.path.basename(path):45} {result['seconds'] * 1000:10.2f} {recorded} "
+            f"{result['peakBytes'] / 2**20:10.2f}"
+        )
+        for line in result["differences"]:
+            failed = True
+            print(f"  DIFFERENCE {line}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Declarative rules for validating webhooks.
+
+Rules are dicts checking values at object paths:
+
+    RULES = [
+        {"path": "spec.nodeType", "required": True, "enum": ["CloudEphemeral", "Static"]},
+        {"path": "metadata.name", "pattern": r"^[a-z0-9-]{1,42}$"},
+        {"path": "spec.cloudInstances.minPerZone", "minimum": 0, "maximum": 100},
+        {"path": "spec.taints.*.effect", "enum": ["NoSchedule", "NoExecute"], "warning": True},
+        {
+            "predicate": lambda ng: ng["spec"].get("nodeType") != "Static"
+            or "cloudInstances" not in ng["spec"],
+            "message": "spec.cloudInstances is not allowed for Static node groups",
+        },
+    ]
+
+    def main(ctx: hook.Context):
+        rules.validate(ctx, RULES)
+
+Rule keys:
+    path (str | tuple): dot-separated path, or tuple of keys and indexes; "*" matches every item of
+        a list or a dict
+    required (bool): the value must be present and not null; other checks skip missing values
+    enum (list): allowed values
+    pattern (str): regular expression the string value must match (re.search)
+    minimum, maximum (number): inclusive bounds of the numeric value
+    predicate (callable): the value at the path, or the whole object if there is no path, is valid
+        if the function returns true; use it for checks across fields
+    message (str): message replacing the default one
+    warning (bool): report the violation as the warning instead of denying the object
+
+Rules are compiled into checker functions once. `validate` caches compiled rules by the rules
+list, so define the list once, e.g. at the module level, or pass the validator compiled with
+`compile_rules(RULES)`. The cache keeps the most recently used lists only, so rules built inside
+the hook function are compiled on every call. All violations are gathered in one pass.
+"""
+
+import re
+import typing
+from collections import OrderedDict
+
+from .validations import ValidationsCollector
+
+_MISSING = object()
+
+_RULE_KEYS = {
+    "path",
+    "required",
+    "enum",
+    "pattern",
+    "minimum",
+    "maximum",
+    "predicate",
+    "message",
+    "warning",
+}
+
+# compiled validators by id of the rules list, the list is kept to keep the id reserved
+_compiled = OrderedDict()
+# the number of compiled rules lists kept, e.g. the persistent worker sees many short-lived lists
+COMPILED_CACHE_SIZE = 64
+
+
+class Validator:
+    """
+    Compiled rules, see the module documentation for the rules format.
+
+    Args:
+        rules (list): rule dicts
+    """
+
+    def __init__(self, rules: list):
+        self._checks = [_compile_rule(rule) for rule in rules]
+
+    def check(self, obj: dict) -> typing.Tuple[list, list]:
+        """Checks the object against all rules.
+
+        Args:
+            obj (dict): the object to check
+
+        Returns:
+            tuple: list of error messages and list of warning messages
+        """
+        errors = []
+        warnings = []
+        for check, is_warning in self._checks:
+            check(obj, warnings.append if is_warning else errors.append)
+        return errors, warnings
+
+    def apply(self, obj: dict, validations: ValidationsCollector):
+        """Denies the object with all errors joined, or allows it with warnings.
+
+        Args:
+            obj (dict): the object to check
+            validations (ValidationsCollector): the output collector
+        """
+        errors, warnings = self.check(obj)
+        if errors:
+            validations.deny("; ".join(errors))
+        else:
+            validations.allow(*warnings)
+
+
+def compile_rules(rules: list) -> Validator:
+    """Returns the validator for the rules list, compiled once per list object.
+
+    Args:
+        rules (list): rule dicts, the list must not be changed after the first call
+    """
+    key = id(rules)
+    entry = _compiled.get(key)
+    if entry is None or entry[0] is not rules:
+        entry = (rules, Validator(rules))
+        _compiled[key] = entry
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    _compiled.move_to_end(key)
+    return entry[1]
+
+
+def validate(ctx, rules: typing.Union[list, Validator]):
+    """Validates the object of the admission review in the binding context with the rules.
+
+    Args:
+        ctx (hook.Context): the hook context
+        rules (list | Validator): rule dicts, see `compile_rules`, or the compiled validator
+    """
+    obj = ctx.binding_context["review"]["request"]["object"]
+    validator = rules if isinstance(rules, Validator) else compile_rules(rules)
+    validator.apply(obj, ctx.output.validations)
+
+
+def _compile_rule(rule: dict):
+    unknown = set(rule) - _RULE_KEYS
+    if unknown:
+        raise ValueError(f"unknown rule keys: {', '.join(sorted(unknown))}")
+
+    path = rule.get("path")
+    message = rule.get("message")
+    checks = _value_checks(rule)
+
+    if path is None:
+        if "predicate" not in rule or len(checks) > 1 or rule.get("required"):
+            raise ValueError("rules without path must have only predicate")
+        predicate = rule["predicate"]
+        text = message or "object is invalid"
+
+        def check_object(obj, report):
+            if not predicate(obj):
+                report(text)
+
+        return check_object, bool(rule.get("warning"))
+
+    segments = _parse_path(path)
+    values = _compile_getter(segments)
+    required = bool(rule.get("required"))
+    path_str = ".".join(str(s) for s in segments)
+
+    def check_path(obj, report):
+        for value_path, value in values(obj, path_str):
+            if value is _MISSING or value is None:
+                if required:
+                    report(message or f"{value_path} is required")
+                continue
+            for value_check in checks:
+                error = value_check(value)
+                if error is not None:
+                    report(message or f"{value_path} {error}")
+                    break
+
+    return check_path, bool(rule.get("warning"))
+
+
+def _value_checks(rule: dict) -> list:
+    checks = []
+
+    if "enum" in rule:
+        allowed = list(rule["enum"])
+        error = f"must be one of {', '.join(repr(v) for v in allowed)}"
+
+        def check_enum(value):
+            for v in allowed:
+                # True == 1, so booleans are not mixed with numbers
+                if value == v and (type(value) is bool) == (type(v) is bool):
+                    return None
+            return error
+
+        checks.append(check_enum)
+
+    if "pattern" in rule:
+        regex = re.compile(rule["pattern"])
+        pattern_error = f"must match {rule['pattern']}"
+
+        def check_pattern(value):
+            if not isinstance(value, str):
+                return "must be a string"
+            if regex.search(value) is None:
+                return pattern_error
+            return None
+
+        checks.append(check_pattern)
+
+    if "minimum" in rule or "maximum" in rule:
+        minimum = rule.get("minimum")
+        maximum = rule.get("maximum")
+
+        def check_range(value):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return "must be a number"
+            if minimum is not None and value < minimum:
+                return f"must be greater than or equal to {minimum}"
+            if maximum is not None and value > maximum:
+                return f"must be less than or equal to {maximum}"
+            return None
+
+        checks.append(check_range)
+
+    if "predicate" in rule:
+        predicate = rule["predicate"]
+
+        def check_predicate(value):
+            return None if predicate(value) else "is invalid"
+
+        checks.append(check_predicate)
+
+    return checks
+
+
+def _parse_path(path) -> tuple:
+    if isinstance(path, str):
+        return tuple(path.split("."))
+    return tuple(path)
+
+
+def _compile_getter(segments: tuple):
+    """Returns the function yielding (path, value) pairs, value is _MISSING if it is absent."""
+    if "*" not in segments:
+
+        def get_one(obj, path_str):
+            value = obj
+            for key in segments:
+                value = _child(value, key)
+                if value is _MISSING:
+                    break
+            yield path_str, value
+
+        return get_one
+
+    def get_many(obj, _path_str):
+        return _expand(obj, segments, 0, "")
+
+    return get_many
+
+
+def _expand(value, segments: tuple, pos: int, prefix: str):
+    if pos == len(segments):
+        yield prefix, value
+        return
+    key = segments[pos]
+    sep = "." if prefix else ""
+    if key != "*":
+        child = _child(value, key)
+        if child is _MISSING:
+            yield f"{prefix}{sep}{'.'.join(str(s) for s in segments[pos:])}", _MISSING
+        else:
+            yield from _expand(child, segments, pos + 1, f"{prefix}{sep}{key}")
+        return
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        # nothing to match, missing items are not required
+        return
+    for item_key, item in items:
+        yield from _expand(item, segments, pos + 1, f"{prefix}{sep}{item_key}")
+
+
+def _child(value, key):
+    if isinstance(value, dict):
+        return value.get(key, _MISSING)
+    if isinstance(value, list):
+        try:
+            return value[int(key)]
+        except (ValueError, IndexError):
+            return _MISSING
+    return _MISSING
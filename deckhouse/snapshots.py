@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+from typing import Callable, Union
+
+
+class Snapshots(dict):
+    """
+    Snapshots of the binding context by binding name. Each snapshot is the list of items with
+    "object" and "filterResult" fields.
+
+    Use `index` to look up snapshot items without scanning the list every time.
+    """
+
+    def __init__(self, snapshots: dict):
+        super().__init__(snapshots)
+        self._indexes = {}
+
+    def index(self, binding: str) -> "SnapshotIndex":
+        """Returns the index of the snapshot. The index is created once per snapshot.
+
+        Args:
+            binding (str): the snapshot name
+
+        Returns:
+            SnapshotIndex: the index of the snapshot, empty if there is no snapshot
+        """
+        index = self._indexes.get(binding)
+        if index is None:
+            index = SnapshotIndex(self.get(binding) or [])
+            self._indexes[binding] = index
+        return index
+
+
+class SnapshotIndex:
+    """
+    Lookups over snapshot items. Every lookup table is built on the first use, and the following
+    lookups take O(1).
+
+    Names and namespaces are taken from the object metadata, or from "name" and "namespace" fields
+    of the filterResult if the object is not kept in the snapshot.
+    """
+
+    def __init__(self, items: list):
+        self.items = items
+        self._by_name = None
+        self._by_namespace = None
+        self._by_namespaced_name = None
+        self._groups = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def get(self, name: str, namespace: str = None) -> Union[dict, None]:
+        """Returns the item by name and namespace, or None if there is no such item.
+
+        Args:
+            name (str): object name
+            namespace (str): object namespace, omit it for cluster-level objects
+        """
+        if self._by_namespaced_name is None:
+            self._by_namespaced_name = {}
+            for item in self.items:
+                self._by_namespaced_name[_namespaced_name(item)] = item
+        return self._by_namespaced_name.get((namespace or None, name))
+
+    def by_name(self, name: str) -> list:
+        """Returns items with the name in all namespaces."""
+        if self._by_name is None:
+            self._by_name = _group(self.items, lambda item: _namespaced_name(item)[1])
+        return self._by_name.get(name, [])
+
+    def by_namespace(self, namespace: str) -> list:
+        """Returns items in the namespace."""
+        if self._by_namespace is None:
+            self._by_namespace = _group(
+                self.items, lambda item: _namespaced_name(item)[0]
+            )
+        return self._by_namespace.get(namespace or None, [])
+
+    def group_by(self, key: Union[str, Callable]) -> dict:
+        """Returns items grouped by the key of filterResult.
+
+        The grouping is cached by the key, so pass the same function object to reuse it.
+
+        Args:
+            key (str | callable): filterResult field name, or function of filterResult returning
+                hashable key
+
+        Returns:
+            dict: lists of items by key
+        """
+        groups = self._groups.get(key)
+        if groups is None:
+            if callable(key):
+                key_func = key
+            else:
+                field = key
+                key_func = lambda fr: fr.get(field) if isinstance(fr, dict) else None
+            groups = _group(self.items, lambda item: key_func(item.get("filterResult")))
+            self._groups[key] = groups
+        return groups
+
+    def find(self, key: Union[str, Callable], value) -> list:
+        """Returns items with the key of filterResult equal to the value, see `group_by`."""
+        return self.group_by(key).get(value, [])
+
+
+def _namespaced_name(item: dict) -> tuple:
+    obj = item.get("object")
+    if obj:
+        metadata = obj.get("metadata") or {}
+    else:
+        metadata = item.get("filterResult")
+        if not isinstance(metadata, dict):
+            metadata = {}
+    return metadata.get("namespace") or None, metadata.get("name")
+
+
+def _group(items: list, key: Callable) -> dict:
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return groups
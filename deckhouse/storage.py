@@ -3,23 +3,222 @@
 # Copyright 2022 Flant JSC Licensed under Apache License 2.0
 #
 
-import json
+import os
+import shutil
+import tempfile
+from array import array
+
+from . import codec
 
 
 class FileStorage:
     """
     Context manager wrapping the appending JSON per line to file
+
+    Lines are buffered and appended to the file with a single write on exit. In atomic mode, the
+    file content is prepared in a temporary file in the same directory which then replaces the
+    file, so the file never contains a partial output. If an exception is raised inside the
+    context, nothing is written in atomic mode.
     """
 
-    def __init__(self, path):
-        self.file = open(path, "a", encoding="utf-8")
+    def __init__(self, path, atomic=False, fsync=False):
+        """
+        :param path: the file path
+        :param atomic: whether to replace the file atomically instead of appending to it
+        :param fsync: whether to fsync the written file (and the directory in atomic mode)
+        """
+        self.path = path
+        self.atomic = atomic
+        self.fsync = fsync
+        self.lines = []
+        # encoded lines and binary files to copy, in the order of writing
+        self.parts = []
+        # bytes written by this storage
+        self.written = 0
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.file.close()
+        if exc_type is not None and self.atomic:
+            return
+        self.flush()
 
     def write(self, payload: dict):
-        self.file.write(json.dumps(payload))
-        self.file.write("\n")
+        self.lines.append(codec.dumps(payload))
+        self.lines.append("\n")
+
+    def copy(self, f):
+        """Appends the content of the binary file object with JSON lines, see SpillList."""
+        self.__seal()
+        self.parts.append(f)
+
+    def __seal(self):
+        if self.lines:
+            self.parts.append("".join(self.lines).encode("utf-8"))
+            self.lines = []
+
+    def flush(self):
+        self.__seal()
+        parts = self.parts or [b""]
+        self.parts = []
+        if self.atomic:
+            self.__replace(parts)
+        else:
+            self.__append(parts)
+
+    def __write(self, f, parts: list, existing: bytes = b""):
+        # the existing content is written along with the first part, so the usual output of lines
+        # only takes a single write
+        for part in parts:
+            if isinstance(part, bytes):
+                f.write(existing + part)
+                self.written += len(part)
+            else:
+                if existing:
+                    f.write(existing)
+                part.seek(0)
+                shutil.copyfileobj(part, f)
+                self.written += part.tell()
+            existing = b""
+
+    def __append(self, parts: list):
+        with open(self.path, "ab") as f:
+            self.__write(f, parts)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def __replace(self, parts: list):
+        dirname, basename = os.path.split(os.path.abspath(self.path))
+
+        try:
+            with open(self.path, "rb") as f:
+                # keep what is already in the file, as in the append mode
+                existing = f.read()
+            mode = os.stat(self.path).st_mode
+        except FileNotFoundError:
+            existing = b""
+            mode = None
+
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{basename}.", dir=dirname)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self.__write(f, parts, existing)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if mode is not None:
+                os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        if self.fsync:
+            dirfd = os.open(dirname, os.O_RDONLY)
+            try:
+                os.fsync(dirfd)
+            finally:
+                os.close(dirfd)
+
+
+class SpillList:
+    """
+    List of payloads that moves them to a temporary file as JSON lines once more than `threshold`
+    payloads are appended. Spilled payloads are read back on iteration and indexing, and they are
+    copied to the output file as is, see FileStorage.copy.
+
+    Payloads must not be changed after they are spilled. `on_spill` is called before payloads in
+    memory are spilled, so their owner can stop changing them.
+
+    :param threshold: the number of payloads kept in memory
+    :param on_spill: function called before payloads are spilled
+    """
+
+    def __init__(self, threshold: int, on_spill=None):
+        if threshold < 1:
+            raise ValueError("threshold must be positive")
+        self.threshold = threshold
+        self.on_spill = on_spill
+        self.memory = []
+        self.spilled = 0
+        # file offsets of spilled payloads
+        self.offsets = array("q")
+        self.file = None
+
+    def append(self, payload: dict):
+        # spilled before appending, so the last payload stays in memory until the next one
+        if len(self.memory) >= self.threshold:
+            self.spill()
+        self.memory.append(payload)
+
+    def extend(self, payloads):
+        for payload in payloads:
+            self.append(payload)
+
+    def spill(self):
+        """Moves payloads in memory to the file."""
+        if not self.memory:
+            return
+        if self.on_spill is not None:
+            self.on_spill()
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        offset = self.file.seek(0, os.SEEK_END)
+        lines = [(codec.dumps(p) + "\n").encode("utf-8") for p in self.memory]
+        for line in lines:
+            self.offsets.append(offset)
+            offset += len(line)
+        self.file.write(b"".join(lines))
+        self.spilled += len(self.memory)
+        self.memory = []
+
+    def dump(self, storage: FileStorage):
+        """Writes all payloads to the storage."""
+        if self.file is not None:
+            self.file.flush()
+            storage.copy(self.file)
+        for payload in self.memory:
+            storage.write(payload)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.memory = []
+        self.spilled = 0
+        self.offsets = array("q")
+
+    def __len__(self):
+        return self.spilled + len(self.memory)
+
+    def __iter__(self):
+        if self.file is not None:
+            offset = 0
+            while True:
+                self.file.seek(offset)
+                line = self.file.readline()
+                if not line:
+                    break
+                offset = self.file.tell()
+                yield codec.loads(line)
+        yield from list(self.memory)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SpillList index out of range")
+        if index >= self.spilled:
+            return self.memory[index - self.spilled]
+        self.file.seek(self.offsets[index])
+        return codec.loads(self.file.readline())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"SpillList({list(self)!r})"
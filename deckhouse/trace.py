@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Timing of hook run phases.
+
+Enabled by the DECKHOUSE_HOOK_TRACE environment variable:
+
+    DECKHOUSE_HOOK_TRACE=metrics             # metrics of the "hook_trace" group
+    DECKHOUSE_HOOK_TRACE=/tmp/hook-trace.log # a JSON line per run appended to the file
+
+Every binding context is timed by phases: "read" (reading and coalescing the context), "context"
+(preparing the hook context), "hook" (the hook function) and "values" (calculating values
+patches). The run phases are "input" (reading config and values), "setup", "compact",
+"coalesce_operations" and "flush". With concurrent contexts, only "read" is timed per context, and
+the function calls and values patches are the run phases "hook" and "values". For every written
+output file, the number of payloads and bytes are counted.
+
+In metrics mode, times are summed up by binding and phase, and the metrics are appended to the
+metrics file after the hook output is written. Tracing failures never fail the hook.
+"""
+
+import os
+import time
+from time import perf_counter
+
+from .metrics import MetricsCollector
+from .storage import FileStorage
+
+TRACE_ENV = "DECKHOUSE_HOOK_TRACE"
+TRACE_METRICS = "metrics"
+METRICS_GROUP = "hook_trace"
+
+
+class Trace:
+    """
+    Phase timings of a single hook run. Phases are measured as laps: every `lap` call records the
+    time passed since the previous one.
+
+    :param target: "metrics" or the trace file path
+    """
+
+    def __init__(self, target: str = TRACE_METRICS):
+        self.target = target
+        self.started_at = time.time()
+        self.started = self._last = perf_counter()
+        # run phases by name
+        self.phases = {}
+        # per binding context: {"binding": name, "phases": {phase: seconds}}
+        self.contexts = []
+        # per output file env: {"payloads": n, "bytes": n}
+        self.outputs = {}
+
+    def lap(self, phase: str):
+        """Records the run phase that has just finished."""
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def context_lap(self, phase: str, binding_context: dict):
+        """Records the phase of the binding context that has just finished. The first phase of a
+        context starts the new context entry."""
+        now = perf_counter()
+        if phase == "read":
+            binding = binding_context.get("binding", "") if binding_context else ""
+            self.contexts.append({"binding": binding, "phases": {}})
+        self.contexts[-1]["phases"][phase] = now - self._last
+        self._last = now
+
+    def output(self, name: str, payloads: int, size: int):
+        """Records the written output file."""
+        self.outputs[name] = {"payloads": payloads, "bytes": size}
+
+    def report(self) -> dict:
+        return {
+            "startedAt": self.started_at,
+            "seconds": self._last - self.started,
+            "phases": self.phases,
+            "contexts": self.contexts,
+            "outputs": self.outputs,
+        }
+
+    def metrics(self, collector: MetricsCollector):
+        """Exports the trace as metrics of the "hook_trace" group."""
+        collector.expire(METRICS_GROUP)
+        collector.gauge(
+            "hook_trace_run_seconds", self._last - self.started, group=METRICS_GROUP
+        )
+        collector.gauge(
+            "hook_trace_binding_contexts", len(self.contexts), group=METRICS_GROUP
+        )
+        # run phases have no binding
+        totals = {(phase, ""): seconds for phase, seconds in self.phases.items()}
+        for context in self.contexts:
+            for phase, seconds in context["phases"].items():
+                key = (phase, context["binding"])
+                totals[key] = totals.get(key, 0.0) + seconds
+        for (phase, binding), seconds in totals.items():
+            collector.gauge(
+                "hook_trace_phase_seconds",
+                seconds,
+                labels={"phase": phase, "binding": binding},
+                group=METRICS_GROUP,
+            )
+        for name, output in self.outputs.items():
+            labels = {"output": name}
+            for key in ("payloads", "bytes"):
+                collector.gauge(
+                    f"hook_trace_output_{key}",
+                    output[key],
+                    labels=labels,
+                    group=METRICS_GROUP,
+                )
+
+    def emit(self, atomic: bool = False, fsync: bool = False):
+        """Writes the trace to the metrics file or to the trace file. It is written after the hook
+        output, so write failures are ignored.
+
+        :param atomic: see storage.FileStorage
+        :param fsync: see storage.FileStorage
+        :return: whether the trace is written
+        """
+        if self.target != TRACE_METRICS:
+            # the trace file is appended to
+            path = self.target
+            payloads = [self.report()]
+            atomic = fsync = False
+        else:
+            path = os.getenv("METRICS_PATH")
+            if not path:
+                return False
+            collector = MetricsCollector()
+            self.metrics(collector)
+            payloads = collector.data
+        try:
+            with FileStorage(path, atomic=atomic, fsync=fsync) as file:
+                for payload in payloads:
+                    file.write(payload)
+        except OSError:
+            # e.g. the trace file directory does not exist
+            return False
+        return True
+
+
+def from_env():
+    """Returns the new trace if tracing is enabled by DECKHOUSE_HOOK_TRACE, None otherwise."""
+    target = os.getenv(TRACE_ENV)
+    if not target:
+        return None
+    return Trace(target)
@@ -3,9 +3,30 @@
 # Copyright 2024 Flant JSC Licensed under Apache License 2.0
 #
 
+from collections import deque
+from functools import lru_cache, partial
+
 from .hook import Context
 
 
+def conversion(from_version: str, to_version: str):
+    """
+        Marks the BaseConversionHook method as the converter between two adjacent versions.
+
+        The method gets dict resource and returns tuple (string|None, dict) like a binding handler. It may
+        change the passed object in place, apiVersion is set to to_version after the method returns.
+
+        Args:
+            from_version (str): apiVersion of objects the method converts
+            to_version (str): apiVersion of objects the method returns
+    """
+    def decorator(func):
+        func.conversion_versions = (from_version, to_version)
+        return func
+
+    return decorator
+
+
 class BaseConversionHook:
     """
         Base class for convertion webhook realisation.
@@ -41,6 +62,22 @@ class BaseConversionHook:
 
             if __name__ == "__main__":
                 hook.run(main, config=config)
+
+        For CRDs with many versions, converters between adjacent versions can be registered instead of
+        handlers for every binding. Objects are converted through the shortest chain of converters from
+        their apiVersion to toVersion of the binding:
+
+            class NodeGroupConversion(BaseConversionHook):
+                @conversion("deckhouse.io/v1alpha1", "deckhouse.io/v1alpha2")
+                def alpha1_to_alpha2(self, o: dict) -> typing.Tuple[str | None, dict]:
+                    o["spec"]["nodeType"] = o["spec"].pop("type")
+                    return None, o
+
+                @conversion("deckhouse.io/v1alpha2", "deckhouse.io/v1")
+                def alpha2_to_v1(self, o: dict) -> typing.Tuple[str | None, dict]:
+                    ...
+
+        The binding handler is used if the hook has a method named as the binding.
     """
     def __init__(self, ctx: Context):
         self._binding_context = ctx.binding_context
@@ -48,12 +85,27 @@ class BaseConversionHook:
         self.__ctx = ctx
 
 
-    def run(self):
+    def run(self, workers: int = 0, executor: str = "thread"):
+        """
+            Converts objects of the review with the handler of the binding.
+
+            Objects are converted sequentially by default. With workers > 1 the handler runs in a pool,
+            the order of converted objects and errors stays the same. Thread pool suits handlers that
+            release the GIL or are short, process pool suits CPU-heavy handlers over large objects. In
+            the process pool the handler gets a copy of the hook without the context, so it must not use
+            self._binding_context["review"] or write to the output.
+
+            Args:
+                workers (int): number of pool workers, 0 or 1 to convert in the current thread
+                executor (str): "thread" or "process"
+        """
+        if executor not in _EXECUTORS:
+            raise ValueError("executor must be one of {}, got {!r}".format(", ".join(_EXECUTORS), executor))
+
         binding_name = self._binding_context["binding"]
 
-        try:
-            action = getattr(self, binding_name)
-        except AttributeError:
+        action = getattr(self, binding_name, None)
+        if action is None and not _conversion_graph(type(self)):
             self.__ctx.output.conversions.error("Internal error. Handler for binding {} not found".format(binding_name))
             return
 
@@ -61,12 +113,20 @@ class BaseConversionHook:
             errors = []
             from_version = self._binding_context["fromVersion"]
             to_version = self._binding_context["toVersion"]
-            for obj in self._binding_context["review"]["request"]["objects"]:
-                if from_version != obj["apiVersion"]:
+            objects = self._binding_context["review"]["request"]["objects"]
+            # decided before converting, handlers may change apiVersion of the passed object in place
+            if action is not None:
+                dispatched = [from_version == obj["apiVersion"] for obj in objects]
+            else:
+                action = partial(self.convert, to_version=to_version)
+                dispatched = [to_version != obj["apiVersion"] for obj in objects]
+            results = iter(_convert(action, [obj for obj, d in zip(objects, dispatched) if d], workers, executor))
+            for obj, dispatch in zip(objects, dispatched):
+                if not dispatch:
                     self.__ctx.output.conversions.collect(obj)
                     continue
 
-                error_msg, res_obj = action(obj)
+                error_msg, res_obj = next(results)
                 if error_msg is not None:
                     errors.append(error_msg)
                     continue
@@ -81,3 +141,88 @@ class BaseConversionHook:
             self.__ctx.output.conversions.error("Internal error: {}".format(str(e)))
             return
 
+    def convert(self, obj: dict, to_version: str):
+        """
+            Converts the object to to_version through the shortest chain of converters registered with
+            the conversion decorator. The object is passed through the chain without copying.
+
+            Args:
+                obj (dict): object to convert, it may be changed in place
+                to_version (str): the target apiVersion
+
+            Returns:
+                tuple: (string|None, dict), the error of the first failed converter or the converted object
+        """
+        chain = _conversion_chain(type(self), obj["apiVersion"], to_version)
+        if chain is None:
+            raise ValueError("no conversion from {} to {}".format(obj["apiVersion"], to_version))
+        for method_name, version in chain:
+            error_msg, obj = getattr(self, method_name)(obj)
+            if error_msg is not None:
+                return error_msg, None
+            obj["apiVersion"] = version
+        return None, obj
+
+    def __getstate__(self):
+        # Pickled with the handler for the process pool. The context cannot be pickled, and the review
+        # objects are sent to workers separately.
+        state = self.__dict__.copy()
+        state.pop("_BaseConversionHook__ctx", None)
+        state["_binding_context"] = {k: v for k, v in self._binding_context.items() if k != "review"}
+        return state
+
+
+_EXECUTORS = ("thread", "process")
+
+
+@lru_cache(maxsize=None)
+def _conversion_graph(cls) -> dict:
+    # {from_version: {to_version: method_name}}
+    graph = {}
+    for name in dir(cls):
+        versions = getattr(getattr(cls, name, None), "conversion_versions", None)
+        if versions is None:
+            continue
+        from_version, to_version = versions
+        edges = graph.setdefault(from_version, {})
+        if to_version in edges:
+            raise ValueError("both {} and {} convert {} to {}".format(edges[to_version], name, from_version, to_version))
+        edges[to_version] = name
+    return graph
+
+
+@lru_cache(maxsize=None)
+def _conversion_chain(cls, from_version: str, to_version: str):
+    """Returns the shortest chain of (method_name, version) steps, or None if there is no path."""
+    graph = _conversion_graph(cls)
+    previous = {from_version: None}
+    queue = deque([from_version])
+    while queue:
+        version = queue.popleft()
+        if version == to_version:
+            chain = []
+            while previous[version] is not None:
+                prev_version, method_name = previous[version]
+                chain.append((method_name, version))
+                version = prev_version
+            return tuple(reversed(chain))
+        for next_version, method_name in graph.get(version, {}).items():
+            if next_version not in previous:
+                previous[next_version] = (version, method_name)
+                queue.append(next_version)
+    return None
+
+
+def _convert(action, objects: list, workers: int, executor: str):
+    if workers <= 1 or len(objects) <= 1:
+        return map(action, objects)
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if executor == "process":
+        # batches amortize pickling round trips, a few per worker keep the load balanced
+        pool, chunksize = ProcessPoolExecutor(max_workers=workers), max(1, len(objects) // (workers * 4))
+    else:
+        pool, chunksize = ThreadPoolExecutor(max_workers=workers), 1
+    with pool:
+        return list(pool.map(action, objects, chunksize=chunksize))
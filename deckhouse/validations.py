@@ -30,6 +30,14 @@ class ValidationsCollector:
         """
         return self._data
 
+    def merge(self, other: "ValidationsCollector"):
+        """Appends responses collected by another collector.
+
+        Args:
+            other (ValidationsCollector): the collector to merge
+        """
+        self._data.extend(other._data)
+
     def allow(self, *warnings: str):
         response = {"allowed": True}
         if len(warnings) > 0:
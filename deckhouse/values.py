@@ -3,53 +3,231 @@
 # Copyright 2023 Flant JSC Licensed under Apache License 2.0
 #
 
-import operator
-from functools import reduce
-from typing import Iterable
+import json
+from difflib import SequenceMatcher
+from typing import Callable, Iterable
 
 from dictdiffer import deepcopy, diff
 
+from .cow import CopyOnWriteDict, CopyOnWriteList, dirty_paths
+from .pointer import compile_pointer, json_pointer, parse_json_pointer
+from .storage import SpillList
+
+# Changed arrays are replaced as whole: "remove" and "add" of the new value
+ARRAY_WHOLE = "whole"
+# Changed arrays are patched by item indexes when it is shorter than the whole array
+ARRAY_MINIMAL = "minimal"
+
 
 class ValuesPatchesCollector:
     """
     Wrapper for the values manipulations (JSON patches)
     """
 
-    def __init__(self, values: dict):
+    def __init__(
+        self, values: dict, array_mode: str = ARRAY_WHOLE, array_key: Callable = None
+    ):
         self.initial_values = deepcopy(values)
+        self.array_mode = array_mode
+        self.array_key = array_key
         self.data = []
+        # Values with the collected patches applied. Array item patches shift items, so in
+        # ARRAY_MINIMAL mode every binding context patches arrays as the previous ones left them.
+        self.current_values = deepcopy(values) if array_mode == ARRAY_MINIMAL else None
 
     def collect(self, payload: dict):
         self.data.append(payload)
+        if self.current_values is not None:
+            try:
+                apply_json_patch(self.current_values, payload)
+            except (KeyError, IndexError, TypeError, ValueError):
+                # the patch does not apply, arrays are replaced as whole from now on
+                self.current_values = None
+                self.array_mode = ARRAY_WHOLE
 
     def update(self, updated_values: dict):
-        for patch in values_json_patches(self.initial_values, updated_values):
+        for patch in values_json_patches(
+            self.initial_values,
+            updated_values,
+            array_mode=self.array_mode,
+            array_key=self.array_key,
+            current_values=self.current_values,
+        ):
             self.collect(patch)
 
+    def merge(self, other: "ValuesPatchesCollector"):
+        """Appends patches collected by another collector.
+
+        Args:
+            other (ValuesPatchesCollector): the collector to merge
+        """
+        if self.current_values is None:
+            self.data.extend(other.data)
+            return
+        for patch in other.data:
+            self.collect(patch)
+
+    def spill_to_disk(self, threshold: int):
+        """Keeps at most `threshold` patches in memory, the rest are moved to a temporary file
+        until the output is written, see storage.SpillList.
+
+        Args:
+            threshold (int): the number of patches kept in memory
+        """
+        self.data = SpillList(threshold)
+
+    def compact(self) -> int:
+        """Reduces collected patches to the equivalent shorter sequence.
 
-def values_json_patches(initial_values: dict, updated_values: dict):
-    changes = diff(
-        initial_values,
-        updated_values,
-        dot_notation=False,  # always return path as list
-        expand=True,  # do not compact values in single operation
+        Every binding context emits patches against the same initial values, so the same change
+        can be collected several times. Patches spilled to disk are not compacted.
+
+        Returns:
+            int: the number of removed patches
+        """
+        if isinstance(self.data, SpillList):
+            patches = self.data.memory
+            # spilled patches have changed the initial values
+            base = None if self.data.spilled else self.initial_values
+            compacted = self.data.memory = compact_json_patches(patches, base)
+        else:
+            patches = self.data
+            compacted = self.data = compact_json_patches(patches, self.initial_values)
+        return len(patches) - len(compacted)
+
+
+def values_json_patches(
+    initial_values: dict,
+    updated_values: dict,
+    array_mode: str = ARRAY_WHOLE,
+    array_key: Callable = None,
+    current_values: dict = None,
+):
+    """
+    Generates JSON patches to turn initial values into updated ones.
+
+    If updated values are a copy-on-write view, only the modified subtrees are compared, and the
+    changes are calculated against the values the view was created from.
+
+    :param initial_values: values before the hook run
+    :param updated_values: values after the hook run
+    :param array_mode: ARRAY_WHOLE or ARRAY_MINIMAL, see PatchGenerator
+    :param array_key: function of an array item to align arrays in ARRAY_MINIMAL mode
+    :param current_values: values the patches are applied to if other patches changed the initial
+        values, array item patches are calculated against their arrays
+    """
+    paths = dirty_paths(updated_values)
+    if paths is None:
+        changes = diff(
+            initial_values,
+            updated_values,
+            dot_notation=False,  # always return path as list
+            expand=True,  # do not compact values in single operation
+        )
+    else:
+        changes = tracked_changes(updated_values, paths)
+        initial_values = updated_values._base
+    pg = PatchGenerator(
+        updated_values, initial_values, array_mode, array_key, current_values
     )
-    pg = PatchGenerator(updated_values)
     for change in changes:
         for patch in pg.generate(change):
             yield patch
 
 
+def tracked_changes(view: CopyOnWriteDict, paths: set):
+    """
+    Yields dictdiffer changes for the copy-on-write view, visiting only the subtrees containing
+    modified containers. The changes are in the same format and order as `dictdiffer.diff` yields
+    with `dot_notation=False, expand=True`.
+
+    :param view: copy-on-write view of values
+    :param paths: paths of the modified containers
+    """
+    prefixes = {path[:i] for path in paths for i in range(len(path) + 1)}
+    return _view_changes(view, paths, prefixes)
+
+
+def _view_changes(view, paths, prefixes):
+    path = view._path
+    if path not in prefixes:
+        return
+    base = view._base
+    node = list(path)
+
+    if isinstance(view, CopyOnWriteList):
+        # arrays are patched as whole, the item level is not worth tracking
+        for change in diff(base, view, node=node, dot_notation=False, expand=True):
+            yield change
+        return
+
+    if path not in paths:
+        # keys are intact, only descend to modified children
+        for key, value in dict.items(view):
+            if (
+                isinstance(value, (CopyOnWriteDict, CopyOnWriteList))
+                and value._base is base[key]
+            ):
+                for change in _view_changes(value, paths, prefixes):
+                    yield change
+        return
+
+    for key, old in base.items():
+        if key not in view:
+            continue
+        value = dict.__getitem__(view, key)
+        if value is old:
+            continue
+        if isinstance(value, (CopyOnWriteDict, CopyOnWriteList)) and value._base is old:
+            changes = _view_changes(value, paths, prefixes)
+        else:
+            changes = diff(
+                old, value, node=node + [key], dot_notation=False, expand=True
+            )
+        for change in changes:
+            yield change
+
+    for key, value in dict.items(view):
+        if key not in base:
+            yield ("add", node, [(key, deepcopy(value))])
+
+    for key, old in base.items():
+        if key not in view:
+            yield ("remove", node, [(key, deepcopy(old))])
+
+
 class PatchGenerator:
     """
     Generates appropriate JSON patches for the dictdiffer changes to be useful in Addon Operator.
 
-    Addon Operator does not permit using "replace" operation, so we use "add" instead. And we treat
-    arrays as whole. We have to remove them and set the new value instead of patching them.
+    Addon Operator does not permit using "replace" operation, so we use "add" instead. By default,
+    we treat arrays as whole. We have to remove them and set the new value instead of patching them.
+
+    In ARRAY_MINIMAL mode, arrays are aligned by items (or by `array_key` of items) and patched by
+    "remove" and "add" of the item indexes, unless the whole array replacement is shorter. Item
+    indexes are relative to arrays in `current_values` (initial values by default), the values the
+    patches are applied to.
     """
 
-    def __init__(self, updated_values: dict):
+    def __init__(
+        self,
+        updated_values: dict,
+        initial_values: dict = None,
+        array_mode: str = ARRAY_WHOLE,
+        array_key: Callable = None,
+        current_values: dict = None,
+    ):
+        if array_mode not in (ARRAY_WHOLE, ARRAY_MINIMAL):
+            raise ValueError(f"Unknown array mode: {array_mode}")
+        if array_mode == ARRAY_MINIMAL and initial_values is None:
+            raise ValueError("initial values are required for minimal array patches")
         self.updated_values = updated_values
+        self.initial_values = initial_values
+        self.array_mode = array_mode
+        self.array_key = array_key
+        self.current_values = (
+            current_values if current_values is not None else initial_values
+        )
         self.seen_array_paths = set()
 
     def generate(self, change):
@@ -74,6 +252,14 @@ class PatchGenerator:
         """
         op, path_segments, values = change
 
+        if self.array_mode == ARRAY_MINIMAL:
+            # changes inside array items patch the outermost array by items
+            for i, segment in enumerate(path_segments):
+                if isinstance(segment, int):
+                    for p in self.__array_patches(path_segments[:i]):
+                        yield p
+                    return
+
         if op == "add":
             #   op    |_______path________|   value
             #    |    |                   |  /
@@ -127,7 +313,8 @@ class PatchGenerator:
         raise ValueError(f"Unknown patch operation: {op}")
 
     def __array_patches(self, path_segments: Iterable):
-        path = json_path(path_segments)
+        pointer = compile_pointer(tuple(path_segments))
+        path = pointer.path
 
         # avoid duplicate array patches
         if path in self.seen_array_paths:
@@ -135,11 +322,242 @@ class PatchGenerator:
         self.seen_array_paths.add(path)
 
         # pick the value by path
-        value = reduce(operator.getitem, path_segments, self.updated_values)
+        value = pointer.get(self.updated_values)
+        whole = [
+            {"op": "remove", "path": path},
+            {"op": "add", "path": path, "value": value},
+        ]
+
+        if self.array_mode == ARRAY_MINIMAL:
+            old = pointer.get(self.current_values, None)
+            if isinstance(old, list):
+                patches = list(
+                    array_item_patches(path_segments, old, value, self.array_key)
+                )
+                if _patches_size(patches) < _patches_size(whole):
+                    whole = patches
+
+        for p in whole:
+            yield p
+
+
+def array_item_patches(
+    path_segments: Iterable, old: list, new: list, key: Callable = None
+):
+    """
+    Yields "remove" and "add" patches of array items turning the old array into the new one.
+
+    Arrays are aligned by the longest matching subsequences of item keys. Aligned items with the
+    same key but different values are replaced by "remove" and "add" of the index.
+
+    :param path_segments: the array path
+    :param old: the array before changes
+    :param new: the array after changes
+    :param key: function of an item returning hashable key, canonical JSON by default
+    """
+    if key is None:
+        key = _canonical_key
+    path_segments = list(path_segments)
+    matcher = SequenceMatcher(
+        None, [key(v) for v in old], [key(v) for v in new], autojunk=False
+    )
+
+    # index shift of the old items caused by already emitted patches
+    offset = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                if old[i] != new[j]:
+                    path = json_path(path_segments + [i + offset])
+                    yield {"op": "remove", "path": path}
+                    yield {"op": "add", "path": path, "value": new[j]}
+            continue
+
+        path = json_path(path_segments + [i1 + offset])
+        for _ in range(i1, i2):
+            yield {"op": "remove", "path": path}
+        for n, j in enumerate(range(j1, j2)):
+            yield {
+                "op": "add",
+                "path": json_path(path_segments + [i1 + offset + n]),
+                "value": new[j],
+            }
+        offset += (j2 - j1) - (i2 - i1)
+
+
+def apply_json_patch(doc: dict, patch: dict):
+    """
+    Applies the "add" or "remove" JSON patch to the document in place. Added values are copied.
+
+    :param doc: the document
+    :param patch: JSON patch
+    """
+    segments = parse_json_pointer(patch["path"])
+    if not segments:
+        raise ValueError("cannot patch the whole document")
+    parent = compile_pointer(tuple(segments[:-1])).get(doc)
+    key = segments[-1]
+    op = patch.get("op")
+    if op == "add":
+        value = deepcopy(patch["value"])
+        if isinstance(parent, list):
+            if key == "-":
+                parent.append(value)
+            elif _is_index(key) and int(key) <= len(parent):
+                parent.insert(int(key), value)
+            else:
+                raise IndexError(patch["path"])
+        else:
+            parent[key] = value
+    elif op == "remove":
+        if isinstance(parent, list):
+            if not _is_index(key):
+                raise IndexError(patch["path"])
+            del parent[int(key)]
+        else:
+            del parent[key]
+    else:
+        raise ValueError(f"Unsupported patch operation: {op}")
+
+
+def _canonical_key(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def _patches_size(patches: list) -> int:
+    return len(json.dumps(patches, separators=(",", ":")))
+
+
+def compact_json_patches(patches: list, initial_values: dict) -> list:
+    """
+    Reduces the sequence of "add" and "remove" JSON patches to the equivalent shorter sequence
+    applied to the initial values.
+
+    The last patch for a path wins: it makes all previous patches for the path and its subpaths
+    redundant. The "remove" of a path created by the previous patches is dropped along with them.
+    The "remove" followed by the "add" is kept as the array replacement idiom.
+
+    Array index patches ("/a/0", "/a/-") shift other items, so they are kept as is, and the
+    patches are not compacted across them.
+
+    :param patches: JSON patches
+    :param initial_values: values the patches are applied to
+    :return: compacted JSON patches
+    """
+    compacted = []
+    window = _PatchWindow(initial_values)
+
+    for patch in patches:
+        op = patch.get("op")
+        segments = parse_json_path(patch["path"])
+        if op not in ("add", "remove") or (segments and _is_index(segments[-1])):
+            compacted.extend(window.patches())
+            compacted.append(patch)
+            window = _PatchWindow(None)
+            continue
+        window.apply(op, segments, patch)
+
+    compacted.extend(window.patches())
+    return compacted
+
+
+class _PatchWindow:
+    """
+    Trie of the effective patches by path.
+    """
+
+    def __init__(self, base):
+        # base is None when the state before the window is unknown
+        self.base = base
+        self.root = _PatchNode()
+        self.order = []  # [patch, alive] in the collection order
+
+    def apply(self, op, segments, patch):
+        existed = self.__existed(segments)
+
+        node = self.root
+        for segment in segments:
+            node = node.children.setdefault(segment, _PatchNode())
+
+        for child in node.children.values():
+            child.kill()
+        node.children = {}
+
+        if op == "add":
+            # "remove" and "add" pair is the way to replace arrays in Addon Operator
+            if not (len(node.entries) == 1 and node.entries[0][0]["op"] == "remove"):
+                node.kill_own()
+        else:
+            node.kill_own()
+            if not existed:
+                return
+
+        entry = [patch, True]
+        node.entries.append(entry)
+        self.order.append(entry)
+
+    def patches(self):
+        return [patch for patch, alive in self.order if alive]
+
+    def __existed(self, segments):
+        """Whether the path exists before the patches for the path and its subpaths."""
+        value = self.base
+        known = value is not None
+        rest = segments
+
+        node = self.root
+        for i, segment in enumerate(segments[:-1]):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.entries:
+                patch = node.entries[-1][0]
+                if patch["op"] == "remove":
+                    return False
+                value, known, rest = patch["value"], True, segments[i + 1 :]
+
+        if not known:
+            return True
+        for segment in rest:
+            if isinstance(value, dict) and segment in value:
+                value = value[segment]
+            elif (
+                isinstance(value, list)
+                and _is_index(segment)
+                and int(segment) < len(value)
+            ):
+                value = value[int(segment)]
+            else:
+                return False
+        return True
+
+
+class _PatchNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+    def kill_own(self):
+        for entry in self.entries:
+            entry[1] = False
+        self.entries = []
+
+    def kill(self):
+        self.kill_own()
+        for child in self.children.values():
+            child.kill()
+
+
+def _is_index(segment: str) -> bool:
+    return segment == "-" or segment.isdigit()
+
 
-        yield {"op": "remove", "path": path}
-        yield {"op": "add", "path": path, "value": value}
+def parse_json_path(path: str) -> list:
+    return parse_json_pointer(path)
 
 
 def json_path(path: Iterable):
-    return "/" + "/".join([str(p) for p in path])
+    """Returns the JSON Pointer of the path segments, escaping "~" and "/" in keys."""
+    return json_pointer(path)
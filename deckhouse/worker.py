@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Flant JSC Licensed under Apache License 2.0
+#
+
+"""
+Persistent worker mode for hooks.
+
+A hook started as `python hook.py --serve SOCKET_PATH` does not exit: it keeps the hook module
+loaded and serves invocations over the Unix socket one by one. Shell Operator then executes a shim
+instead of the hook itself. The shim only imports this module, forwards the hook environment
+(binding context, values and output paths) to the worker and waits for the result:
+
+    #!/usr/bin/env python3
+    import sys
+    from deckhouse import worker
+
+    sys.exit(worker.forward("/tmp/my-hook.sock"))
+
+The same is available as `python -m deckhouse.worker SOCKET_PATH`.
+
+Every invocation runs with fresh output collectors, and the forwarded environment is set only for
+the duration of the invocation. The hook stdout and stderr stay in the worker process.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import traceback
+
+# Environment passed from the shim to the worker
+FORWARDED_ENV = (
+    "BINDING_CONTEXT_PATH",
+    "VALUES_PATH",
+    "CONFIG_VALUES_PATH",
+    "METRICS_PATH",
+    "KUBERNETES_PATCH_PATH",
+    "VALUES_JSON_PATCH_PATH",
+    "CONVERSION_RESPONSE_PATH",
+    "VALIDATING_RESPONSE_PATH",
+)
+
+
+def forward(socket_path: str, argv: list = None) -> int:
+    """
+    Forwards the hook invocation to the worker.
+
+    :param socket_path: the worker socket path
+    :param argv: command line arguments, sys.argv by default
+    :return: exit code for the shim
+    """
+    if argv is None:
+        argv = sys.argv
+
+    if len(argv) > 1 and argv[1] == "--config":
+        request = {"config": True}
+    else:
+        request = {"env": {k: os.environ[k] for k in FORWARDED_ENV if k in os.environ}}
+
+    try:
+        response = _request(socket_path, request)
+    except OSError as e:
+        print(f"Hook worker is not available at {socket_path}: {e}", file=sys.stderr)
+        return 1
+
+    if response.get("error"):
+        print(response["error"], file=sys.stderr)
+        return 1
+    if "config" in response:
+        print(response["config"])
+    return 0
+
+
+def _request(socket_path: str, request: dict) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        conn.shutdown(socket.SHUT_WR)
+        with conn.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+class WorkerServer(socketserver.UnixStreamServer):
+    """
+    Serves hook invocations sequentially.
+
+    :param socket_path: the socket path, an existing file is replaced
+    :param get_config: function returning the hook config text
+    :param run: function running the hook with output paths in the environment
+    """
+
+    def __init__(self, socket_path: str, get_config, run):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.get_config = get_config
+        self.run = run
+        super().__init__(socket_path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+    def handle_request_payload(self, request: dict) -> dict:
+        try:
+            if request.get("config"):
+                return {"config": self.get_config()}
+            with _ForwardedEnv(request.get("env") or {}):
+                self.run()
+            return {}
+        except (Exception, SystemExit):  # pylint: disable=broad-except
+            # the hook failure must not stop the worker
+            return {"error": traceback.format_exc()}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        response = self.server.handle_request_payload(request)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+def serve(socket_path: str, get_config, run):
+    """Serves hook invocations until the process is terminated, see WorkerServer."""
+    with WorkerServer(socket_path, get_config, run) as server:
+        server.serve_forever()
+
+
+class _ForwardedEnv:
+    """Sets forwarded environment variables for the invocation and restores them afterwards."""
+
+    def __init__(self, env: dict):
+        self.env = {k: env.get(k) for k in FORWARDED_ENV}
+        self.saved = {}
+
+    def __enter__(self):
+        for key, value in self.env.items():
+            self.saved[key] = os.environ.get(key)
+            _setenv(key, value)
+
+    def __exit__(self, *_):
+        for key, value in self.saved.items():
+            _setenv(key, value)
+
+
+def _setenv(key, value):
+    if value is None:
+        os.environ.pop(key, None)
+    else:
+        os.environ[key] = value
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(
+            "usage: python -m deckhouse.worker SOCKET_PATH [--config]", file=sys.stderr
+        )
+        sys.exit(2)
+    sys.exit(forward(sys.argv[1], sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import json
+
+from benchmarks import __main__ as cli
+from benchmarks import importtime, inputs, suite
+
+
+def test_benchmarks_run_and_compare(tmp_path, monkeypatch):
+    monkeypatch.setattr(suite, "RUN_SIZES", [(2, 3)])
+    monkeypatch.setattr(suite, "VALUES_SIZES", [(3, 3)])
+    monkeypatch.setattr(suite, "FLUSH_SIZES", [5])
+    baseline = tmp_path / "baseline.json"
+
+    cli.main(["--repeat", "1", "--save", str(baseline)])
+
+    results = json.loads(baseline.read_text())["results"]
+    assert set(results) == {
+        "run/2x3",
+        "values_json_patches/full/3x3",
+        "values_json_patches/tracked/3x3",
+        "PatchGenerator/3x3",
+        "Output.flush/5",
+    }
+    assert all(r["seconds"] > 0 for r in results.values())
+
+    slower = {
+        name: {"seconds": r["seconds"] * 2, "peak_bytes": r["peak_bytes"]}
+        for name, r in results.items()
+    }
+    assert len(cli.compare(slower, results, threshold=1.5)) == len(results)
+    assert not cli.compare(results, results, threshold=1.5)
+
+
+def test_importtime_skips_interpreter_startup():
+    output = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |   _abc",
+            "import time:       200 |        300 | site",
+            "import time:        50 |         50 |   deckhouse",
+            "import time:       400 |        450 | deckhouse.hook",
+        ]
+    )
+
+    assert importtime.parse(output) == [
+        ("deckhouse", 50, 50, 1),
+        ("deckhouse.hook", 400, 450, 0),
+    ]
+
+
+def test_inputs_peak_memory_is_measured_in_subprocess(tmp_path):
+    path = tmp_path / "binding_context.json"
+    path.write_text(json.dumps([{"binding": "b", "snapshots": {}}]))
+
+    for loader in ("load/mmap", "iterate/mmap"):
+        result = inputs.measure(str(path), loader, "json")
+        assert result["backend"] == "json"
+        assert result["peak_bytes"] >= result["baseline_bytes"] > 0
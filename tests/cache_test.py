@@ -0,0 +1,157 @@
+import os
+
+from deckhouse import hook
+from deckhouse.cache import Memo
+
+calls = []
+
+
+def render(names, ca=None):
+    calls.append(names)
+    return {"names": sorted(names), "ca": ca}
+
+
+def test_results_are_cached_across_runs(tmp_path, monkeypatch):
+    monkeypatch.setenv("DECKHOUSE_HOOK_CACHE_DIR", str(tmp_path))
+    calls.clear()
+    results = []
+
+    def main(ctx):
+        results.append(ctx.memo(render, ctx.config_values["names"], ca="x"))
+
+    for _ in range(3):
+        hook.testrun(main, config_values={"names": ["b", "a"]})
+    hook.testrun(main, config_values={"names": ["c"]})
+
+    assert calls == [["b", "a"], ["c"]]
+    assert results == [{"names": ["a", "b"], "ca": "x"}] * 3 + [
+        {"names": ["c"], "ca": "x"}
+    ]
+
+
+def test_key_depends_on_content():
+    assert Memo.key(render, ({"a": 1, "b": 2},), {}) == Memo.key(
+        render, ({"b": 2, "a": 1},), {}
+    )
+    assert Memo.key(render, ([1],), {}) != Memo.key(render, ([2],), {})
+    assert Memo.key(render, ([1],), {}) != Memo.key(sorted, ([1],), {})
+
+
+def test_key_depends_on_constants_and_names():
+    def first():
+        return {"ttl": 3600, "nested": (lambda: "a")()}
+
+    def second():
+        return {"ttl": 7200, "nested": (lambda: "a")()}
+
+    def third():
+        return {"ttl": 3600, "nested": (lambda: "b")()}
+
+    def fourth():
+        return {"ttl": 3600, "nested": (lambda: "a")(), "mode": min}
+
+    def fifth():
+        return {"ttl": 3600, "nested": (lambda: "a")(), "mode": max}
+
+    # every version has the same name
+    functions = [first, second, third, fourth, fifth]
+    for func in functions:
+        func.__qualname__ = "func"
+    keys = {Memo.key(func, (), {}) for func in functions}
+    assert len(keys) == len(functions)
+
+
+def test_key_depends_on_defaults_and_closures():
+    def make(ttl, mode=None, *, prefix="a"):
+        def func(name, mode=mode, *, prefix=prefix):
+            return f"{prefix}{name}{mode}{ttl}"
+
+        return func
+
+    def recursive():
+        def func(n):
+            return func(n - 1) if n else 0
+
+        return func
+
+    functions = [
+        make(3600),
+        make(7200),
+        make(3600, mode="x"),
+        make(3600, prefix="b"),
+        make(3600, mode=sorted),
+        make(3600, mode=make),
+        recursive(),
+    ]
+    keys = {Memo.key(func, ("n",), {}) for func in functions}
+    assert len(keys) == len(functions)
+    assert Memo.key(make(3600), ("n",), {}) == Memo.key(make(3600), ("n",), {})
+
+
+def test_functions_depending_on_not_serializable_values_are_not_cached(tmp_path):
+    memo = Memo(str(tmp_path))
+    calls.clear()
+    names = {"a"}
+
+    def func():
+        calls.append(names)
+        return sorted(names)
+
+    assert memo(func) == ["a"]
+    assert memo(func) == ["a"]
+    assert len(calls) == 2
+    assert not os.listdir(tmp_path)
+
+
+def test_computed_result_is_decoded_as_cached(tmp_path):
+    memo = Memo(str(tmp_path))
+
+    def pair():
+        return (1, 2)
+
+    assert memo(pair) == [1, 2]
+    assert memo(pair) == [1, 2]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    memo = Memo(str(tmp_path), max_bytes=250)
+    calls.clear()
+
+    for i in range(5):
+        memo(render, [str(i) * 20])
+        # touch the first entry, so it is used more recently than others
+        memo(render, ["0" * 20])
+
+    files = [f for _, _, names in os.walk(tmp_path) for f in names]
+    assert 0 < len(files) < 5
+    calls.clear()
+    memo(render, ["0" * 20])
+    assert calls == []
+
+
+def test_cache_directory_is_scanned_only_to_evict(tmp_path, monkeypatch):
+    memo = Memo(str(tmp_path), max_bytes=4000)
+    walk = os.walk
+    scans = []
+
+    def counting_walk(top):
+        scans.append(top)
+        return walk(top)
+
+    monkeypatch.setattr(os, "walk", counting_walk)
+    for i in range(200):
+        memo(render, [str(i)])
+
+    files = [f for _, _, names in walk(tmp_path) for f in names]
+    assert sum(os.path.getsize(os.path.join(tmp_path, f[:2], f)) for f in files) <= 4000
+    # the first store, and every quarter of the limit afterwards
+    assert 1 < len(scans) < 20
+
+
+def test_cache_failures_do_not_fail_the_hook(tmp_path):
+    path = tmp_path / "file"
+    path.write_text("not a directory")
+    memo = Memo(str(path))
+
+    assert memo(render, ["a"]) == {"names": ["a"], "ca": None}
+    assert memo(lambda: {1, 2}) == {1, 2}
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from deckhouse import codec, hook
+from deckhouse.storage import FileStorage
+
+payload = {"name": "ёлка", "labels": {"a": "b"}, "values": [1, 2.5, None, True]}
+
+
+@pytest.mark.parametrize("dumps", [codec.dumps, codec.stdlib_dumps])
+def test_dumps_is_compact_and_not_escaped(dumps):
+    assert dumps(payload) == (
+        '{"name":"ёлка","labels":{"a":"b"},"values":[1,2.5,null,true]}'
+    )
+
+
+def test_dumps_falls_back_for_unsupported_values():
+    assert json.loads(codec.dumps({1: 2**70})) == {"1": 2**70}
+
+
+@pytest.mark.parametrize("data", [json.dumps(payload), json.dumps(payload).encode()])
+def test_loads(data):
+    assert codec.loads(data) == payload
+
+
+def test_file_storage_writes_json_lines(tmp_path):
+    path = tmp_path / "out.json"
+    with FileStorage(str(path)) as storage:
+        storage.write(payload)
+        storage.write({})
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [payload, {}]
+
+
+def test_values_are_read_with_codec(tmp_path, monkeypatch):
+    path = tmp_path / "values.json"
+    path.write_text(json.dumps({"module": payload}), encoding="utf-8")
+    monkeypatch.setenv("VALUES_PATH", str(path))
+    context_path = tmp_path / "binding_context.json"
+    context_path.write_text("[{}]", encoding="utf-8")
+    monkeypatch.setenv("BINDING_CONTEXT_PATH", str(context_path))
+    monkeypatch.delenv("CONFIG_VALUES_PATH", raising=False)
+
+    seen = []
+    hook.run(lambda ctx: seen.append(ctx.values["module"]), config="configVersion: v1")
+
+    assert seen == [payload]
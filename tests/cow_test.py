@@ -0,0 +1,192 @@
+import copy
+import json
+import random
+
+import pytest
+from dictdiffer import diff
+
+from deckhouse import codec, hook
+from deckhouse.cow import cow_values, dirty_paths, frozen_values
+from deckhouse.values import tracked_changes
+
+
+def sample_values():
+    return {
+        "global": {"discovery": {"nodes": [{"name": "a"}, {"name": "b"}]}},
+        "module": {
+            "internal": {"count": 1, "hosts": ["x", "y"], "nested": {"deep": {"v": 1}}},
+            "settings": {"enabled": True},
+        },
+    }
+
+
+def test_original_values_are_not_modified():
+    original = sample_values()
+    snapshot = copy.deepcopy(original)
+
+    values = cow_values(original)
+    values["module"]["internal"]["count"] += 1
+    values["module"]["internal"]["hosts"].append("z")
+    values["global"]["discovery"]["nodes"][0]["name"] = "c"
+    values["module"]["internal"]["nested"].pop("deep")["v"] = 2
+    values["module"]["settings"].update(enabled=False)
+    for node in values["global"]["discovery"]["nodes"]:
+        node["ready"] = True
+    del values["module"]["internal"]["hosts"][0]
+
+    assert original == snapshot
+    assert values["module"]["internal"]["count"] == 2
+    assert values["module"]["internal"]["hosts"] == ["y", "z"]
+    assert values["global"]["discovery"]["nodes"] == [
+        {"name": "c", "ready": True},
+        {"name": "b", "ready": True},
+    ]
+    assert json.loads(json.dumps(values))["module"]["internal"]["nested"] == {}
+
+
+def test_only_modified_paths_are_dirty():
+    values = cow_values(sample_values())
+    assert dirty_paths(values) == set()
+
+    _ = values["global"]["discovery"]["nodes"][1]["name"]
+    values["module"]["internal"]["count"] = 5
+    values["module"]["internal"]["hosts"].append("z")
+
+    assert dirty_paths(values) == {
+        ("module", "internal"),
+        ("module", "internal", "hosts"),
+    }
+
+
+def test_views_are_serialized_as_their_items():
+    original = sample_values()
+    values = cow_values(original)
+    nodes = values["global"]["discovery"]["nodes"]
+    nodes.append({"name": "c"})
+
+    # orjson reads the storage of dict and list subclasses directly
+    assert codec.loads(codec.dumps(values["global"])) == {
+        "discovery": {"nodes": [{"name": "a"}, {"name": "b"}, {"name": "c"}]}
+    }
+    assert [node["name"] for node in nodes] == ["a", "b", "c"]
+    assert nodes == [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+
+
+def test_untracked_values_are_copied():
+    assert dirty_paths({}) is None
+
+    original = [1, {"a": 1}]
+    values = cow_values(original)
+    values[1]["a"] = 2
+    assert original == [1, {"a": 1}]
+
+
+def test_config_values_are_read_only():
+    original = sample_values()
+    config = frozen_values(original)
+
+    assert config["module"]["settings"]["enabled"] is True
+    assert frozen_values(config) is config
+    with pytest.raises(TypeError):
+        config["module"]["settings"]["enabled"] = False
+    with pytest.raises(TypeError):
+        config["global"]["discovery"]["nodes"].append({})
+    with pytest.raises(TypeError):
+        config.update({})
+
+    copied = config.copy()
+    copied["module"]["settings"]["enabled"] = False
+    assert original["module"]["settings"]["enabled"] is True
+
+
+def test_config_values_stored_into_values_can_be_modified():
+    config = frozen_values({"settings": {"hosts": ["a"], "tls": {"enabled": True}}})
+    original = {"list": []}
+    values = cow_values(original)
+
+    values["settings"] = config["settings"]
+    values["settings"]["hosts"].append("b")
+    values.update(tls=config["settings"]["tls"])
+    values["tls"]["enabled"] = False
+    values["list"].append({"hosts": config["settings"]["hosts"]})
+    values["list"][0]["hosts"].append("c")
+    values["list"] += [config["settings"]["hosts"]]
+    values["list"][1].append("d")
+
+    assert values == {
+        "settings": {"hosts": ["a", "b"], "tls": {"enabled": True}},
+        "tls": {"enabled": False},
+        "list": [{"hosts": ["a", "c"]}, ["a", "d"]],
+    }
+    assert config == {"settings": {"hosts": ["a"], "tls": {"enabled": True}}}
+    assert original == {"list": []}
+
+
+def test_hook_cannot_modify_config_values():
+    def main(ctx):
+        ctx.config_values["a"] = 1
+
+    with pytest.raises(TypeError):
+        hook.testrun(main, config_values={"a": 0})
+
+
+def test_values_are_isolated_between_binding_contexts():
+    seen = []
+
+    def main(ctx):
+        seen.append(ctx.values["module"]["internal"]["count"])
+        ctx.values["module"]["internal"]["count"] += 10
+
+    initial_values = sample_values()
+    outputs = hook.testrun(
+        main, binding_context=[{}, {}], initial_values=initial_values
+    )
+
+    assert seen == [1, 1]
+    assert initial_values == sample_values()
+    assert outputs.values_patches.data == [
+        {"op": "add", "path": "/module/internal/count", "value": 11},
+    ]
+
+
+def mutate(values, rnd):
+    node = values
+    for _ in range(rnd.randint(0, 4)):
+        if isinstance(node, dict) and node:
+            child = node[rnd.choice(sorted(node))]
+        elif isinstance(node, list) and node:
+            child = node[rnd.randrange(len(node))]
+        else:
+            break
+        if not isinstance(child, (dict, list)):
+            break
+        node = child
+
+    action = rnd.random()
+    if isinstance(node, dict):
+        key = rnd.choice(sorted(node) + ["new"])
+        if action < 0.3 and key in node:
+            del node[key]
+        elif action < 0.6:
+            node[key] = rnd.randint(0, 3)
+        else:
+            node[key] = {"k": [rnd.randint(0, 3)]}
+    elif action < 0.5:
+        node.append(rnd.randint(0, 3))
+    elif node:
+        node.pop(0)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_tracked_changes_match_full_diff(seed):
+    rnd = random.Random(seed)
+    original = sample_values()
+
+    values = cow_values(original)
+    for _ in range(rnd.randint(1, 5)):
+        mutate(values, rnd)
+
+    expected = list(
+        diff(sample_values(), copy.deepcopy(values), dot_notation=False, expand=True)
+    )
+    assert list(tracked_changes(values, dirty_paths(values))) == expected
@@ -0,0 +1,61 @@
+from deckhouse import hook
+from deckhouse.dispatch import coalesce_events
+
+
+def event(binding, n):
+    return {
+        "binding": binding,
+        "type": "Event",
+        "watchEvent": "Modified",
+        "object": {"n": n},
+        "snapshots": {binding: [{"n": n}]},
+    }
+
+
+def test_consecutive_events_are_coalesced():
+    contexts = [
+        {"binding": "pods", "type": "Synchronization", "snapshots": {}},
+        event("pods", 1),
+        event("pods", 2),
+        event("pods", 3),
+        event("nodes", 4),
+        {"binding": "cron", "type": "Schedule", "snapshots": {}},
+        event("nodes", 5),
+    ]
+
+    coalesced = list(coalesce_events(contexts))
+
+    assert [ctx["binding"] for ctx in coalesced] == [
+        "pods",
+        "pods",
+        "nodes",
+        "cron",
+        "nodes",
+    ]
+    assert "events" not in coalesced[0]
+
+    pods = coalesced[1]
+    assert pods["snapshots"] == {"pods": [{"n": 3}]}
+    assert pods["object"] == {"n": 3}
+    assert [e["object"]["n"] for e in pods["events"]] == [1, 2, 3]
+    assert all("snapshots" not in e for e in pods["events"])
+
+    assert [e["object"]["n"] for e in coalesced[2]["events"]] == [4]
+    assert [e["object"]["n"] for e in coalesced[4]["events"]] == [5]
+
+
+def test_hook_is_called_once_per_coalesced_events():
+    calls = []
+
+    def main(ctx):
+        calls.append(len(ctx.binding_context.get("events", [])))
+        ctx.metrics.collect(
+            {"name": "events", "add": len(ctx.binding_context["events"])}
+        )
+
+    contexts = [event("pods", n) for n in range(10)]
+
+    outputs = hook.testrun(main, contexts, coalesce=True)
+
+    assert calls == [10]
+    assert outputs.metrics.data == [{"name": "events", "add": 10}]
@@ -0,0 +1,131 @@
+import json
+
+from deckhouse import hook
+from deckhouse.fingerprints import Fingerprints
+
+calls = []
+
+
+def main(ctx):
+    binding = ctx.binding_context["binding"]
+    calls.append(binding)
+    ctx.metrics.gauge(f"{binding}_pods", len(ctx.snapshots.get("pods", [])))
+
+
+async def async_main(ctx):
+    main(ctx)
+
+
+def patch_values(ctx):
+    calls.append(ctx.binding_context["binding"])
+    ctx.values["pods"] = len(ctx.snapshots.get("pods", []))
+
+
+def _run(tmp_path, monkeypatch, binding_context, values=None, func=main, **kwargs):
+    context_path = tmp_path / "binding_context.json"
+    context_path.write_text(json.dumps(binding_context))
+    values_path = tmp_path / "values.json"
+    values_path.write_text(json.dumps(values or {}))
+    monkeypatch.setenv("BINDING_CONTEXT_PATH", str(context_path))
+    monkeypatch.setenv("VALUES_PATH", str(values_path))
+    monkeypatch.setenv("METRICS_PATH", str(tmp_path / "metrics.json"))
+    monkeypatch.setenv("DECKHOUSE_HOOK_STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.delenv("CONFIG_VALUES_PATH", raising=False)
+    (tmp_path / "metrics.json").write_text("")
+    calls.clear()
+
+    hook.run(func, config="configVersion: v1", skip_unchanged=True, **kwargs)
+
+    metrics = [
+        json.loads(line)
+        for line in (tmp_path / "metrics.json").read_text().splitlines()
+    ]
+    return list(calls), [(m["name"], m["value"]) for m in metrics]
+
+
+def _schedule(binding, pods):
+    return {
+        "binding": binding,
+        "type": "Schedule",
+        "snapshots": {"pods": [{"filterResult": p} for p in pods]},
+    }
+
+
+def test_unchanged_contexts_are_skipped(tmp_path, monkeypatch):
+    contexts = [_schedule("every_minute", ["a"]), _schedule("hourly", ["b"])]
+
+    assert _run(tmp_path, monkeypatch, contexts)[0] == ["every_minute", "hourly"]
+    # outputs of skipped contexts are written again
+    assert _run(tmp_path, monkeypatch, contexts) == (
+        [],
+        [("every_minute_pods", 1), ("hourly_pods", 1)],
+    )
+
+    contexts[1] = _schedule("hourly", ["b", "c"])
+    assert _run(tmp_path, monkeypatch, contexts) == (
+        ["hourly"],
+        [("every_minute_pods", 1), ("hourly_pods", 2)],
+    )
+    assert _run(tmp_path, monkeypatch, contexts, values={"a": 1})[0] == [
+        "every_minute",
+        "hourly",
+    ]
+
+
+def test_unchanged_contexts_are_skipped_concurrently(tmp_path, monkeypatch):
+    contexts = [_schedule("every_minute", ["a"]), _schedule("hourly", ["b"])]
+
+    _run(tmp_path, monkeypatch, contexts, func=async_main, concurrent=True)
+    contexts[0] = _schedule("every_minute", [])
+    assert _run(tmp_path, monkeypatch, contexts, func=async_main, concurrent=True) == (
+        ["every_minute"],
+        [("every_minute_pods", 0), ("hourly_pods", 1)],
+    )
+
+
+def test_contexts_patching_values_are_not_skipped(tmp_path, monkeypatch):
+    contexts = [_schedule("every_minute", ["a"])]
+
+    assert _run(tmp_path, monkeypatch, contexts, func=patch_values)[0] == [
+        "every_minute"
+    ]
+    # the patch was not applied, the context runs again to emit it
+    assert _run(tmp_path, monkeypatch, contexts, func=patch_values)[0] == [
+        "every_minute"
+    ]
+    assert _run(tmp_path, monkeypatch, contexts, values={"pods": 1}, func=main)[0] == [
+        "every_minute"
+    ]
+    assert _run(tmp_path, monkeypatch, contexts, values={"pods": 1}, func=main)[0] == []
+
+
+def test_events_are_not_skipped(tmp_path, monkeypatch):
+    contexts = [{"binding": "pods", "type": "Event", "snapshots": {}}]
+
+    assert _run(tmp_path, monkeypatch, contexts)[0] == ["pods"]
+    assert _run(tmp_path, monkeypatch, contexts)[0] == ["pods"]
+
+
+def test_changed_code_discards_fingerprints(tmp_path):
+    path = str(tmp_path / "state.json")
+    context = _schedule("every_minute", ["a"])
+
+    fingerprints = Fingerprints(path, "v1")
+    assert not fingerprints.unchanged(context, {}, {})
+    fingerprints.record(context, hook.testrun(main, [context]), values_patched=False)
+    fingerprints.save()
+
+    assert Fingerprints(path, "v1").unchanged(context, {}, {})
+    assert not Fingerprints(path, "v2").unchanged(context, {}, {})
+
+
+def test_unwritable_state_dir_does_not_fail_the_hook(tmp_path, monkeypatch):
+    contexts = [_schedule("every_minute", ["a"])]
+    # permissions do not stop root, a file does
+    (tmp_path / "state").write_text("")
+
+    assert _run(tmp_path, monkeypatch, contexts) == (
+        ["every_minute"],
+        [("every_minute_pods", 1)],
+    )
+    assert _run(tmp_path, monkeypatch, contexts)[0] == ["every_minute"]
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from deckhouse import hook
+
+# sys.exit in hook.run stops the script, so loaded modules are listed at exit
+HOOK = textwrap.dedent(
+    """
+    import atexit
+    import json
+    import sys
+
+    def loaded():
+        prefixes = ("deckhouse", "dictdiffer")
+        print(json.dumps(sorted(m for m in sys.modules if m.startswith(prefixes))))
+
+    atexit.register(loaded)
+
+    from deckhouse import hook
+
+    hook.run(lambda ctx: None, config="configVersion: v1")
+    """
+)
+
+
+def test_config_is_printed_without_importing_the_library(tmp_path):
+    script = tmp_path / "hook.py"
+    script.write_text(HOOK)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    proc = subprocess.run(
+        [sys.executable, str(script), "--config"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": root},
+    )
+
+    config, modules = proc.stdout.splitlines()
+    assert config == "configVersion: v1"
+    assert json.loads(modules) == ["deckhouse", "deckhouse.hook"]
+
+
+def test_async_function_runs_on_a_shared_event_loop():
+    loops = []
+
+    async def main(ctx):
+        await asyncio.sleep(0)
+        loops.append(asyncio.get_running_loop())
+        ctx.values["binding"] = ctx.binding_context["binding"]
+        ctx.metrics.counter("runs")
+
+    output = hook.testrun(main, [{"binding": "a"}, {"binding": "b"}])
+
+    assert len(loops) == 2 and loops[0] is loops[1]
+    assert output.values == {"binding": "b"}
+    assert output.metrics.data == [{"name": "runs", "action": "add", "value": 2}]
+
+
+def _concurrent_hook(running, peak):
+    async def main(ctx):
+        index = ctx.binding_context["index"]
+        running.append(index)
+        peak.append(len(running))
+        # later contexts finish first
+        await asyncio.sleep(0.01 * (3 - index))
+        running.remove(index)
+        ctx.metrics.counter("runs", group="g")
+        ctx.metrics.histogram("duration", index, buckets=(1, 2))
+        ctx.metrics.gauge("last", index)
+        ctx.kubernetes.create({"kind": "ConfigMap", "metadata": {"name": str(index)}})
+        ctx.output.validations.allow(str(index))
+        ctx.values.setdefault("indexes", {})[str(index)] = index
+
+    return main
+
+
+def test_concurrent_contexts_are_merged_in_order():
+    contexts = [{"binding": "b", "index": i} for i in range(3)]
+    running, peak = [], []
+    concurrent = hook.testrun(
+        _concurrent_hook(running, peak),
+        contexts,
+        initial_values={"indexes": {}},
+        concurrent=True,
+    )
+    sequential = hook.testrun(
+        _concurrent_hook([], []), contexts, initial_values={"indexes": {}}
+    )
+
+    assert max(peak) == 3
+    for name in ("metrics", "kube_operations", "values_patches", "validations"):
+        assert getattr(concurrent, name).data == getattr(sequential, name).data, name
+    assert concurrent.values == sequential.values == {"indexes": {"2": 2}}
+    assert [p["value"] for p in concurrent.metrics.data[:1]] == [3]
+
+
+def test_concurrent_contexts_run_synchronous_function():
+    def main(ctx):
+        ctx.values["binding"] = ctx.binding_context["binding"]
+
+    contexts = [{"binding": "a"}, {"binding": "b"}]
+    output = hook.testrun(main, contexts, concurrent=True)
+
+    assert output.values == {"binding": "b"}
+    assert (
+        output.values_patches.data == hook.testrun(main, contexts).values_patches.data
+    )
@@ -93,3 +93,120 @@ def test_k8s_merge_patch():
     assert len(outputs.kube_operations.data) == 1
     got = outputs.kube_operations.data[0]
     assert got == expected_patch
+
+
+def test_merge_patches_are_coalesced():
+    def main(ctx: hook.Context):
+        for replicas in (1, 2):
+            ctx.kubernetes.merge_patch(
+                kind="Deployment",
+                namespace="default",
+                name="nginx",
+                patch={
+                    "spec": {"replicas": replicas},
+                    "metadata": {"labels": {"a": "b"}},
+                },
+            )
+        ctx.kubernetes.delete(kind="Secret", namespace="default", name="other")
+        ctx.kubernetes.merge_patch(
+            kind="Deployment",
+            namespace="default",
+            name="nginx",
+            patch={"metadata": {"labels": {"a": None, "c": "d"}}},
+        )
+        ctx.kubernetes.merge_patch(
+            kind="Deployment",
+            namespace="default",
+            name="nginx",
+            patch={"spec": {"paused": True}},
+            subresource="status",
+        )
+
+    outputs = hook.testrun(main, coalesce_operations=True)
+
+    assert outputs.kube_operations.data == [
+        {
+            "operation": "MergePatch",
+            "kind": "Deployment",
+            "namespace": "default",
+            "name": "nginx",
+            "mergePatch": {
+                "spec": {"replicas": 2},
+                "metadata": {"labels": {"a": None, "c": "d"}},
+            },
+        },
+        {
+            "operation": "Delete",
+            "kind": "Secret",
+            "namespace": "default",
+            "name": "other",
+        },
+        {
+            "operation": "MergePatch",
+            "kind": "Deployment",
+            "namespace": "default",
+            "name": "nginx",
+            "mergePatch": {"spec": {"paused": True}},
+            "subresource": "status",
+        },
+    ]
+
+
+def test_created_and_deleted_objects_are_dropped():
+    def secret(name):
+        return {
+            "apiVersion": "v1",
+            "kind": "Secret",
+            "metadata": {"name": name, "namespace": "default"},
+        }
+
+    def main(ctx: hook.Context):
+        ctx.kubernetes.create(secret("strict"))
+        ctx.kubernetes.create_or_update(secret("existing"))
+        ctx.kubernetes.merge_patch("Secret", "default", "strict", {"data": {}})
+        ctx.kubernetes.delete("Secret", "default", "strict")
+        ctx.kubernetes.delete("Secret", "default", "existing")
+
+    outputs = hook.testrun(main, coalesce_operations=True)
+
+    assert outputs.kube_operations.data == [
+        {
+            "operation": "Delete",
+            "kind": "Secret",
+            "namespace": "default",
+            "name": "existing",
+        },
+    ]
+
+
+def test_dependent_operations_are_not_coalesced():
+    def main(ctx: hook.Context):
+        ctx.kubernetes.create({"kind": "Namespace", "metadata": {"name": "ns"}})
+        ctx.kubernetes.merge_patch("ConfigMap", "ns", "cm", {"data": {"a": "1"}})
+        ctx.kubernetes.merge_patch("Namespace", "", "ns", {"metadata": {"labels": {}}})
+        ctx.kubernetes.merge_patch("ConfigMap", "ns", "cm", {"data": {"b": "2"}})
+        ctx.kubernetes.delete("Namespace", "", "ns")
+        ctx.kubernetes.merge_patch("ConfigMap", "ns", "cm", {"data": None})
+        ctx.kubernetes.merge_patch("ConfigMap", "ns", "cm", {"data": {"c": "3"}})
+
+    outputs = hook.testrun(main, coalesce_operations=True)
+
+    assert [op["operation"] for op in outputs.kube_operations.data] == [
+        "Create",
+        "MergePatch",
+        "MergePatch",
+        "MergePatch",
+        "Delete",
+        "MergePatch",
+        "MergePatch",
+    ]
+
+
+def test_operations_are_not_coalesced_by_default():
+    def main(ctx: hook.Context):
+        for _ in range(3):
+            ctx.kubernetes.merge_patch("ConfigMap", "ns", "cm", {"data": {"a": "1"}})
+
+    outputs = hook.testrun(main)
+
+    assert len(outputs.kube_operations.data) == 3
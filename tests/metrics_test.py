@@ -0,0 +1,173 @@
+import pytest
+
+from deckhouse.metrics import MetricsCollector
+
+
+def test_counter_and_gauge_are_written_once_per_series():
+    metrics = MetricsCollector()
+    for i in range(1000):
+        metrics.counter("pods_total", labels={"ns": f"ns-{i % 2}"}, group="pods")
+        metrics.gauge("last_pod", i)
+
+    assert metrics.data == [
+        {
+            "name": "pods_total",
+            "action": "add",
+            "value": 500,
+            "group": "pods",
+            "labels": {"ns": "ns-0"},
+        },
+        {"name": "last_pod", "action": "set", "value": 999},
+        {
+            "name": "pods_total",
+            "action": "add",
+            "value": 500,
+            "group": "pods",
+            "labels": {"ns": "ns-1"},
+        },
+    ]
+
+
+def test_histogram_buckets():
+    metrics = MetricsCollector()
+    for value in [0.5, 1, 3, 30]:
+        metrics.histogram("size", value, labels={"kind": "Pod"}, buckets=(1, 10))
+
+    assert [(m["name"], m.get("labels"), m["value"]) for m in metrics.data] == [
+        ("size_bucket", {"kind": "Pod", "le": "1.0"}, 2),
+        ("size_bucket", {"kind": "Pod", "le": "10.0"}, 3),
+        ("size_bucket", {"kind": "Pod", "le": "+Inf"}, 4),
+        ("size_sum", {"kind": "Pod"}, 34.5),
+        ("size_count", {"kind": "Pod"}, 4),
+    ]
+    assert all(m["action"] == "set" for m in metrics.data)
+
+
+def test_series_updated_after_expire_are_written_after_it():
+    metrics = MetricsCollector()
+    metrics.gauge("g", 1, group="group")
+    metrics.counter("c", group="other")
+    metrics.expire("group")
+    metrics.gauge("g", 2, group="group")
+
+    assert metrics.data == [
+        {"name": "c", "action": "add", "value": 1, "group": "other"},
+        {"action": "expire", "group": "group"},
+        {"name": "g", "action": "set", "value": 2, "group": "group"},
+    ]
+
+
+def test_collected_sets_are_deduplicated():
+    metrics = MetricsCollector()
+    for i in range(3):
+        for pod in ["a", "b"]:
+            metrics.collect(
+                {"name": "up", "set": i, "labels": {"pod": pod, "ns": "d8"}}
+            )
+            metrics.collect({"name": "restarts", "add": 1, "labels": {"pod": pod}})
+        metrics.collect(
+            {
+                "name": "up",
+                "action": "set",
+                "value": 10,
+                "labels": {"ns": "d8", "pod": "a"},
+            }
+        )
+
+    assert metrics.data[:2] == [
+        {
+            "name": "up",
+            "action": "set",
+            "value": 10,
+            "labels": {"pod": "a", "ns": "d8"},
+        },
+        {"name": "restarts", "add": 1, "labels": {"pod": "a"}},
+    ]
+    sets = [m for m in metrics.data if m["name"] == "up"]
+    assert sets[1] == {"name": "up", "set": 2, "labels": {"pod": "b", "ns": "d8"}}
+    assert len(sets) == 2
+    assert len([m for m in metrics.data if m["name"] == "restarts"]) == 6
+
+
+def test_equal_labels_are_shared():
+    metrics = MetricsCollector()
+    metrics.collect({"name": "a", "set": 1, "labels": {"pod": "p", "ns": "d8"}})
+    metrics.collect({"name": "b", "set": 1, "labels": {"ns": "d8", "pod": "p"}})
+    metrics.gauge("c", 1, labels={"ns": "d8", "pod": "p"})
+
+    labels = [m["labels"] for m in metrics.data]
+    assert labels[0] is labels[1] is labels[2]
+
+
+def test_metric_kind_conflict():
+    metrics = MetricsCollector()
+    metrics.gauge("m", 1)
+    metrics.counter("c")
+    with pytest.raises(ValueError):
+        metrics.histogram("m", 1)
+    with pytest.raises(ValueError):
+        metrics.histogram("c", 1)
+    metrics.histogram("h", 1)
+    with pytest.raises(ValueError):
+        metrics.counter("h")
+
+
+def test_set_after_other_action_is_written_after_it():
+    metrics = MetricsCollector()
+    metrics.collect({"name": "x", "action": "set", "value": 1})
+    metrics.collect({"name": "x", "action": "add", "value": 1})
+    metrics.collect({"name": "x", "action": "set", "value": 3})
+    metrics.collect({"name": "x", "action": "set", "value": 4})
+
+    assert metrics.data == [
+        {"name": "x", "action": "set", "value": 1},
+        {"name": "x", "action": "add", "value": 1},
+        {"name": "x", "action": "set", "value": 4},
+    ]
+
+
+def test_counter_after_set_is_written_after_it():
+    metrics = MetricsCollector()
+    metrics.counter("c", 1)
+    metrics.collect({"name": "c", "action": "set", "value": 0})
+    metrics.counter("c", 2)
+    metrics.counter("c", 3)
+    metrics.gauge("c", 7)
+
+    assert metrics.data == [
+        {"name": "c", "action": "add", "value": 1},
+        {"name": "c", "action": "set", "value": 0},
+        {"name": "c", "action": "add", "value": 5},
+        {"name": "c", "action": "set", "value": 7},
+    ]
+
+
+def test_merge_aggregates_series_of_both_collectors():
+    first, second = MetricsCollector(), MetricsCollector()
+    first.counter("c", 2)
+    first.histogram("h", 1, buckets=(1,))
+    second.histogram("h", 2, buckets=(1,))
+    second.counter("c", 3)
+    second.gauge("g", 1)
+    second.expire("other")
+
+    first.merge(second)
+
+    assert first.data == [
+        {"name": "c", "action": "add", "value": 5},
+        {"name": "h_bucket", "action": "set", "value": 1, "labels": {"le": "1.0"}},
+        {"name": "h_bucket", "action": "set", "value": 2, "labels": {"le": "+Inf"}},
+        {"name": "h_sum", "action": "set", "value": 3},
+        {"name": "h_count", "action": "set", "value": 2},
+        {"name": "g", "action": "set", "value": 1},
+        {"action": "expire", "group": "other"},
+    ]
+
+
+def test_merge_rejects_histograms_with_different_buckets():
+    first, second = MetricsCollector(), MetricsCollector()
+    first.histogram("h", 1, buckets=(1,))
+    second.histogram("h", 1, buckets=(2,))
+
+    with pytest.raises(ValueError):
+        first.merge(second)
@@ -0,0 +1,105 @@
+import io
+import json
+
+import pytest
+
+from deckhouse import module
+
+
+def test_binding_context_is_read_incrementally(tmp_path, monkeypatch):
+    contexts = [
+        {
+            "binding": "pods",
+            "snapshots": {"pods": [{"name": f"pod-{i}"} for i in range(100)]},
+        },
+        {"binding": "nodes", "snapshots": {}},
+        {"binding": "schedule"},
+    ]
+    path = tmp_path / "binding_context.json"
+    path.write_text(json.dumps(contexts, indent=2), encoding="utf-8")
+    monkeypatch.setenv("BINDING_CONTEXT_PATH", str(path))
+    monkeypatch.setattr(module, "READ_CHUNK_SIZE", 16)
+
+    assert list(module.get_binding_context()) == contexts
+
+
+def test_binding_context_is_not_read_ahead():
+    class Source(io.StringIO):
+        read_size = 0
+
+        def read(self, size=-1):
+            chunk = super().read(size)
+            self.read_size += len(chunk)
+            return chunk
+
+    text = json.dumps([{"i": i, "payload": "x" * 1000} for i in range(100)])
+    source = Source(text)
+
+    items = module.iter_json_array(source, chunk_size=1024)
+    assert next(items)["i"] == 0
+    assert source.read_size < len(text) / 10
+    assert [item["i"] for item in items] == list(range(1, 100))
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "null"])
+def test_empty_binding_context(text):
+    assert not list(module.iter_json_array(io.StringIO(text)))
+
+
+@pytest.mark.parametrize("text", ["", "\n", '{"a": 1}'])
+def test_binding_context_must_be_array(text):
+    with pytest.raises(ValueError):
+        list(module.iter_json_array(io.StringIO(text)))
+
+
+@pytest.mark.parametrize(
+    "text", ['[{"a": 1} {"b": 2}]', '[{"a": 1},', '[{"a": 1}] []', "[1, 2"]
+)
+def test_malformed_binding_context(text):
+    with pytest.raises(json.JSONDecodeError):
+        list(module.iter_json_array(io.StringIO(text), chunk_size=2))
+
+
+def test_numbers_split_across_chunks():
+    assert list(module.iter_json_array(io.StringIO("[12345, 678]"), chunk_size=3)) == [
+        12345,
+        678,
+    ]
+
+
+def test_missing_binding_context_path(monkeypatch):
+    monkeypatch.delenv("BINDING_CONTEXT_PATH", raising=False)
+    assert not list(module.get_binding_context())
+
+
+def test_binding_context_multibyte_characters_split_across_chunks(
+    tmp_path, monkeypatch
+):
+    contexts = [{"binding": "описание", "snapshots": {"ключ": ["значение ✓"]}}]
+    path = tmp_path / "binding_context.json"
+    path.write_text(json.dumps(contexts, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setenv("BINDING_CONTEXT_PATH", str(path))
+    monkeypatch.setattr(module, "READ_CHUNK_SIZE", 1)
+
+    assert list(module.get_binding_context()) == contexts
+
+
+def test_values_are_parsed_from_mapped_file(tmp_path, monkeypatch):
+    values = {"module": {"описание": "сервис", "list": [1, 2.5, None, True]}}
+    path = tmp_path / "values.json"
+    path.write_text(json.dumps(values, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setenv("VALUES_PATH", str(path))
+    monkeypatch.setenv("CONFIG_VALUES_PATH", str(path))
+
+    assert module.get_values() == values
+    assert module.get_config() == values
+
+
+def test_empty_values_file_cannot_be_mapped(tmp_path, monkeypatch):
+    path = tmp_path / "values.json"
+    path.write_bytes(b"")
+
+    with module.mapped_file(str(path)) as buffer:
+        assert buffer == b""
+    with pytest.raises(ValueError):
+        module.load_json_file(str(path))
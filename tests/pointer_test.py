@@ -0,0 +1,60 @@
+import pytest
+
+from deckhouse import hook, pointer
+
+
+def test_get_and_exists():
+    doc = {"a": {"b/c": [{"d~": 1}]}, "": 2}
+
+    assert pointer.get(doc, "/a/b~1c/0/d~0") == 1
+    assert pointer.get(doc, ("a", "b/c", 0, "d~")) == 1
+    assert pointer.get(doc, "/") == 2
+    assert pointer.get(doc, "") is doc
+    assert pointer.get(doc, "/a/x", None) is None
+    assert pointer.exists(doc, "/a/b~1c/0")
+    assert not pointer.exists(doc, "/a/b~1c/1")
+    assert not pointer.exists(doc, "/a/b~1c/00")
+    assert not pointer.exists(doc, "/a/b~1c/0/d~0/e")
+    with pytest.raises(KeyError):
+        pointer.get(doc, "/a/x")
+    with pytest.raises(ValueError):
+        pointer.get(doc, "a")
+
+
+def test_set_and_delete():
+    doc = {"list": [1]}
+
+    pointer.set(doc, "/list/0", 0)
+    pointer.set(doc, "/list/-", 2)
+    pointer.set(doc, "/list/2", 3)
+    pointer.set(doc, "/a/b/c", 1, create=True)
+    with pytest.raises(KeyError):
+        pointer.set(doc, "/x/y", 1)
+    with pytest.raises(KeyError):
+        pointer.set(doc, "/list/5", 1)
+    assert doc == {"list": [0, 2, 3], "a": {"b": {"c": 1}}}
+
+    pointer.delete(doc, "/list/1")
+    pointer.delete(doc, "/a/b")
+    pointer.delete(doc, "/a/b", missing_ok=True)
+    with pytest.raises(KeyError):
+        pointer.delete(doc, "/a/b")
+    assert doc == {"list": [0, 3], "a": {}}
+
+
+def test_pointers_are_compiled_once():
+    assert pointer.compile_pointer("/a/0") is pointer.compile_pointer("/a/0")
+    assert pointer.compile_pointer(["a", 0]).path == "/a/0"
+
+
+def test_values_changed_by_pointer_are_patched():
+    def main(ctx):
+        pointer.set(ctx.values, "/module/internal/ca", "cert", create=True)
+        pointer.delete(ctx.values, "/module/replicas")
+
+    outputs = hook.testrun(main, initial_values={"module": {"replicas": 2}})
+
+    assert outputs.values_patches.data == [
+        {"op": "add", "path": "/module/internal", "value": {"ca": "cert"}},
+        {"op": "remove", "path": "/module/replicas"},
+    ]
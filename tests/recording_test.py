@@ -0,0 +1,115 @@
+import json
+import textwrap
+
+import pytest
+
+from deckhouse import hook, recording
+
+HOOK = textwrap.dedent(
+    """
+    def main(ctx):
+        secret = ctx.snapshots["secrets"][0]["filterResult"]
+        ctx.values["module"]["user"] = secret["user"]
+        ctx.metrics.gauge("secrets", len(ctx.snapshots["secrets"]))
+        # changes its input in place, as conversion hooks do
+        secret["generation"] = secret.get("generation", 0) + 1
+        ctx.metrics.gauge("generation", secret["generation"])
+        ctx.kubernetes.create({"kind": "ConfigMap", "data": {"password": "p"}})
+
+
+    def changed(ctx):
+        main(ctx)
+        ctx.metrics.gauge("changed", 1)
+    """
+)
+
+
+@pytest.fixture
+def recorded(tmp_path, monkeypatch):
+    hook_file = tmp_path / "hook.py"
+    hook_file.write_text(HOOK)
+    secret = {"filterResult": {"user": "admin", "password": "secret"}}
+    inputs = {
+        "BINDING_CONTEXT_PATH": [{"binding": "b", "snapshots": {"secrets": [secret]}}],
+        "VALUES_PATH": {"module": {}},
+        "CONFIG_VALUES_PATH": {"module": {"password": "secret"}},
+    }
+    for env, content in inputs.items():
+        path = tmp_path / env
+        path.write_text(json.dumps(content))
+        monkeypatch.setenv(env, str(path))
+    for env in ("METRICS_PATH", "KUBERNETES_PATCH_PATH", "VALUES_JSON_PATCH_PATH"):
+        monkeypatch.setenv(env, str(tmp_path / env))
+    monkeypatch.setenv(recording.RECORD_ENV, str(tmp_path / "records"))
+    monkeypatch.setenv(recording.REDACT_ENV, "password, token")
+    monkeypatch.setattr("sys.argv", ["hook.py"])
+
+    func = recording.load_hook(f"{hook_file}:main")
+    hook.run(func, config="configVersion: v1", coalesce=True)
+
+    (archive,) = (tmp_path / "records").iterdir()
+    return hook_file, archive
+
+
+def test_run_is_recorded_with_redaction(recorded):
+    hook_file, path = recorded
+    archive = recording.load(str(path))
+
+    assert archive["hook"] == {"file": str(hook_file), "function": "main"}
+    assert archive["options"]["coalesce"] is True
+    assert archive["seconds"] > 0
+    inputs = archive["inputs"]
+    secret = inputs["bindingContext"][0]["snapshots"]["secrets"][0]["filterResult"]
+    assert secret == {"user": "admin", "password": recording.REDACTED}
+    assert inputs["configValues"] == {"module": {"password": recording.REDACTED}}
+    assert archive["outputs"]["metrics"] == [
+        {"name": "secrets", "action": "set", "value": 1},
+        {"name": "generation", "action": "set", "value": 1},
+    ]
+    assert archive["outputs"]["kubernetes"][0]["object"]["data"] == {
+        "password": recording.REDACTED
+    }
+    assert archive["outputs"]["values_patches"] == [
+        {"op": "add", "path": "/module/user", "value": "admin"}
+    ]
+
+
+def test_replay_reports_no_differences_for_the_same_hook(recorded, capsys):
+    _, path = recorded
+    archive = recording.load(str(path))
+
+    result = recording.replay(
+        archive, recording.load_hook(archive["hook"]["file"] + ":main"), repeat=2
+    )
+
+    assert result["differences"] == []
+    assert result["seconds"] > 0 and result["peakBytes"] > 0
+
+    recording.main([str(path), "--repeat", "1"])
+    assert "DIFFERENCE" not in capsys.readouterr().out
+
+
+def test_replay_reports_differences_of_changed_hook(recorded, capsys):
+    hook_file, path = recorded
+
+    with pytest.raises(SystemExit) as exc:
+        recording.main([str(path), "--repeat", "1", "--hook", f"{hook_file}:changed"])
+
+    assert exc.value.code == 1
+    out = capsys.readouterr().out
+    assert (
+        "DIFFERENCE metrics: 2 recorded and 3 replayed payloads, the first difference at 2"
+        in out
+    )
+
+
+def test_runs_of_the_same_process_are_recorded_separately(tmp_path):
+    recorder = recording.Recorder(
+        str(tmp_path), {"file": "hook.py", "function": "main"}
+    )
+    output = hook.testrun(lambda ctx: None)
+
+    paths = {recorder.record([], {}, {}, {}, output, 0.1) for _ in range(3)}
+
+    assert len(paths) == 3 and None not in paths
+    assert len(list(tmp_path.iterdir())) == 3
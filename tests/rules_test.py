@@ -0,0 +1,114 @@
+import pytest
+
+from deckhouse import hook, rules
+
+RULES = [
+    {"path": "spec.nodeType", "required": True, "enum": ["CloudEphemeral", "Static"]},
+    {"path": "metadata.name", "pattern": r"^[a-z0-9-]{1,10}$"},
+    {"path": "spec.minPerZone", "minimum": 0, "maximum": 100},
+    {"path": "spec.taints.*.effect", "enum": ["NoSchedule"], "warning": True},
+    {"path": ("metadata", "labels", "app.kubernetes.io/name"), "required": True},
+    {
+        "predicate": lambda ng: ng["spec"].get("nodeType") != "Static"
+        or "minPerZone" not in ng["spec"],
+        "message": "spec.minPerZone is not allowed for Static node groups",
+    },
+]
+
+
+def _validate(obj, validator=RULES):
+    context = [{"review": {"request": {"object": obj}}}]
+    return hook.testrun(lambda ctx: rules.validate(ctx, validator), context).validations
+
+
+def _node_group(**spec):
+    return {
+        "metadata": {"name": "worker", "labels": {"app.kubernetes.io/name": "ng"}},
+        "spec": spec,
+    }
+
+
+def test_valid_object_is_allowed_with_warnings():
+    obj = _node_group(
+        nodeType="CloudEphemeral",
+        minPerZone=1,
+        taints=[{"effect": "NoSchedule"}, {"effect": "NoExecute"}],
+    )
+
+    assert _validate(obj).data == [
+        {
+            "allowed": True,
+            "warnings": ("spec.taints.1.effect must be one of 'NoSchedule'",),
+        }
+    ]
+
+
+def test_all_violations_are_reported():
+    obj = _node_group(nodeType="Static", minPerZone=101)
+    obj["metadata"] = {"name": "Worker"}
+
+    assert _validate(obj).data == [
+        {
+            "allowed": False,
+            "message": "; ".join(
+                [
+                    "metadata.name must match ^[a-z0-9-]{1,10}$",
+                    "spec.minPerZone must be less than or equal to 100",
+                    "metadata.labels.app.kubernetes.io/name is required",
+                    "spec.minPerZone is not allowed for Static node groups",
+                ]
+            ),
+        }
+    ]
+
+
+def test_value_checks():
+    validator = rules.Validator(
+        [
+            {"path": "a", "enum": [1, "x"]},
+            {"path": "b", "minimum": 1},
+            {"path": "c", "pattern": "^x"},
+            {"path": "d.0", "predicate": lambda v: v > 0, "message": "d is bad"},
+        ]
+    )
+
+    assert validator.check({"a": 1, "b": 1, "c": "xy", "d": [1]}) == ([], [])
+    assert validator.check({"a": True, "b": "1", "c": 1, "d": [0]}) == (
+        [
+            "a must be one of 1, 'x'",
+            "b must be a number",
+            "c must be a string",
+            "d is bad",
+        ],
+        [],
+    )
+    # not required values are checked only when present
+    assert validator.check({}) == ([], [])
+
+
+def test_rules_are_compiled_once():
+    assert rules.compile_rules(RULES) is rules.compile_rules(RULES)
+    assert rules.compile_rules(list(RULES)) is not rules.compile_rules(RULES)
+
+
+def test_validate_accepts_compiled_rules():
+    obj = _node_group(nodeType="Static", cloudInstances={})
+
+    assert _validate(obj, rules.compile_rules(list(RULES))).data == _validate(obj).data
+
+
+def test_compiled_rules_cache_is_bounded():
+    kept = rules.compile_rules(RULES)
+    for _ in range(rules.COMPILED_CACHE_SIZE * 3):
+        rules.compile_rules(list(RULES))
+        # recently used lists stay compiled
+        assert rules.compile_rules(RULES) is kept
+
+    assert len(rules._compiled) <= rules.COMPILED_CACHE_SIZE
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        rules.Validator([{"path": "a", "enmu": [1]}])
+    with pytest.raises(ValueError):
+        rules.Validator([{"enum": [1]}])
@@ -0,0 +1,88 @@
+from deckhouse import hook
+
+
+def pod(name, namespace, node):
+    return {
+        "object": {"metadata": {"name": name, "namespace": namespace}},
+        "filterResult": {"node": node, "phase": "Running"},
+    }
+
+
+binding_context = {
+    "binding": "pods",
+    "snapshots": {
+        "pods": [
+            pod("a", "default", "node-1"),
+            pod("b", "default", "node-2"),
+            pod("a", "kube-system", "node-1"),
+        ],
+        "nodes": [
+            {"filterResult": {"name": "node-1", "zone": "z1"}},
+            {"filterResult": {"name": "node-2", "zone": "z2"}},
+        ],
+    },
+}
+
+
+def run(func):
+    result = {}
+
+    def main(ctx: hook.Context):
+        result.update(func(ctx))
+
+    hook.testrun(main, [binding_context])
+    return result
+
+
+def test_snapshots_remain_dict():
+    result = run(
+        lambda ctx: {"pods": ctx.snapshots["pods"], "missing": ctx.snapshots.get("x")}
+    )
+
+    assert result["pods"] == binding_context["snapshots"]["pods"]
+    assert result["missing"] is None
+
+
+def test_lookups_by_name_and_namespace():
+    def main(ctx):
+        pods = ctx.snapshots.index("pods")
+        nodes = ctx.snapshots.index("nodes")
+        return {
+            "pod": pods.get("a", namespace="kube-system"),
+            "cluster-pod": pods.get("a"),
+            "by-name": pods.by_name("a"),
+            "by-namespace": pods.by_namespace("default"),
+            "node": nodes.get("node-2"),
+            "same-index": ctx.snapshots.index("pods") is pods,
+            "empty": len(ctx.snapshots.index("unknown")),
+        }
+
+    result = run(main)
+    pods = binding_context["snapshots"]["pods"]
+
+    assert result["pod"] is pods[2]
+    assert result["cluster-pod"] is None
+    assert result["by-name"] == [pods[0], pods[2]]
+    assert result["by-namespace"] == [pods[0], pods[1]]
+    assert result["node"]["filterResult"]["zone"] == "z2"
+    assert result["same-index"]
+    assert result["empty"] == 0
+
+
+def test_join_by_filter_result_key():
+    def main(ctx):
+        pods = ctx.snapshots.index("pods")
+        nodes = ctx.snapshots.index("nodes")
+        zones = {}
+        for node in nodes:
+            name = node["filterResult"]["name"]
+            zones[node["filterResult"]["zone"]] = len(pods.find("node", name))
+        return {
+            "zones": zones,
+            "groups": sorted(pods.group_by(lambda fr: fr["phase"])),
+        }
+
+    result = run(main)
+
+    assert result["zones"] == {"z1": 2, "z2": 1}
+    assert result["groups"] == ["Running"]
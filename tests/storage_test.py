@@ -0,0 +1,153 @@
+import json
+import os
+
+import pytest
+
+from deckhouse import hook
+from deckhouse.storage import FileStorage, SpillList
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+def test_payloads_are_appended(tmp_path, atomic):
+    path = str(tmp_path / "out.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"existing":true}\n')
+    os.chmod(path, 0o640)
+
+    with FileStorage(path, atomic=atomic, fsync=True) as storage:
+        storage.write({"a": 1})
+        storage.write({"b": 2})
+
+    assert read_lines(path) == [{"existing": True}, {"a": 1}, {"b": 2}]
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["out.json"]
+
+
+def test_payloads_are_written_at_once(tmp_path):
+    path = str(tmp_path / "out.json")
+    with FileStorage(path) as storage:
+        for i in range(1000):
+            storage.write({"i": i})
+        assert not os.path.exists(path)
+
+    assert len(read_lines(path)) == 1000
+
+
+def test_atomic_storage_writes_nothing_on_error(tmp_path):
+    path = str(tmp_path / "out.json")
+
+    with pytest.raises(RuntimeError):
+        with FileStorage(path, atomic=True) as storage:
+            storage.write({"a": 1})
+            raise RuntimeError("crash")
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_atomic_output_flush(tmp_path, monkeypatch):
+    for env in ("METRICS_PATH", "KUBERNETES_PATCH_PATH", "VALUES_JSON_PATCH_PATH"):
+        monkeypatch.setenv(env, str(tmp_path / env))
+
+    def main(ctx):
+        ctx.metrics.collect({"name": "m", "set": 1})
+        ctx.values["a"] = 1
+
+    outputs = hook.testrun(main)
+    outputs.flush(atomic=True, fsync=True)
+
+    assert read_lines(tmp_path / "METRICS_PATH") == [{"name": "m", "set": 1}]
+    assert read_lines(tmp_path / "KUBERNETES_PATCH_PATH") == []
+    assert read_lines(tmp_path / "VALUES_JSON_PATCH_PATH") == [
+        {"op": "add", "path": "/a", "value": 1}
+    ]
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+def test_spilled_payloads_are_copied(tmp_path, atomic):
+    path = str(tmp_path / "out.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"existing":true}\n')
+    spilled = []
+    data = SpillList(2, on_spill=lambda: spilled.append(len(data.memory)))
+
+    data.extend({"n": i} for i in range(5))
+
+    assert spilled == [2, 2]
+    assert len(data) == 5
+    assert data == [{"n": i} for i in range(5)]
+    assert data[-1] == {"n": 4}
+    with FileStorage(path, atomic=atomic) as storage:
+        data.dump(storage)
+        storage.write({"last": True})
+
+    assert read_lines(path) == [{"existing": True}] + list(data) + [{"last": True}]
+    assert storage.written == os.path.getsize(path) - len('{"existing":true}\n')
+
+
+def test_spilled_payloads_are_indexed_without_reading_others(monkeypatch):
+    data = SpillList(3)
+    data.extend({"n": i, "s": "ü" * i} for i in range(10))
+    monkeypatch.setattr(SpillList, "__iter__", lambda self: pytest.fail("iterated"))
+
+    assert [data[i]["n"] for i in range(10)] == list(range(10))
+    assert data[4] == {"n": 4, "s": "ü" * 4}
+    assert data[-10] == {"n": 0, "s": ""}
+    assert [p["n"] for p in data[2:8:2]] == [2, 4, 6]
+    with pytest.raises(IndexError):
+        data[10]
+    with pytest.raises(IndexError):
+        data[-11]
+
+
+def test_spilled_output_equals_in_memory_output(tmp_path, monkeypatch):
+    def main(ctx):
+        n = ctx.binding_context["n"]
+        for i in range(10):
+            ctx.kubernetes.delete("Pod", "default", f"pod-{n}-{i}")
+            ctx.metrics.counter("pods", labels={"i": str(i % 3)})
+            ctx.metrics.gauge("last", n)
+            ctx.metrics.histogram("size", i, buckets=(2, 5))
+            ctx.metrics.collect({"name": "raw", "add": 1})
+        ctx.values[f"n{n % 4}"] = n
+
+    contexts = [{"n": n} for n in range(10)]
+    outputs = {}
+    for threshold in (None, 3):
+        for env in ("METRICS_PATH", "KUBERNETES_PATCH_PATH", "VALUES_JSON_PATCH_PATH"):
+            monkeypatch.setenv(env, str(tmp_path / f"{env}-{threshold}"))
+        output = hook.testrun(main, contexts, spill_threshold=threshold)
+        output.flush()
+        outputs[threshold] = output
+
+    assert outputs[3].kube_operations.data == outputs[None].kube_operations.data
+    assert read_lines(tmp_path / "KUBERNETES_PATCH_PATH-3") == read_lines(
+        tmp_path / "KUBERNETES_PATCH_PATH-None"
+    )
+
+    def values_state(path):
+        # patches of top-level keys only, spilled patches are not compacted
+        return {p["path"]: p["value"] for p in read_lines(path)}
+
+    assert values_state(tmp_path / "VALUES_JSON_PATCH_PATH-3") == values_state(
+        tmp_path / "VALUES_JSON_PATCH_PATH-None"
+    )
+
+    def metrics_state(path):
+        state = {}
+        for m in read_lines(path):
+            key = (m["name"], json.dumps(m.get("labels"), sort_keys=True))
+            if "add" in m or m.get("action") == "add":
+                state[key] = state.get(key, 0) + m.get("add", m.get("value"))
+            else:
+                state[key] = m["value"]
+        return state
+
+    assert metrics_state(tmp_path / "METRICS_PATH-3") == metrics_state(
+        tmp_path / "METRICS_PATH-None"
+    )
+    assert len(outputs[3].metrics.data) > len(outputs[None].metrics.data)
@@ -0,0 +1,89 @@
+import json
+
+from deckhouse import hook
+from deckhouse.trace import Trace
+
+
+def _hook_env(tmp_path, monkeypatch, binding_context):
+    context_path = tmp_path / "binding_context.json"
+    context_path.write_text(json.dumps(binding_context), encoding="utf-8")
+    monkeypatch.setenv("BINDING_CONTEXT_PATH", str(context_path))
+    monkeypatch.setenv("METRICS_PATH", str(tmp_path / "metrics.json"))
+    monkeypatch.setenv("VALUES_JSON_PATCH_PATH", str(tmp_path / "values.json"))
+    for env in ("VALUES_PATH", "CONFIG_VALUES_PATH", "KUBERNETES_PATCH_PATH"):
+        monkeypatch.delenv(env, raising=False)
+
+
+def _size(line):
+    return len(line.encode("utf-8")) + 1
+
+
+def _main(ctx):
+    ctx.values["n"] = ctx.binding_context["n"]
+    ctx.metrics.gauge("n", ctx.binding_context["n"])
+
+
+def test_phases_are_timed_per_binding_context():
+    trace = Trace()
+
+    hook.testrun(_main, [{"binding": "a", "n": 1}, {"n": 2}], trace=trace)
+
+    assert [c["binding"] for c in trace.contexts] == ["a", ""]
+    for context in trace.contexts:
+        assert list(context["phases"]) == ["read", "context", "hook", "values"]
+    assert list(trace.phases) == ["setup", "compact"]
+
+
+def test_trace_file(tmp_path, monkeypatch):
+    _hook_env(tmp_path, monkeypatch, [{"n": 1}])
+    monkeypatch.setenv("DECKHOUSE_HOOK_TRACE", str(tmp_path / "trace.log"))
+
+    hook.run(_main, config="configVersion: v1")
+    hook.run(_main, config="configVersion: v1")
+
+    lines = (tmp_path / "trace.log").read_text().splitlines()
+    assert len(lines) == 2
+    report = json.loads(lines[0])
+    metrics = (tmp_path / "metrics.json").read_text().splitlines()[0]
+    patches = (tmp_path / "values.json").read_text().splitlines()[0]
+    assert list(report["phases"]) == ["input", "setup", "compact", "flush"]
+    assert report["outputs"] == {
+        "METRICS_PATH": {"payloads": 1, "bytes": _size(metrics)},
+        "VALUES_JSON_PATCH_PATH": {"payloads": 1, "bytes": _size(patches)},
+    }
+    assert report["seconds"] >= sum(report["phases"].values())
+
+
+def test_trace_metrics(tmp_path, monkeypatch):
+    _hook_env(
+        tmp_path, monkeypatch, [{"binding": "a", "n": 1}, {"binding": "a", "n": 2}]
+    )
+    monkeypatch.setenv("DECKHOUSE_HOOK_TRACE", "metrics")
+
+    hook.run(_main, config="configVersion: v1")
+
+    lines = (tmp_path / "metrics.json").read_text().splitlines()
+    metrics = [json.loads(line) for line in lines]
+    assert metrics[0] == {"name": "n", "action": "set", "value": 2}
+    assert metrics[1] == {"action": "expire", "group": "hook_trace"}
+    series = {
+        (m["name"], tuple(sorted(m.get("labels", {}).items()))): m["value"]
+        for m in metrics[2:]
+    }
+    assert series[("hook_trace_binding_contexts", ())] == 2
+    assert ("hook_trace_phase_seconds", (("binding", "a"), ("phase", "hook"))) in series
+    assert ("hook_trace_phase_seconds", (("binding", ""), ("phase", "flush"))) in series
+    assert series[("hook_trace_output_payloads", (("output", "METRICS_PATH"),))] == 1
+
+
+def test_trace_failures_do_not_fail_the_hook(tmp_path, monkeypatch):
+    _hook_env(tmp_path, monkeypatch, [{"n": 1}])
+    monkeypatch.setenv("DECKHOUSE_HOOK_TRACE", str(tmp_path / "missing" / "trace.log"))
+
+    hook.run(_main, config="configVersion: v1")
+
+    lines = (tmp_path / "metrics.json").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"name": "n", "action": "set", "value": 1}
+    ]
+    assert not (tmp_path / "missing").exists()
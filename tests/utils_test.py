@@ -0,0 +1,167 @@
+import pytest
+
+from deckhouse import hook
+from deckhouse.utils import BaseConversionHook, conversion
+
+
+class NodeGroupConversion(BaseConversionHook):
+    def alpha1_to_alpha2(self, o: dict):
+        if o["metadata"]["name"].startswith("bad"):
+            return f"cannot convert {o['metadata']['name']}", None
+        o["apiVersion"] = "deckhouse.io/v1alpha2"
+        o["spec"]["converted"] = True
+        return None, o
+
+
+def _binding_context(names):
+    objects = []
+    for name in names:
+        version = "v1alpha2" if name.startswith("new") else "v1alpha1"
+        objects.append(
+            {
+                "apiVersion": f"deckhouse.io/{version}",
+                "metadata": {"name": name},
+                "spec": {},
+            }
+        )
+    return [
+        {
+            "binding": "alpha1_to_alpha2",
+            "fromVersion": "deckhouse.io/v1alpha1",
+            "toVersion": "deckhouse.io/v1alpha2",
+            "review": {"request": {"objects": objects}},
+        }
+    ]
+
+
+def _convert(names, **kwargs):
+    out = hook.testrun(
+        lambda ctx: NodeGroupConversion(ctx).run(**kwargs),
+        _binding_context(names),
+    )
+    return out.conversions.data[0]
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parallel_conversion_keeps_order(executor):
+    names = [f"ng-{i}" if i % 3 else f"new-{i}" for i in range(50)]
+
+    converted = _convert(names, workers=4, executor=executor)["convertedObjects"]
+
+    assert [o["metadata"]["name"] for o in converted] == names
+    assert all(o["apiVersion"] == "deckhouse.io/v1alpha2" for o in converted)
+    assert [o["spec"].get("converted") for o in converted] == [
+        None if n.startswith("new") else True for n in names
+    ]
+    assert converted == _convert(names)["convertedObjects"]
+
+
+def test_parallel_conversion_aggregates_errors():
+    names = ["ng-0", "bad-1", "ng-2", "bad-3"]
+
+    assert _convert(names, workers=2) == {
+        "failedMessage": "cannot convert bad-1;cannot convert bad-3"
+    }
+
+
+def test_passed_through_objects_are_not_dispatched():
+    calls = []
+
+    class Conversion(NodeGroupConversion):
+        def alpha1_to_alpha2(self, o):
+            calls.append(o["metadata"]["name"])
+            return super().alpha1_to_alpha2(o)
+
+    hook.testrun(
+        lambda ctx: Conversion(ctx).run(workers=2),
+        _binding_context(["new-0", "ng-1", "new-2", "ng-3"]),
+    )
+
+    assert sorted(calls) == ["ng-1", "ng-3"]
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        _convert(["ng-0"], workers=2, executor="fiber")
+
+
+class MultiVersionConversion(BaseConversionHook):
+    @conversion("example.io/v1", "example.io/v2")
+    def v1_to_v2(self, o):
+        o["spec"]["hops"].append("v1->v2")
+        return None, o
+
+    @conversion("example.io/v2", "example.io/v3")
+    def v2_to_v3(self, o):
+        if o["metadata"]["name"] == "bad":
+            return "cannot convert bad", None
+        o["spec"]["hops"].append("v2->v3")
+        return None, o
+
+    @conversion("example.io/v3", "example.io/v4")
+    def v3_to_v4(self, o):
+        o["spec"]["hops"].append("v3->v4")
+        return None, o
+
+    @conversion("example.io/v1", "example.io/v4")
+    def v1_to_v4(self, o):
+        o["spec"]["hops"].append("v1->v4")
+        return None, o
+
+
+def _multi_version_context(objects, to_version):
+    return [
+        {
+            "binding": "any_conversion",
+            "fromVersion": "example.io/v1",
+            "toVersion": to_version,
+            "review": {
+                "request": {
+                    "objects": [
+                        {
+                            "apiVersion": f"example.io/{version}",
+                            "metadata": {"name": name},
+                            "spec": {"hops": []},
+                        }
+                        for name, version in objects
+                    ]
+                }
+            },
+        }
+    ]
+
+
+def test_conversion_goes_through_shortest_chain():
+    out = hook.testrun(
+        lambda ctx: MultiVersionConversion(ctx).run(),
+        _multi_version_context(
+            [("a", "v1"), ("b", "v2"), ("c", "v3"), ("d", "v4")], "example.io/v4"
+        ),
+    )
+
+    converted = out.conversions.data[0]["convertedObjects"]
+    assert [o["apiVersion"] for o in converted] == ["example.io/v4"] * 4
+    assert [o["spec"]["hops"] for o in converted] == [
+        ["v1->v4"],
+        ["v2->v3", "v3->v4"],
+        ["v3->v4"],
+        [],
+    ]
+
+
+def test_conversion_chain_errors():
+    out = hook.testrun(
+        lambda ctx: MultiVersionConversion(ctx).run(),
+        _multi_version_context([("bad", "v1"), ("a", "v1")], "example.io/v3"),
+    )
+    assert out.conversions.data == [{"failedMessage": "cannot convert bad"}]
+
+    out = hook.testrun(
+        lambda ctx: MultiVersionConversion(ctx).run(),
+        _multi_version_context([("a", "v4")], "example.io/v1"),
+    )
+    assert out.conversions.data == [
+        {
+            "failedMessage": "Internal error: no conversion from example.io/v4 to example.io/v1"
+        }
+    ]
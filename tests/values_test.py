@@ -1,6 +1,17 @@
+import copy
+import random
+
+import pytest
 from dotmap import DotMap
 
 from deckhouse import hook
+from deckhouse.values import (
+    ARRAY_MINIMAL,
+    ValuesPatchesCollector,
+    apply_json_patch,
+    array_item_patches,
+    compact_json_patches,
+)
 
 
 def test_value_change_is_stored():
@@ -163,3 +174,170 @@ def test_internal_patch():
             "value": "THE ARRAY IS HERE",
         },
     ]
+
+
+def test_patches_are_compacted_across_binding_contexts():
+    def main(ctx):
+        ctx.values.a = 42
+        ctx.values.b.append(ctx.binding_context["n"])
+
+    initial_values = DotMap({"a": 33, "b": [1]})
+    binding_context = [{"n": 2}, {"n": 3}, {"n": 4}]
+    outputs = hook.testrun(main, binding_context, initial_values=initial_values)
+
+    assert outputs.values_patches.data == [
+        {"op": "add", "path": "/a", "value": 42},
+        {"op": "remove", "path": "/b"},
+        {"op": "add", "path": "/b", "value": [1, 4]},
+    ]
+
+
+def test_compaction_drops_added_then_removed_paths():
+    patches = [
+        {"op": "add", "path": "/x", "value": {"y": 1}},
+        {"op": "add", "path": "/x/z", "value": 2},
+        {"op": "add", "path": "/a/b", "value": 1},
+        {"op": "remove", "path": "/x"},
+        {"op": "remove", "path": "/a/b"},
+        {"op": "remove", "path": "/a/c"},
+    ]
+    collector = ValuesPatchesCollector({"a": {"c": 1}})
+    for patch in patches:
+        collector.collect(patch)
+
+    assert collector.compact() == 5
+    assert collector.data == [{"op": "remove", "path": "/a/c"}]
+
+
+def test_compaction_keeps_array_index_patches_in_place():
+    patches = [
+        {"op": "add", "path": "/a/x", "value": 1},
+        {"op": "add", "path": "/a/x", "value": 2},
+        {"op": "add", "path": "/l/0", "value": 1},
+        {"op": "add", "path": "/a/x", "value": 3},
+        {"op": "remove", "path": "/l/0"},
+        {"op": "remove", "path": "/a/x"},
+    ]
+
+    assert compact_json_patches(patches, {"a": {}, "l": []}) == [
+        {"op": "add", "path": "/a/x", "value": 2},
+        {"op": "add", "path": "/l/0", "value": 1},
+        {"op": "add", "path": "/a/x", "value": 3},
+        {"op": "remove", "path": "/l/0"},
+        {"op": "remove", "path": "/a/x"},
+    ]
+
+
+def test_minimal_array_patches():
+    def main(ctx):
+        ctx.values["hosts"][2500] = "changed"
+        ctx.values["hosts"].insert(0, "first")
+        ctx.values["hosts"].pop()
+        ctx.values["small"] = [3, 2, 1]
+
+    initial_values = {"hosts": [f"host-{i}" for i in range(5000)], "small": [1, 2, 3]}
+    outputs = hook.testrun(
+        main, initial_values=initial_values, array_mode=ARRAY_MINIMAL
+    )
+
+    assert outputs.values_patches.data == [
+        {"op": "add", "path": "/hosts/0", "value": "first"},
+        {"op": "remove", "path": "/hosts/2501"},
+        {"op": "add", "path": "/hosts/2501", "value": "changed"},
+        {"op": "remove", "path": "/hosts/5000"},
+        {"op": "remove", "path": "/small"},
+        {"op": "add", "path": "/small", "value": [3, 2, 1]},
+    ]
+
+
+def test_minimal_array_patches_align_items_by_array_key():
+    def main(ctx):
+        nodes = ctx.values["nodes"]
+        nodes.insert(1, {"name": "x", "ready": True})
+        nodes[2]["ready"] = False
+
+    initial_values = {"nodes": [{"name": f"n{i}", "ready": True} for i in range(3)]}
+    outputs = hook.testrun(
+        main,
+        initial_values=initial_values,
+        array_mode=ARRAY_MINIMAL,
+        array_key=lambda node: node["name"],
+    )
+
+    assert outputs.values_patches.data == [
+        {"op": "add", "path": "/nodes/1", "value": {"name": "x", "ready": True}},
+        {"op": "remove", "path": "/nodes/2"},
+        {"op": "add", "path": "/nodes/2", "value": {"name": "n1", "ready": False}},
+    ]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_minimal_array_patches_produce_new_array(seed):
+    rnd = random.Random(seed)
+    old = [{"name": f"n{rnd.randint(0, 9)}", "v": rnd.randint(0, 2)} for _ in range(20)]
+    new = [dict(v) for v in old]
+    for _ in range(rnd.randint(1, 6)):
+        i = rnd.randrange(len(new))
+        action = rnd.random()
+        if action < 0.3:
+            del new[i]
+        elif action < 0.6:
+            new.insert(i, {"name": "added", "v": 0})
+        else:
+            new[i]["v"] += 1
+
+    for key in (None, lambda item: item["name"]):
+        result = copy.deepcopy(old)
+        for patch in array_item_patches([], old, new, key):
+            index = int(patch["path"][1:])
+            if patch["op"] == "remove":
+                del result[index]
+            else:
+                result.insert(index, patch["value"])
+        assert result == new
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_minimal_array_patches_compose_across_binding_contexts(concurrent):
+    def main(ctx):
+        hosts = ctx.values["hosts"]
+        step = ctx.binding_context["step"]
+        if step == "append":
+            hosts.append("new")
+        elif step == "drop":
+            del hosts[0]
+        elif step == "change":
+            hosts[10] = "changed"
+
+    contexts = [{"step": s} for s in ("append", "append", "drop", "noop", "change")]
+    initial_values = {"hosts": [f"host-{i}" for i in range(30)]}
+    outputs = hook.testrun(
+        main,
+        contexts,
+        initial_values=initial_values,
+        array_mode=ARRAY_MINIMAL,
+        concurrent=concurrent,
+    )
+
+    values = copy.deepcopy(initial_values)
+    for patch in outputs.values_patches.data:
+        assert patch["path"] != "/hosts"
+        apply_json_patch(values, patch)
+    # every context changes the initial values, the last one wins
+    assert values == outputs.values
+    assert values["hosts"][10] == "changed" and len(values["hosts"]) == 30
+
+
+def test_patch_paths_are_escaped():
+    def main(ctx):
+        ctx.values["annotations"]["example.com/a~b"] = "x"
+        ctx.values["annotations"]["list/items"].append(2)
+
+    initial_values = {"annotations": {"list/items": [1]}}
+    outputs = hook.testrun(main, initial_values=initial_values)
+
+    assert outputs.values_patches.data == [
+        {"op": "remove", "path": "/annotations/list~1items"},
+        {"op": "add", "path": "/annotations/list~1items", "value": [1, 2]},
+        {"op": "add", "path": "/annotations/example.com~1a~0b", "value": "x"},
+    ]
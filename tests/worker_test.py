@@ -0,0 +1,99 @@
+import json
+import threading
+
+import pytest
+
+from deckhouse import hook, worker
+
+CONFIG = "configVersion: v1\nonStartup: 1"
+
+
+@pytest.fixture
+def serve(tmp_path, monkeypatch):
+    servers = []
+
+    def start(func):
+        socket_path = str(tmp_path / "hook.sock")
+        monkeypatch.setattr("sys.argv", ["hook.py", "--serve", socket_path])
+        monkeypatch.setattr(worker, "serve", _serve_in_thread(servers))
+        hook.run(func, config=CONFIG)
+        return socket_path
+
+    yield start
+
+    for server, thread in servers:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _serve_in_thread(servers):
+    def serve(socket_path, get_config, run):
+        server = worker.WorkerServer(socket_path, get_config, run)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        servers.append((server, thread))
+
+    return serve
+
+
+def invocation_env(tmp_path, monkeypatch, name, binding_context):
+    directory = tmp_path / name
+    directory.mkdir()
+    context_path = directory / "binding_context.json"
+    context_path.write_text(json.dumps(binding_context))
+    monkeypatch.setenv("BINDING_CONTEXT_PATH", str(context_path))
+    monkeypatch.setenv("METRICS_PATH", str(directory / "metrics.json"))
+    monkeypatch.delenv("VALUES_PATH", raising=False)
+    monkeypatch.delenv("CONFIG_VALUES_PATH", raising=False)
+    return directory
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_invocations_are_forwarded_to_worker(serve, tmp_path, monkeypatch, capsys):
+    def main(ctx):
+        n = ctx.binding_context["n"]
+        ctx.metrics.collect({"name": "run", "set": n, "labels": {"n": str(n)}})
+
+    socket_path = serve(main)
+
+    assert worker.forward(socket_path, ["shim", "--config"]) == 0
+    assert capsys.readouterr().out == CONFIG + "\n"
+
+    first = invocation_env(tmp_path, monkeypatch, "first", [{"n": 1}])
+    assert worker.forward(socket_path, ["shim"]) == 0
+    second = invocation_env(tmp_path, monkeypatch, "second", [{"n": 2}, {"n": 3}])
+    assert worker.forward(socket_path, ["shim"]) == 0
+
+    assert read_lines(first / "metrics.json") == [
+        {"name": "run", "set": 1, "labels": {"n": "1"}}
+    ]
+    assert read_lines(second / "metrics.json") == [
+        {"name": "run", "set": 2, "labels": {"n": "2"}},
+        {"name": "run", "set": 3, "labels": {"n": "3"}},
+    ]
+
+
+def test_hook_failure_does_not_stop_worker(serve, tmp_path, monkeypatch, capsys):
+    def main(ctx):
+        if ctx.binding_context["fail"]:
+            raise RuntimeError("hook failed")
+        ctx.metrics.collect({"name": "ok", "set": 1})
+
+    socket_path = serve(main)
+
+    invocation_env(tmp_path, monkeypatch, "failed", [{"fail": True}])
+    assert worker.forward(socket_path, ["shim"]) == 1
+    assert "RuntimeError: hook failed" in capsys.readouterr().err
+
+    directory = invocation_env(tmp_path, monkeypatch, "succeeded", [{"fail": False}])
+    assert worker.forward(socket_path, ["shim"]) == 0
+    assert read_lines(directory / "metrics.json") == [{"name": "ok", "set": 1}]
+
+
+def test_missing_worker(tmp_path, capsys):
+    assert worker.forward(str(tmp_path / "missing.sock"), ["shim"]) == 1
+    assert "Hook worker is not available" in capsys.readouterr().err